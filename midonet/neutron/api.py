@@ -51,16 +51,33 @@ class AdRouteHandlerMixin(object):
 @util.generate_methods(LIST, SHOW, UPDATE, DELETE)
 class HostHandlerMixin(host.HostPluginBase):
     """The mixin of the request handler for the hosts."""
+    CACHE_TTL = 5
+    CLIENT_METHODS = {LIST: 'get_hosts', SHOW: 'get_host'}
+
+
+@util.generate_methods(LIST)
+class HostInterfaceHandlerMixin(host.HostInterfacePluginBase):
+    """The mixin of the request handler for the host interfaces."""
+    ALIAS = 'host_interface'
+    PARENT = HostHandlerMixin.ALIAS
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class BridgeHandlerMixin(bridge.BridgePluginBase):
     """The mixin of the request handler for the bridges."""
+    FILTER_PARAMS = {'tenant_id': 'tenant_id'}
+    CLIENT_METHODS = {LIST: 'get_bridges', SHOW: 'get_bridge',
+                      CREATE: 'create_bridge', UPDATE: 'update_bridge',
+                      DELETE: 'delete_bridge'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class ChainHandlerMixin(chain_rule.ChainPluginBase):
     """The mixin of the request handler for the chains."""
+    FILTER_PARAMS = {'tenant_id': 'tenant_id'}
+    CLIENT_METHODS = {LIST: 'get_chains', SHOW: 'get_chain',
+                      CREATE: 'create_chain', UPDATE: 'update_chain',
+                      DELETE: 'delete_chain'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, DELETE)
@@ -71,6 +88,9 @@ class RuleHandlerMixin(chain_rule.RulePluginBase):
 @util.generate_methods(LIST, SHOW, CREATE, DELETE)
 class IpAddrGroupHandlerMixin(ip_addr_group.IpAddrGroupPluginBase):
     ALIAS = 'ip_addr_group'
+    CLIENT_METHODS = {LIST: 'get_ipaddr_groups', SHOW: 'get_ipaddr_group',
+                      CREATE: 'create_ipaddr_group',
+                      DELETE: 'delete_ipaddr_group'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, DELETE)
@@ -81,18 +101,25 @@ class IpAddrGrouAddrHandlerMixin(ip_addr_group.IpAddrGroupAddrPluginBase):
 @util.generate_methods(LIST, SHOW, UPDATE, DELETE)
 class LicenseHandlerMixin(license.LicensePluginBase):
     """The mixin of the request handler for the licenses."""
+    CACHE_TTL = 60
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class PortHandlerMixin(port.PortPluginBase):
     """The mixin of the request handler for the ports."""
     ALIAS = 'midonet_port'
+    CACHE_TTL = 5
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class PortGroupHandlerMixin(port_group.PortGroupPluginBase):
     """The mixin of the request handler for the port groups."""
     ALIAS = 'port_group'
+    FILTER_PARAMS = {'tenant_id': 'tenant_id'}
+    CLIENT_METHODS = {LIST: 'get_port_groups', SHOW: 'get_port_group',
+                      CREATE: 'create_port_group',
+                      UPDATE: 'update_port_group',
+                      DELETE: 'delete_port_group'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, DELETE)
@@ -105,12 +132,16 @@ class PortGroupPortHandlerMixin(port_group.PortGroupPortPluginBase):
 class RouterHandlerMixin(router.RouterPluginBase):
     """The mixin of the request handler for the routers."""
     ALIAS = 'midonet_router'
+    FILTER_PARAMS = {'tenant_id': 'tenant_id'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class RoutingTableHandlerMixin(routing_table.RoutingTablePluginBase):
     """The mixin of the request handler for the routing  tables."""
     ALIAS = 'routing_table'
+    CACHE_TTL = 5
+    CLIENT_METHODS = {LIST: 'get_routes', SHOW: 'get_route',
+                      CREATE: 'create_route', DELETE: 'delete_route'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
@@ -129,17 +160,24 @@ class SubnetDhcpHostHandlerMixin(subnet.SubnetDhcpHostPluginBase):
 @util.generate_methods(SHOW, UPDATE)
 class SystemHandlerMixin(system.SystemPluginBase):
     """The mixin of the request handler for the system."""
+    CACHE_TTL = 5
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class TunnelzoneHandlerMixin(tunnelzone.TunnelzonePluginBase):
     """The mixin of the request handler for the tunnel zones."""
+    CACHE_TTL = 10
+    CLIENT_METHODS = {LIST: 'get_tunnel_zones', SHOW: 'get_tunnel_zone',
+                      CREATE: 'create_tunnel_zone',
+                      UPDATE: 'update_tunnel_zone',
+                      DELETE: 'delete_tunnel_zone'}
 
 
 @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
 class TunnelzonehostHandlerMixin(tunnelzone.TunnelzonehostPluginBase):
     """The mixin of the request handler for the tunnel zone hosts."""
     PARENT = TunnelzoneHandlerMixin.ALIAS
+    CACHE_TTL = 10
 
 
 class MidoNetApiMixin(AdRouteHandlerMixin,
@@ -148,6 +186,7 @@ class MidoNetApiMixin(AdRouteHandlerMixin,
                       ChainHandlerMixin,
                       RuleHandlerMixin,
                       HostHandlerMixin,
+                      HostInterfaceHandlerMixin,
                       IpAddrGroupHandlerMixin,
                       IpAddrGrouAddrHandlerMixin,
                       LicenseHandlerMixin,
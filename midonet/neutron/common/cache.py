@@ -0,0 +1,186 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import functools
+import time
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+cfg.CONF.register_opts([cfg.IntOpt('api_cache_size', default=16 * 2 ** 20,
+                                   help=_('Maximum number of bytes of '
+                                          'MidoNet API responses cached by '
+                                          'each neutron-server process')),
+                        cfg.DictOpt('api_cache_ttl', default={},
+                                    help=_('Seconds the responses for each '
+                                           'MidoNet resource are cached, '
+                                           'as alias:seconds pairs, '
+                                           'overriding the default of the '
+                                           'resource.  0 disables the '
+                                           'cache for the resource'))],
+                       'MIDONET')
+
+
+class TTLCache(object):
+    """LRU cache of JSON-serializable values with a time to live.
+
+    The values are stored serialized: this bounds the cache by the size of
+    the serialized values, and every hit returns a copy the caller may
+    modify.  Each value is tagged with the resource it describes, and
+    invalidating a tag drops all its values at once.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._generations = collections.defaultdict(int)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_max_bytes(self):
+        return self.max_bytes or cfg.CONF.MIDONET.api_cache_size
+
+    def _pop(self, key):
+        _expires, value = self._entries.pop(key)
+        self.size -= len(value)
+
+    def get(self, tag, key):
+        """Return whether a live value is cached, and the value."""
+        key = (tag, self._generations[tag], key)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return False, None
+        # Move the entry to the most recently used end.
+        del self._entries[key]
+        self._entries[key] = entry
+        self.hits += 1
+        return True, jsonutils.loads(entry[1])
+
+    def get_generation(self, tag):
+        """Return the generation of a tag, bumped by each invalidation."""
+        return self._generations[tag]
+
+    def set(self, tag, key, value, ttl, generation=None):
+        """Cache a value with a tag.
+
+        A value read from the backend is only cached if the tag is still
+        at the generation read before the backend call, since an
+        invalidation made meanwhile may not be reflected by the value.
+        """
+        if generation is None:
+            generation = self._generations[tag]
+        elif generation != self._generations[tag]:
+            return
+        key = (tag, generation, key)
+        value = jsonutils.dumps(value)
+        max_bytes = self._get_max_bytes()
+        if len(value) > max_bytes:
+            return
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = (time.time() + ttl, value)
+        self.size += len(value)
+        while self.size > max_bytes:
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, tag):
+        """Drop every value cached with a tag."""
+        # The values of former generations are no longer reachable and
+        # age out of the LRU order.
+        self._generations[tag] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._generations.clear()
+        self.size = 0
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.size}
+
+
+# The cache shared by all the MidoNet API resources of a process.
+API_CACHE = TTLCache()
+
+
+def get_ttl(alias, default=0):
+    """Return the number of seconds the responses for a resource live."""
+    ttl = cfg.CONF.MIDONET.api_cache_ttl.get(alias)
+    return default if ttl is None else int(ttl)
+
+
+def cached(alias, default_ttl=0):
+    """Decorator caching the responses of a read method of a resource.
+
+    The responses are cached per tenant and arguments.  The method is
+    called directly when the TTL of the resource is 0, and its response is
+    not cached when a write invalidates the resource during the call.
+    """
+    def internal_wrapper(func):
+        @functools.wraps(func)
+        def read(self, context, *args, **kwargs):
+            ttl = get_ttl(alias, default_ttl)
+            if ttl <= 0:
+                return func(self, context, *args, **kwargs)
+            key = jsonutils.dumps([func.__name__,
+                                   getattr(context, 'tenant_id', None),
+                                   args, sorted(kwargs.items())])
+            generation = API_CACHE.get_generation(alias)
+            found, value = API_CACHE.get(alias, key)
+            if found:
+                return value
+            value = func(self, context, *args, **kwargs)
+            API_CACHE.set(alias, key, value, ttl, generation)
+            return value
+        return read
+    return internal_wrapper
+
+
+def invalidating(*aliases):
+    """Decorator invalidating the cached responses of resources on writes.
+
+    The responses are invalidated once the write is done, whether it
+    succeeded or not.
+    """
+    def internal_wrapper(func):
+        @functools.wraps(func)
+        def write(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                for alias in aliases:
+                    API_CACHE.invalidate(alias)
+        return write
+    return internal_wrapper
+
+
+def get_cache_stats():
+    """Return the hit, miss and eviction counts and size of the cache."""
+    return API_CACHE.get_stats()
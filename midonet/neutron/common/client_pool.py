@@ -0,0 +1,405 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import random
+import socket
+import time
+
+import eventlet
+from oslo_config import cfg
+from six.moves.urllib import error as urlerror
+from six.moves.urllib import request as urlrequest
+from webob import exc as w_exc
+
+from midonetclient import exc
+from neutron import i18n
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+
+
+LOG = logging.getLogger(__name__)
+_LE = i18n._LE
+_LI = i18n._LI
+_LW = i18n._LW
+
+cfg.CONF.register_opts([cfg.ListOpt('midonet_uris', default=[],
+                                    help=_('MidoNet API endpoints to spread '
+                                           'the calls over.  Defaults to '
+                                           'midonet_uri')),
+                        cfg.IntOpt('api_eject_threshold', default=3,
+                                   help=_('Number of consecutive failed '
+                                          'calls or health checks after '
+                                          'which a MidoNet API endpoint '
+                                          'stops receiving calls')),
+                        cfg.IntOpt('api_health_check_interval', default=10,
+                                   help=_('Seconds between two health '
+                                          'checks of the MidoNet API '
+                                          'endpoints, 0 to disable them')),
+                        cfg.IntOpt('api_health_check_timeout', default=5,
+                                   help=_('Seconds to wait for a MidoNet API '
+                                          'endpoint to answer a health '
+                                          'check')),
+                        cfg.IntOpt('api_breaker_threshold', default=5,
+                                   help=_('Number of consecutive failed '
+                                          'MidoNet API calls after which '
+                                          'the calls fail fast, without '
+                                          'reaching the API')),
+                        cfg.IntOpt('api_breaker_reset_timeout', default=30,
+                                   help=_('Seconds after which a single '
+                                          'call is let through to test '
+                                          'whether the MidoNet API has '
+                                          'recovered')),
+                        cfg.IntOpt('api_retry_attempts', default=3,
+                                   help=_('Number of times an idempotent '
+                                          'MidoNet API call is tried when '
+                                          'the API cannot be reached')),
+                        cfg.FloatOpt('api_retry_base_delay', default=0.5,
+                                     help=_('Upper bound in seconds of the '
+                                            'delay before the first retry '
+                                            'of a MidoNet API call, doubled '
+                                            'at every retry')),
+                        cfg.FloatOpt('api_retry_max_delay', default=5.0,
+                                     help=_('Maximum delay in seconds '
+                                            'before a retry of a MidoNet '
+                                            'API call'))],
+                       'MIDONET')
+
+# The errors that show an endpoint is unreachable or broken, as opposed to
+# a rejected request.
+ENDPOINT_ERRORS = (exc.MidoApiConnectionError, socket.error,
+                   w_exc.HTTPServerError)
+
+# The MidoNet API client methods that can safely be called again after a
+# failure: they read a resource, or replace or delete it as a whole.
+IDEMPOTENT_PREFIXES = ('get_', 'update_', 'delete_')
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the MidoNet API while it is unhealthy."""
+
+
+def get_retry_delay(attempt):
+    """Return the delay before retrying a call, with full jitter.
+
+    :param attempt: The number of attempts made so far.
+    """
+    conf = cfg.CONF.MIDONET
+    ceiling = min(conf.api_retry_max_delay,
+                  conf.api_retry_base_delay * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker(object):
+    """Stops the calls to a MidoNet API endpoint while it keeps failing.
+
+    The breaker opens after api_breaker_threshold consecutive failures, and
+    every call then fails at once with CircuitOpenError.  After
+    api_breaker_reset_timeout seconds it becomes half-open, and lets a single
+    call through: the breaker closes if the call succeeds and opens again
+    otherwise.
+    """
+
+    def __init__(self, uri=None):
+        self.uri = uri
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now."""
+        if self.state == BREAKER_OPEN:
+            reset_timeout = cfg.CONF.MIDONET.api_breaker_reset_timeout
+            if time.time() - self.opened_at < reset_timeout:
+                raise CircuitOpenError(_("MidoNet API calls to %(uri)s "
+                                         "suspended after %(failures)d "
+                                         "consecutive failures") %
+                                       {'uri': self.uri,
+                                        'failures': self.failures})
+            self.state = BREAKER_HALF_OPEN
+            LOG.info(_LI("Probing MidoNet API endpoint %s"), self.uri)
+        if self.state == BREAKER_HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(_("MidoNet API probe in progress"))
+            self._probing = True
+
+    def record_success(self):
+        self._probing = False
+        self.failures = 0
+        if self.state != BREAKER_CLOSED:
+            self.state = BREAKER_CLOSED
+            LOG.info(_LI("MidoNet API calls to %s resumed"), self.uri)
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN or (
+                self.state == BREAKER_CLOSED and
+                self.failures >= cfg.CONF.MIDONET.api_breaker_threshold):
+            self.state = BREAKER_OPEN
+            self.opened_at = time.time()
+            LOG.error(_LE("Suspending the MidoNet API calls to %(uri)s "
+                          "after %(failures)d consecutive failures"),
+                      {'uri': self.uri, 'failures': self.failures})
+
+
+class CallStats(object):
+    """Latency statistics of the calls to one MidoNet API client method."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed, error=False):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if error:
+            self.errors += 1
+
+    def to_dict(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'avg': self.total / self.count if self.count else 0.0,
+                'max': self.max}
+
+
+class TimedClient(object):
+    """Records the latency of the calls to a MidoNet API client.
+
+    This proxy has the same methods as the client, and is shared by every
+    green thread as the client is: python-midonetclient keeps a single
+    login token per process and opens a connection for every request, so
+    a client holds no state a call could contend on.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._stats = collections.defaultdict(CallStats)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            method = getattr(self._client, name)
+            start = time.time()
+            error = True
+            try:
+                result = method(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                elapsed = time.time() - start
+                self._stats[name].add(elapsed, error=error)
+                LOG.debug("MidoNet API call %(name)s took %(elapsed).3fs",
+                          {'name': name, 'elapsed': elapsed})
+        call.__name__ = name
+        return call
+
+    def get_stats(self):
+        """Return the latency statistics of each method called so far.
+
+        :returns: A dict of method names to dicts with the number of calls
+                  (count) and failed calls (errors), and the average (avg)
+                  and maximum (max) latency in seconds.
+        """
+        return dict((name, stats.to_dict())
+                    for name, stats in self._stats.items())
+
+
+def probe_endpoint(uri):
+    """Return whether a MidoNet API endpoint answers HTTP requests.
+
+    Any HTTP response, including an error status, shows the endpoint is up.
+    """
+    try:
+        urlrequest.urlopen(uri,
+                           timeout=cfg.CONF.MIDONET.api_health_check_timeout)
+    except urlerror.HTTPError:
+        return True
+    except (urlerror.URLError, socket.error):
+        return False
+    return True
+
+
+class MidonetEndpoint(object):
+    """A MidoNet API endpoint, its client and its circuit breaker."""
+
+    def __init__(self, uri, create_client):
+        self.uri = uri
+        self.client = TimedClient(create_client(uri))
+        self.breaker = CircuitBreaker(uri)
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected = False
+
+    def record_failure(self):
+        self.failures += 1
+        if (not self.ejected and
+                self.failures >= cfg.CONF.MIDONET.api_eject_threshold):
+            self.ejected = True
+            LOG.error(_LE("Ejecting MidoNet API endpoint %s"), self.uri)
+
+    def record_success(self):
+        self.failures = 0
+        if self.ejected:
+            self.ejected = False
+            LOG.info(_LI("MidoNet API endpoint %s is back"), self.uri)
+
+
+class MidonetEndpointBalancer(object):
+    """Spreads the MidoNet API calls over several API endpoints.
+
+    Every call goes to the endpoint with the fewest calls in flight, the
+    endpoints being taken in turn when they tie.  An endpoint is ejected
+    after api_eject_threshold consecutive calls failed because it was
+    unreachable or broken, and only gets calls again once a health check
+    finds it answering.  If every endpoint is ejected, the calls are
+    spread over all of them rather than failing outright.
+
+    Every endpoint has a circuit breaker, and the calls skip the endpoints
+    whose breaker is open, failing fast once every breaker is.  Idempotent
+    calls failing on an endpoint are
+    retried after a jittered exponential backoff, on the least loaded
+    endpoint at that time.  A retried delete finding the resource gone
+    succeeds, since the failed attempt may have deleted it.
+    """
+
+    def __init__(self, uris, create_client, probe=None):
+        """Initialize the balancer.
+
+        :param uris: The URIs of the MidoNet API endpoints.
+        :param create_client: Called with an endpoint URI to create a
+                              client of it.
+        :param probe: Called with an endpoint URI to health check it.
+                      Defaults to probe_endpoint.
+        """
+        self.endpoints = [MidonetEndpoint(uri, create_client)
+                          for uri in uris]
+        self._probe = probe or probe_endpoint
+        self._next = 0
+        self._health_check = None
+
+    def _choose_endpoint(self):
+        """Return the least loaded endpoint letting a call through.
+
+        :raises: CircuitOpenError if the breaker of every endpoint is open.
+        """
+        endpoints = ([e for e in self.endpoints if not e.ejected] or
+                     self.endpoints)
+        self._next = (self._next + 1) % len(endpoints)
+        rotated = endpoints[self._next:] + endpoints[:self._next]
+        # The sort is stable, so the endpoints still take turns on ties.
+        for endpoint in sorted(rotated, key=lambda e: e.outstanding):
+            try:
+                endpoint.breaker.before_call()
+            except CircuitOpenError as ex:
+                error = ex
+                continue
+            return endpoint
+        raise error
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name.startswith(IDEMPOTENT_PREFIXES):
+            attempts = max(cfg.CONF.MIDONET.api_retry_attempts, 1)
+        else:
+            attempts = 1
+
+        def call(*args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    return self._call_endpoint(name, *args, **kwargs)
+                except ENDPOINT_ERRORS:
+                    if attempt == attempts:
+                        raise
+                except w_exc.HTTPNotFound:
+                    # A failed attempt may have deleted the resource before
+                    # its response was lost.
+                    if attempt > 1 and name.startswith('delete_'):
+                        LOG.info(_LI("MidoNet API call %s found the "
+                                     "resource already deleted"), name)
+                        return None
+                    raise
+                eventlet.sleep(get_retry_delay(attempt))
+        call.__name__ = name
+        return call
+
+    def _call_endpoint(self, name, *args, **kwargs):
+        endpoint = self._choose_endpoint()
+        endpoint.outstanding += 1
+        try:
+            result = getattr(endpoint.client, name)(*args, **kwargs)
+        except ENDPOINT_ERRORS as ex:
+            LOG.warn(_LW("MidoNet API call %(name)s to %(uri)s failed: "
+                         "%(err)s"),
+                     {'name': name, 'uri': endpoint.uri, 'err': ex})
+            endpoint.record_failure()
+            endpoint.breaker.record_failure()
+            raise
+        except Exception:
+            # The API answered, if only to reject the request.
+            endpoint.breaker.record_success()
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        endpoint.record_success()
+        endpoint.breaker.record_success()
+        return result
+
+    def check_endpoints(self):
+        """Health check every endpoint."""
+        for endpoint in self.endpoints:
+            if self._probe(endpoint.uri):
+                endpoint.record_success()
+            else:
+                endpoint.record_failure()
+
+    def _check_endpoints(self):
+        try:
+            self.check_endpoints()
+        except Exception:
+            LOG.exception(_LE("Failed to check the MidoNet API endpoints"))
+
+    def start_health_check(self):
+        interval = cfg.CONF.MIDONET.api_health_check_interval
+        if interval <= 0 or self._health_check is not None:
+            return
+        self._health_check = loopingcall.FixedIntervalLoopingCall(
+            self._check_endpoints)
+        self._health_check.start(interval=interval)
+
+    def stop_health_check(self):
+        if self._health_check is not None:
+            self._health_check.stop()
+            self._health_check = None
+
+    def get_stats(self):
+        """Return the state and call statistics of each endpoint."""
+        return dict((e.uri, {'ejected': e.ejected,
+                             'breaker': e.breaker.state,
+                             'outstanding': e.outstanding,
+                             'calls': e.client.get_stats()})
+                    for e in self.endpoints)
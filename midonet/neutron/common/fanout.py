@@ -0,0 +1,63 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+
+import eventlet
+from oslo_config import cfg
+import six
+
+
+cfg.CONF.register_opts([cfg.IntOpt('api_fanout_concurrency', default=8,
+                                   help=_('Maximum number of independent '
+                                          'MidoNet API calls made '
+                                          'concurrently for a single '
+                                          'request'))],
+                       'MIDONET')
+
+
+def fan_out(func, items, concurrency=None):
+    """Call a function on every item concurrently and wait for all calls.
+
+    The calls run in green threads of a pool of their own, so a single
+    request never has more than api_fanout_concurrency calls in flight,
+    whatever the other requests do.
+
+    :param func: Called with each item.  The calls must not depend on each
+                 other, nor share a DB session.
+    :param concurrency: Maximum number of calls in flight.  Defaults to
+                        api_fanout_concurrency.
+    :returns: A list of (result, exc_info) pairs in the order of the items,
+              exc_info being None for the calls that succeeded.
+    """
+    def call(item):
+        try:
+            return func(item), None
+        except Exception:
+            return None, sys.exc_info()
+
+    items = list(items)
+    if len(items) <= 1:
+        return [call(item) for item in items]
+    concurrency = concurrency or cfg.CONF.MIDONET.api_fanout_concurrency
+    pool = eventlet.GreenPool(max(min(concurrency, len(items)), 1))
+    return list(pool.imap(call, items))
+
+
+def raise_first_error(results):
+    """Re-raise the first error among the results of fan_out, if any."""
+    for _result, exc_info in results:
+        if exc_info is not None:
+            six.reraise(*exc_info)
@@ -0,0 +1,220 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import functools
+
+from oslo_serialization import jsonutils
+import six
+
+from midonet.neutron.common import cache
+from midonet.neutron.common import fanout
+
+# The fields fetched with a resource to expand its sub-resources.
+EXPANSION_FIELDS = ('id',)
+
+
+def split_filters(filters, params):
+    """Split the Neutron filters into MidoNet API query parameters and the
+    filters left to apply in-process.
+
+    A filter is pushed down when its attribute has a query parameter in
+    params and it allows a single value, since the MidoNet API matches a
+    parameter against one value only.
+
+    :returns: The query parameters and the remaining filters.
+    """
+    query = {}
+    remaining = {}
+    for key, values in six.iteritems(filters or {}):
+        if key in params and len(values) == 1:
+            query[params[key]] = values[0]
+        else:
+            remaining[key] = values
+    return query, remaining
+
+
+def _make_check(key, values):
+    values = list(values)
+    try:
+        matches = frozenset(values)
+    except TypeError:
+        matches = values
+    # The values given in a URL are strings unless the attribute converts
+    # them, so an item value also matches by its string form.
+    texts = frozenset(six.text_type(value) for value in values)
+
+    def check(item):
+        value = item.get(key)
+        try:
+            if value in matches:
+                return True
+        except TypeError:
+            return False
+        return value is not None and six.text_type(value) in texts
+    return check
+
+
+def compile_filters(filters):
+    """Return a predicate matching the items passing all the filters.
+
+    An item passes a filter when its value for the attribute is one of the
+    values of the filter, as in the Neutron DB plugins; the items missing
+    the attribute never pass it.
+
+    :returns: The predicate, or None when there is nothing to filter.
+    """
+    if not filters:
+        return None
+    checks = [_make_check(key, values)
+              for key, values in six.iteritems(filters)]
+
+    def match(item):
+        for check in checks:
+            if not check(item):
+                return False
+        return True
+    return match
+
+
+def project(item, fields, expanded=()):
+    """Return the item limited to the fields.
+
+    Without fields, the item is returned whole but for the expanded
+    fields, which are only returned when they are listed in fields.
+    """
+    if fields:
+        return dict((key, value) for key, value in six.iteritems(item)
+                    if key in fields)
+    if not any(key in item for key in expanded):
+        return item
+    return dict((key, value) for key, value in six.iteritems(item)
+                if key not in expanded)
+
+
+def get_fetched_fields(fields, extra=(), expanded=()):
+    """Return the fields to fetch for a projection on fields.
+
+    The extra fields, such as the filtered and sorted ones, are fetched
+    too so that they can be applied in-process.  The expanded fields are
+    left out, but the fields their expansion needs are added.
+    """
+    if not fields:
+        return None
+    names = list(fields) + list(extra)
+    if any(field in fields for field in expanded):
+        names.extend(EXPANSION_FIELDS)
+    fetched = []
+    for name in names:
+        if name not in fetched and name not in expanded:
+            fetched.append(name)
+    return fetched
+
+
+def expand(plugin, context, items, fields, expanded, ttl=0):
+    """Fill in the expanded fields of the items listed in fields.
+
+    The sub-resources of an item are read with the method of the plugin
+    named in expanded for the field, called with the ID of the item as the
+    keyword argument named there too.  They are cached by the ID of the
+    item for ttl seconds, or the api_cache_ttl of the field, so they may be
+    as old as that.  The reads missing the cache are made concurrently.
+    """
+    for field, (method, id_arg) in six.iteritems(expanded):
+        if not fields or field not in fields:
+            continue
+        field_ttl = cache.get_ttl(field, ttl)
+        get_sub_resources = getattr(plugin, method)
+        generation = cache.API_CACHE.get_generation(field)
+        missed = []
+        for item in items:
+            key = jsonutils.dumps(item.get('id'))
+            found, value = cache.API_CACHE.get(field, key)
+            if found:
+                item[field] = value
+            else:
+                missed.append((key, item))
+
+        results = fanout.fan_out(
+            lambda miss: get_sub_resources(
+                context, **{id_arg: miss[1].get('id')}),
+            missed)
+        fanout.raise_first_error(results)
+        for (key, item), (value, _exc_info) in zip(missed, results):
+            if field_ttl > 0:
+                cache.API_CACHE.set(field, key, value, field_ttl,
+                                    generation)
+            item[field] = value
+
+
+def pushed_down_list(params=None, expanded=None, expansion_ttl=0):
+    """Decorator pushing the arguments of a list call down to MidoNet
+
+    The method is called with the filters supported as MidoNet API query
+    parameters in place of the Neutron filters, and with the fields to
+    fetch.  The other filters are applied to the result with a compiled
+    predicate, and the remaining items are expanded and projected on the
+    requested fields.
+
+    :param params: The MidoNet API query parameter of each filterable
+                   attribute.
+    :param expanded: The plugin method reading the sub-resources of an
+                     item and the name of its argument taking the ID of
+                     the item, by field holding them.  These fields are
+                     only read and returned when they are listed in
+                     fields.
+    :param expansion_ttl: Seconds the sub-resources of an item are cached.
+    """
+    params = params or {}
+    expanded = expanded or {}
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, context, *args, **kwargs):
+            fields = kwargs.pop('fields', None)
+            query, remaining = split_filters(kwargs.pop('filters', None),
+                                             params)
+            kwargs['filters'] = query
+            kwargs['fields'] = get_fetched_fields(
+                fields, ['id'] + list(remaining), expanded)
+            items = func(self, context, *args, **kwargs) or []
+            match = compile_filters(remaining)
+            if match is not None:
+                items = [item for item in items if match(item)]
+            expand(self, context, items, fields, expanded, expansion_ttl)
+            return [project(item, fields, expanded) for item in items]
+        return wrapper
+    return decorator
+
+
+def pushed_down_show(expanded, expansion_ttl=0):
+    """Decorator expanding the resource returned by a method
+
+    The method is called with the fields to fetch, and its result is
+    expanded and projected on the requested fields as by pushed_down_list.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, context, *args, **kwargs):
+            fields = kwargs.get('fields')
+            if fields:
+                kwargs['fields'] = get_fetched_fields(fields, ['id'],
+                                                      expanded)
+            item = func(self, context, *args, **kwargs)
+            if item is None:
+                return item
+            expand(self, context, [item], fields, expanded, expansion_ttl)
+            return project(item, fields, expanded)
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import functools
+import sys
+
+from eventlet import event
+from oslo_serialization import jsonutils
+import six
+
+
+class SingleFlight(object):
+    """Shares one backend call among the identical calls made concurrently.
+
+    The first call for a key is made, and the calls for the same key made
+    while it is in flight wait for its outcome instead of calling the
+    backend again.  Each waiter gets a copy of the result, or the error.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.shared = 0
+
+    def call(self, key, func, *args, **kwargs):
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self.shared += 1
+            flight['waiters'] += 1
+            result, exc_info = flight['event'].wait()
+            if exc_info is not None:
+                six.reraise(*exc_info)
+            return copy.deepcopy(result)
+
+        flight = self._in_flight[key] = {'event': event.Event(),
+                                         'waiters': 0}
+        self.calls += 1
+        result, exc_info = None, None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception:
+            exc_info = sys.exc_info()
+            raise
+        finally:
+            del self._in_flight[key]
+            if flight['waiters']:
+                # The caller may modify the result before the waiters run.
+                flight['event'].send((copy.deepcopy(result), exc_info))
+
+    def get_stats(self):
+        return {'calls': self.calls, 'shared': self.shared}
+
+
+# The calls in flight to the MidoNet API resources of a process.
+API_CALLS = SingleFlight()
+
+
+def coalesced(alias):
+    """Decorator coalescing the concurrent identical calls of a method."""
+    def internal_wrapper(func):
+        @functools.wraps(func)
+        def read(self, context, *args, **kwargs):
+            key = jsonutils.dumps([alias, func.__name__,
+                                   getattr(context, 'tenant_id', None),
+                                   args, sorted(kwargs.items())])
+            return API_CALLS.call(key, func, self, context, *args, **kwargs)
+        return read
+    return internal_wrapper
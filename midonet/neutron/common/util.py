@@ -14,12 +14,23 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
+import random
 import re
-import time
+
+import eventlet
+from oslo_config import cfg
+from oslo_db import exception as db_exc
 from webob import exc as w_exc
 
 from midonetclient import exc
 
+from midonet.neutron.common import cache
+from midonet.neutron.common import client_pool
+from midonet.neutron.common import pushdown
+from midonet.neutron.common import singleflight
+from midonet.neutron.db import task
 from neutron.api.v2 import base
 from neutron.common import exceptions as n_exc
 from neutron import i18n
@@ -28,46 +39,104 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 PLURAL_NAME_MAP = {}
+_LE = i18n._LE
 _LW = i18n._LW
 
+cfg.CONF.register_opts([cfg.IntOpt('db_retry_attempts', default=5,
+                                   help=_('Number of times a method is '
+                                          'tried when its transaction '
+                                          'deadlocks or loses the DB '
+                                          'connection')),
+                        cfg.FloatOpt('db_retry_base_delay', default=0.1,
+                                     help=_('Upper bound in seconds of the '
+                                            'delay before the first retry '
+                                            'of a DB transaction, doubled '
+                                            'at every retry')),
+                        cfg.FloatOpt('db_retry_max_delay', default=2.0,
+                                     help=_('Maximum delay in seconds '
+                                            'before a retry of a DB '
+                                            'transaction'))],
+                       'MIDONET')
+
+# The DB errors after which a transaction may succeed when run again.
+RETRIABLE_DB_ERRORS = (db_exc.DBDeadlock, db_exc.DBConnectionError,
+                       task.RevisionConflict)
+
+# The number of retries and of calls given up, by method name.
+DB_RETRY_COUNTS = collections.defaultdict(
+    lambda: {'retries': 0, 'failures': 0})
+
 
 def handle_api_error(fn):
     """Wrapper for methods that throws custom exceptions."""
+    @functools.wraps(fn)
     def wrapped(*args, **kwargs):
         try:
             return fn(*args, **kwargs)
-        except (w_exc.HTTPException, exc.MidoApiConnectionError) as ex:
+        except (w_exc.HTTPException, exc.MidoApiConnectionError,
+                client_pool.CircuitOpenError) as ex:
             raise MidonetApiException(msg=ex)
     return wrapped
 
 
-def retry_on_error(attempts, delay, error_cls):
-    """Decorator for error handling retry logic
+def _in_transaction(args, kwargs):
+    """Return whether a plugin method is called within a transaction."""
+    for arg in list(args[:2]) + [kwargs.get('context')]:
+        session = getattr(arg, 'session', None)
+        if session is not None:
+            return session.is_active
+    return False
 
-    This decorator retries the function specified number of times with
-    specified delay between each attempt, for every exception thrown specified
-    in error_cls.  If case the retry fails in all attempts, the error_cls
-    exception object is thrown.
 
-    :param attempts: Number of retry attempts
-    :param delay: Delay in seconds between attempts
-    :param error_cls: The exception class that triggers a retry attempt
+def retry_on_db_error(func):
+    """Decorator running a method again when its transaction deadlocks
+
+    The method is tried up to db_retry_attempts times as long as it raises
+    DBDeadlock, DBConnectionError or a RevisionConflict from a concurrent
+    write; any other error is raised at once.
+    Concurrent requests often deadlock in the DB because the eventlet green
+    threads do not yield properly while they block inside a transaction.
+    The delay before every retry is drawn at random below an exponentially
+    growing bound, so that the requests which deadlocked together do not
+    collide again, and is spent in a green sleep letting the other requests
+    proceed.  The retries are counted in DB_RETRY_COUNTS.
+    A method called within a transaction of its caller is not retried: the
+    failed transaction is the caller's, and only the caller can run it
+    again.
     """
-    def internal_wrapper(func):
-        def retry(*args, **kwargs):
-            err = None
-            for i in range(attempts):
-                try:
-                    return func(*args, **kwargs)
-                except error_cls as exc:
-                    LOG.warn(_LW('Retrying because of error: %r'), exc)
-                    time.sleep(delay)
-                    err = exc
-            # err should always be set to a valid exception object
-            assert isinstance(err, error_cls)
-            raise err
-        return retry
-    return internal_wrapper
+    @functools.wraps(func)
+    def retry(*args, **kwargs):
+        if _in_transaction(args, kwargs):
+            return func(*args, **kwargs)
+        conf = cfg.CONF.MIDONET
+        counts = DB_RETRY_COUNTS[func.__name__]
+        attempts = max(conf.db_retry_attempts, 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except RETRIABLE_DB_ERRORS as ex:
+                if attempt == attempts:
+                    counts['failures'] += 1
+                    LOG.error(_LE('Giving up %(name)s after %(attempts)d '
+                                  'attempts: %(err)r'),
+                              {'name': func.__name__, 'attempts': attempts,
+                               'err': ex})
+                    raise
+                counts['retries'] += 1
+                delay = random.uniform(0, min(conf.db_retry_max_delay,
+                                              conf.db_retry_base_delay *
+                                              2 ** (attempt - 1)))
+                LOG.warn(_LW('Retrying %(name)s in %(delay).2fs because of '
+                             'error: %(err)r'),
+                         {'name': func.__name__, 'delay': delay, 'err': ex})
+                eventlet.sleep(delay)
+    return retry
+
+
+def get_db_retry_counts():
+    """Return the number of DB retries and failures of each method."""
+    return dict((name, dict(counts))
+                for name, counts in DB_RETRY_COUNTS.items())
 
 
 class MidonetApiException(n_exc.NeutronException):
@@ -78,10 +147,106 @@ class MidonetPluginException(n_exc.NeutronException):
     message = _("%(msg)s")
 
 
+def _make_request_path(cls, method, func, alias, parent):
+    """Wrap a method handling requests for a resource.
+
+    The responses of the read methods are cached for the CACHE_TTL seconds
+    of the class, and the writes invalidate them as well as the cached
+    responses for the parent resource.  The identical reads missing the
+    cache at the same time share a single call.
+    The list methods get the filters of the FILTER_PARAMS of the class as
+    MidoNet API query parameters, and the others are applied to the cached
+    list, which is then projected on the requested fields.  The API
+    controllers sort and page the lists themselves, since the MidoNet API
+    offers no paged list calls.  The fields in the
+    EXPANDED_FIELDS of the class hold sub-resources read by another method,
+    given with the name of its argument taking the parent ID: they are only
+    read, and cached for the EXPANSION_TTL of the class, when they are
+    listed in fields.
+    """
+    if method in (base.Controller.LIST, base.Controller.SHOW):
+        func = singleflight.coalesced(alias)(func)
+        func = cache.cached(alias, getattr(cls, 'CACHE_TTL', 0))(func)
+        expanded = getattr(cls, 'EXPANDED_FIELDS', None)
+        expansion_ttl = getattr(cls, 'EXPANSION_TTL', 0)
+        if method == base.Controller.LIST:
+            func = pushdown.pushed_down_list(
+                getattr(cls, 'FILTER_PARAMS', None), expanded,
+                expansion_ttl)(func)
+        elif expanded:
+            func = pushdown.pushed_down_show(expanded, expansion_ttl)(func)
+        return func
+    return cache.invalidating(*[a for a in (alias, parent) if a])(func)
+
+
+def _get_request_body(args, kwargs):
+    """Return the resource of the request body given to a write method.
+
+    The API controllers pass the body as a keyword argument named after
+    the resource, and the body holds the resource under that name too.
+    """
+    (body,) = list(args) + list(kwargs.values())
+    (resource,) = body.values()
+    return resource
+
+
+def _make_client_method(method, name, client_method):
+    """Make a generated method calling a MidoNet API client method.
+
+    The client methods take the arguments of the plugin methods but for
+    the context, and the resource itself instead of the request body, with
+    its ID for the updates.
+    """
+    if method == base.Controller.LIST:
+        def call(self, context, filters=None, fields=None, **kwargs):
+            return getattr(self.api_cli, client_method)(
+                filters=filters, fields=fields, **kwargs)
+    elif method == base.Controller.SHOW:
+        def call(self, context, id, fields=None):
+            return getattr(self.api_cli, client_method)(id, fields=fields)
+    elif method == base.Controller.CREATE:
+        def call(self, context, *args, **kwargs):
+            return getattr(self.api_cli, client_method)(
+                _get_request_body(args, kwargs))
+    elif method == base.Controller.UPDATE:
+        def call(self, context, id, *args, **kwargs):
+            resource = dict(_get_request_body(args, kwargs), id=id)
+            return getattr(self.api_cli, client_method)(resource)
+    else:
+        def call(self, context, id):
+            return getattr(self.api_cli, client_method)(id)
+    call.__name__ = name
+    return handle_api_error(call)
+
+
+def _make_child_method(func, parent):
+    """Make a generated method take the ID of the parent resource.
+
+    The API controllers pass it to the methods of a sub-resource as the
+    <parent>_id keyword argument, which the generated methods ignore.
+    """
+    parent_key = '%s_id' % parent
+
+    @functools.wraps(func)
+    def child_method(self, context, *args, **kwargs):
+        kwargs.pop(parent_key, None)
+        return func(self, context, *args, **kwargs)
+    return child_method
+
+
 def generate_methods(*methods):
     """Decorator for classes that represents which methods are required by the
     classes.
 
+    The methods generated for the operations in the CLIENT_METHODS of the
+    class call the MidoNet API client method named there, and the others
+    are stubs returning None.  The methods defined by the class, or
+    generated to call the client, are wrapped in the request path built
+    by _make_request_path; the stubs are left as they are, having no
+    response to cache or filter.  The methods generated for a
+    sub-resource, whose class sets PARENT, take the ID of the parent
+    resource as a keyword argument.
+
     :param methods: The list of methods to be generated automatically. They
                     must be some or one of 'list', 'show', 'create', 'update'
                     and 'delete'.
@@ -100,7 +265,8 @@ def generate_methods(*methods):
         pass
 
     @handle_api_error
-    def get_resources(self, context, filters=None, fields=None):
+    def get_resources(self, context, filters=None, fields=None, sorts=None,
+                      limit=None, marker=None, page_reverse=False):
         pass
 
     @handle_api_error
@@ -117,6 +283,18 @@ def generate_methods(*methods):
     required_methods = [method for method in methods
                         if method in ALLOWED_METHODS]
 
+    def _get_generated(cls, method, method_name, parent, stubs):
+        client_method = getattr(cls, 'CLIENT_METHODS', {}).get(method)
+        if client_method:
+            func = _make_client_method(method, method_name, client_method)
+        else:
+            func = AVAILABLE_METHOD_MAP[method]
+        if parent:
+            func = _make_child_method(func, parent)
+        if not client_method:
+            stubs.add(func)
+        return func
+
     def wrapper(cls):
         # Use the first capitalzed word as an alias.
         try:
@@ -129,6 +307,7 @@ def generate_methods(*methods):
         parent = getattr(cls, 'PARENT', None)
         if parent:
             alias = '%s_%s' % (parent, alias)
+        stubs = set()
         for method in required_methods:
             if method in [base.Controller.LIST, base.Controller.SHOW]:
                 if method == base.Controller.LIST:
@@ -144,12 +323,21 @@ def generate_methods(*methods):
                 abstract_methods = getattr(cls, '__abstractmethods__', None)
                 if abstract_methods is not None and (
                         method_name in abstract_methods):
-                    setattr(cls, method_name, AVAILABLE_METHOD_MAP[method])
+                    setattr(cls, method_name,
+                            _get_generated(cls, method, method_name,
+                                           parent, stubs))
                     implemented_method = frozenset([method_name])
                     abstract_methods = abstract_methods - implemented_method
                     setattr(cls, '__abstractmethods__', abstract_methods)
             except AttributeError:
-                setattr(cls, method_name, AVAILABLE_METHOD_MAP[method])
+                setattr(cls, method_name,
+                        _get_generated(cls, method, method_name, parent,
+                                       stubs))
+            # The inherited methods were wrapped with their own class.
+            func = cls.__dict__.get(method_name)
+            if func is not None and func not in stubs:
+                setattr(cls, method_name, _make_request_path(
+                    cls, method, func, alias, parent))
         return cls
 
     return wrapper
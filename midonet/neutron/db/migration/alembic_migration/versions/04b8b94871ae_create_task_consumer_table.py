@@ -0,0 +1,42 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""create task consumer table
+
+Revision ID: 04b8b94871ae
+Revises: 853f2f4d1854
+Create Date: 2015-03-16 10:21:47.318265
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '04b8b94871ae'
+down_revision = '853f2f4d1854'
+
+from alembic import op
+import sqlalchemy as sa
+
+TASK_CONSUMER_TABLE = 'midonet_task_consumers'
+
+
+def upgrade():
+    op.create_table(
+        TASK_CONSUMER_TABLE,
+        sa.Column('id', sa.String(255), primary_key=True),
+        sa.Column('watermark', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime()),)
+
+
+def downgrade():
+    op.drop_table(TASK_CONSUMER_TABLE)
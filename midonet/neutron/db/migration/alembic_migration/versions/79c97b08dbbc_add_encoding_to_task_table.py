@@ -0,0 +1,40 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add encoding to task table
+
+Revision ID: 79c97b08dbbc
+Revises: 19808c5df22a
+Create Date: 2015-03-10 10:21:44.508211
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '79c97b08dbbc'
+down_revision = '19808c5df22a'
+
+from alembic import op
+import sqlalchemy as sa
+
+TASK_TABLE_NAME = 'midonet_tasks'
+ENCODING_COL_NAME = 'encoding'
+
+
+def upgrade():
+    op.add_column(TASK_TABLE_NAME,
+                  sa.Column(ENCODING_COL_NAME, sa.String(16)))
+
+
+def downgrade():
+    op.drop_column(TASK_TABLE_NAME, ENCODING_COL_NAME)
@@ -0,0 +1,51 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add task table indexes
+
+Revision ID: 853f2f4d1854
+Revises: 79c97b08dbbc
+Create Date: 2015-03-12 15:02:19.731450
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '853f2f4d1854'
+down_revision = '79c97b08dbbc'
+
+from alembic import op
+
+TASK_TABLE_NAME = 'midonet_tasks'
+
+# The history of a single resource, also used to find superseded tasks when
+# compacting the journal.
+RESOURCE_INDEX = ('ix_midonet_tasks_resource',
+                  ['resource_id', 'data_type', 'id'])
+# The tasks written by one Neutron request or transaction.
+TRANSACTION_INDEX = ('ix_midonet_tasks_transaction',
+                     ['transaction_id', 'id'])
+# The age of the oldest unconsumed tasks.
+CREATED_AT_INDEX = ('ix_midonet_tasks_created_at', ['created_at'])
+
+INDEXES = [RESOURCE_INDEX, TRANSACTION_INDEX, CREATED_AT_INDEX]
+
+
+def upgrade():
+    for name, columns in INDEXES:
+        op.create_index(name, TASK_TABLE_NAME, columns)
+
+
+def downgrade():
+    for name, _columns in INDEXES:
+        op.drop_index(name, table_name=TASK_TABLE_NAME)
@@ -0,0 +1,43 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add lease to task table
+
+Revision ID: a911a286fbc1
+Revises: f96ca06b1192
+Create Date: 2015-03-20 11:42:08.195521
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a911a286fbc1'
+down_revision = 'f96ca06b1192'
+
+from alembic import op
+import sqlalchemy as sa
+
+TASK_TABLE_NAME = 'midonet_tasks'
+
+COLUMNS = [sa.Column('lease_owner', sa.String(255)),
+           sa.Column('lease_expires', sa.DateTime())]
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.add_column(TASK_TABLE_NAME, column)
+
+
+def downgrade():
+    for column in reversed(COLUMNS):
+        op.drop_column(TASK_TABLE_NAME, column.name)
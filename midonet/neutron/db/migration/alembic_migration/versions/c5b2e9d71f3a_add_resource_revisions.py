@@ -0,0 +1,45 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add resource revisions
+
+Revision ID: c5b2e9d71f3a
+Revises: a911a286fbc1
+Create Date: 2015-03-24 15:06:31.472094
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c5b2e9d71f3a'
+down_revision = 'a911a286fbc1'
+
+from alembic import op
+import sqlalchemy as sa
+
+TASK_TABLE_NAME = 'midonet_tasks'
+RESOURCE_REVISION_TABLE = 'midonet_resource_revisions'
+
+
+def upgrade():
+    op.add_column(TASK_TABLE_NAME, sa.Column('revision', sa.Integer()))
+    op.create_table(
+        RESOURCE_REVISION_TABLE,
+        sa.Column('data_type', sa.String(length=36), primary_key=True),
+        sa.Column('resource_id', sa.String(36), primary_key=True),
+        sa.Column('revision', sa.Integer(), nullable=False),)
+
+
+def downgrade():
+    op.drop_table(RESOURCE_REVISION_TABLE)
+    op.drop_column(TASK_TABLE_NAME, 'revision')
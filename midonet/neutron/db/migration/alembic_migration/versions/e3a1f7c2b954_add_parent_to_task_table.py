@@ -0,0 +1,41 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add parent to task table
+
+Revision ID: e3a1f7c2b954
+Revises: c5b2e9d71f3a
+Create Date: 2015-03-27 10:12:44.508317
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e3a1f7c2b954'
+down_revision = 'c5b2e9d71f3a'
+
+from alembic import op
+import sqlalchemy as sa
+
+TASK_TABLE_NAME = 'midonet_tasks'
+
+
+def upgrade():
+    op.add_column(TASK_TABLE_NAME, sa.Column('parent_id', sa.String(36)))
+    op.create_index('ix_midonet_tasks_parent', TASK_TABLE_NAME,
+                    ['parent_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_midonet_tasks_parent', table_name=TASK_TABLE_NAME)
+    op.drop_column(TASK_TABLE_NAME, 'parent_id')
@@ -0,0 +1,52 @@
+# Copyright 2015 Midokura SARL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""add dispatch status to task table
+
+Revision ID: f96ca06b1192
+Revises: 04b8b94871ae
+Create Date: 2015-03-18 14:05:12.604839
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f96ca06b1192'
+down_revision = '04b8b94871ae'
+
+from alembic import op
+import sqlalchemy as sa
+
+TASK_TABLE_NAME = 'midonet_tasks'
+
+COLUMNS = [sa.Column('dispatch_status', sa.String(16)),
+           sa.Column('dispatch_attempts', sa.Integer(), nullable=False,
+                     server_default='0'),
+           sa.Column('dispatch_after', sa.DateTime()),
+           sa.Column('dispatch_error', sa.String(255))]
+
+# The pending tasks polled by the outbox worker.
+DISPATCH_INDEX = ('ix_midonet_tasks_dispatch', ['dispatch_status', 'id'])
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.add_column(TASK_TABLE_NAME, column)
+    name, columns = DISPATCH_INDEX
+    op.create_index(name, TASK_TABLE_NAME, columns)
+
+
+def downgrade():
+    op.drop_index(DISPATCH_INDEX[0], table_name=TASK_TABLE_NAME)
+    for column in reversed(COLUMNS):
+        op.drop_column(TASK_TABLE_NAME, column.name)
@@ -15,12 +15,49 @@
 import os
 
 from alembic import config as alembic_config
+from alembic import util as alembic_util
 from neutron.db.migration import cli as n_cli
+from oslo_config import cfg
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from midonet.neutron.db import task
 
 
 CONF = n_cli.CONF
 
 
+def do_compact_tasks(config, cmd):
+    engine = sa.create_engine(config.neutron_config.database.connection)
+    session = orm.sessionmaker(bind=engine, autocommit=True)()
+    deleted = task.compact_tasks(session,
+                                 watermark=CONF.command.watermark,
+                                 chunk_size=CONF.command.chunk_size)
+    alembic_util.msg('Deleted %d superseded tasks' % deleted)
+
+
+def add_command_parsers(subparsers):
+    n_cli.add_command_parsers(subparsers)
+
+    parser = subparsers.add_parser('compact-tasks')
+    parser.add_argument('--watermark', type=int,
+                        help='Highest task ID processed by every consumer '
+                             '(default: the lowest consumer watermark; '
+                             'nothing is compacted without one)')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Number of task IDs compacted per transaction')
+    parser.set_defaults(func=do_compact_tasks)
+
+
+command_opt = cfg.SubCommandOpt('command',
+                                title='Command',
+                                help='Available commands',
+                                handler=add_command_parsers)
+
+CONF.unregister_opt(n_cli.command_opt)
+CONF.register_cli_opt(command_opt)
+
+
 def get_alembic_config():
     config = alembic_config.Config(os.path.join(os.path.dirname(__file__),
                                                 'alembic.ini'))
@@ -12,12 +12,29 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
 import collections
+import contextlib
 import datetime
+import functools
+import itertools
+import tempfile
+import zlib
+
+import eventlet
+from oslo_config import cfg
+from oslo_db import exception as db_exc
 from oslo_serialization import jsonutils
+from oslo_serialization import msgpackutils
+from oslo_utils import encodeutils
+from oslo_utils import excutils
+import six
 import sqlalchemy as sa
+from sqlalchemy import orm
 
+from neutron.api.v2 import attributes
 from neutron.common import exceptions as n_exc
+from neutron import context as n_context
 from neutron.db import model_base
 from neutron import i18n
 from neutron.openstack.common import log as logging
@@ -28,6 +45,7 @@ CONF_ID = '00000000-0000-0000-0000-000000000001'
 CREATE = "CREATE"
 DELETE = "DELETE"
 UPDATE = "UPDATE"
+PATCH = "PATCH"
 FLUSH = "FLUSH"
 
 NETWORK = "NETWORK"
@@ -41,6 +59,8 @@ POOL = "POOL"
 VIP = "VIP"
 HEALTH_MONITOR = "HEALTHMONITOR"
 MEMBER = "MEMBER"
+ROUTER_INTERFACE = "ROUTERINTERFACE"
+POOL_HEALTH_MONITOR = "POOLHEALTHMONITOR"
 PORT_BINDING = "PORTBINDING"
 CONFIG = "CONFIG"
 AGENT_MEMBERSHIP = "AGENTMEMBERSHIP"
@@ -48,9 +68,121 @@ AGENT_MEMBERSHIP = "AGENTMEMBERSHIP"
 
 OP_IMPORT = 'IMPORT'
 OP_FLUSH = 'FLUSH'
+OP_COMPACT = 'COMPACT'
+
+IMPORT_MODE_LOCK = 'lock'
+IMPORT_MODE_SNAPSHOT = 'snapshot'
+
+DISPATCH_SYNC = 'sync'
+DISPATCH_OUTBOX = 'outbox'
+
+DISPATCH_PENDING = 'PENDING'
+DISPATCH_RUNNING = 'RUNNING'
+DISPATCH_DONE = 'DONE'
+DISPATCH_FAILED = 'FAILED'
+
+# The resources whose tasks are dispatched to the MidoNet API in outbox
+# mode.
+DISPATCHED_DATA_TYPES = frozenset([NETWORK, SUBNET, PORT, ROUTER,
+                                   FLOATING_IP, SECURITY_GROUP,
+                                   SECURITY_GROUP_RULE, POOL, VIP,
+                                   HEALTH_MONITOR, MEMBER, ROUTER_INTERFACE,
+                                   POOL_HEALTH_MONITOR])
+
+# The attribute of the data of a resource holding the ID of the resource it
+# depends on in MidoNet, which must be there first and go last.
+PARENT_KEYS = {SUBNET: 'network_id',
+               PORT: 'network_id',
+               FLOATING_IP: 'router_id',
+               SECURITY_GROUP_RULE: 'security_group_id',
+               POOL: 'router_id',
+               VIP: 'pool_id',
+               MEMBER: 'pool_id',
+               ROUTER_INTERFACE: 'router_id'}
+
+ENCODING_JSON = 'json'
+ENCODING_ZLIB = 'zlib'
+ENCODING_MSGPACK = 'msgpack'
 
 LOG = logging.getLogger(__name__)
 _LI = i18n._LI
+_LW = i18n._LW
+
+cfg.CONF.register_opts([cfg.IntOpt('task_batch_size', default=1000,
+                                   help=_('Maximum number of tasks written '
+                                          'to the journal in a single '
+                                          'INSERT statement')),
+                        cfg.IntOpt('task_compaction_chunk_size',
+                                   default=10000,
+                                   help=_('Number of task IDs examined per '
+                                          'transaction when compacting the '
+                                          'task journal')),
+                        cfg.StrOpt('task_data_encoding',
+                                   default=ENCODING_JSON,
+                                   help=_('Encoding of the task data written '
+                                          'to the journal: json, zlib '
+                                          '(zlib-compressed JSON) or '
+                                          'msgpack')),
+                        cfg.IntOpt('import_page_size', default=1000,
+                                   help=_('Number of resources read per page '
+                                          'by the cluster IMPORT operation')),
+                        cfg.BoolOpt('task_update_delta', default=False,
+                                    help=_('Journal resource updates as a '
+                                           'PATCH task holding the changes '
+                                           'to the previous state instead of '
+                                           'the full resource')),
+                        cfg.IntOpt('task_checkpoint_interval', default=10,
+                                   help=_('When update deltas are enabled, '
+                                          'journal every Nth update of a '
+                                          'resource as a full UPDATE task so '
+                                          'its state can be rebuilt from a '
+                                          'bounded number of tasks')),
+                        cfg.StrOpt('import_mode', default=IMPORT_MODE_LOCK,
+                                   help=_('How the cluster IMPORT operation '
+                                          'takes its snapshot: "lock" holds '
+                                          'a global read lock while the '
+                                          'topology is read, "snapshot" '
+                                          'reads it from a consistent '
+                                          'snapshot transaction and lets '
+                                          'writes continue')),
+                        cfg.IntOpt('import_workers', default=1,
+                                   help=_('Number of resource types read '
+                                          'concurrently by the cluster '
+                                          'IMPORT operation')),
+                        cfg.StrOpt('dispatch_mode', default=DISPATCH_SYNC,
+                                   help=_('How changes are sent to the '
+                                          'MidoNet API: "sync" calls it '
+                                          'within the Neutron request, '
+                                          '"outbox" only writes the journal '
+                                          'and lets a background worker '
+                                          'make the calls after commit')),
+                        cfg.IntOpt('dispatch_interval', default=1,
+                                   help=_('Seconds between two polls of the '
+                                          'journal by the outbox worker')),
+                        cfg.IntOpt('dispatch_batch_size', default=100,
+                                   help=_('Maximum number of tasks '
+                                          'claimed per poll by an outbox '
+                                          'worker')),
+                        cfg.IntOpt('dispatch_workers', default=1,
+                                   help=_('Number of outbox workers run by '
+                                          'each neutron-server process')),
+                        cfg.IntOpt('dispatch_lease_time', default=60,
+                                   help=_('Seconds a worker may hold the '
+                                          'tasks it claimed before they can '
+                                          'be claimed by another worker. '
+                                          'Must exceed the time needed to '
+                                          'dispatch a batch')),
+                        cfg.IntOpt('dispatch_max_attempts', default=5,
+                                   help=_('Number of times the outbox worker '
+                                          'tries to dispatch a task before '
+                                          'marking it FAILED')),
+                        cfg.IntOpt('dispatch_retry_interval', default=2,
+                                   help=_('Seconds before the first retry of '
+                                          'a failed dispatch, doubled on '
+                                          'every further retry'))],
+                       'MIDONET')
+
+_BATCH_KEY = 'midonet_task_batch'
 
 
 class TaskType(model_base.BASEV2):
@@ -67,6 +199,14 @@ class DataType(model_base.BASEV2):
 
 class Task(model_base.BASEV2):
     __tablename__ = 'midonet_tasks'
+    __table_args__ = (
+        sa.Index('ix_midonet_tasks_resource',
+                 'resource_id', 'data_type', 'id'),
+        sa.Index('ix_midonet_tasks_transaction', 'transaction_id', 'id'),
+        sa.Index('ix_midonet_tasks_created_at', 'created_at'),
+        sa.Index('ix_midonet_tasks_dispatch', 'dispatch_status', 'id'),
+        sa.Index('ix_midonet_tasks_parent', 'parent_id', 'id'),
+    )
 
     id = sa.Column(sa.Integer(), primary_key=True)
     type = sa.Column(sa.String(length=36))
@@ -76,98 +216,1359 @@ class Task(model_base.BASEV2):
     resource_id = sa.Column(sa.String(36))
     transaction_id = sa.Column(sa.String(40))
     created_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+    encoding = sa.Column(sa.String(16))
+    dispatch_status = sa.Column(sa.String(16))
+    dispatch_attempts = sa.Column(sa.Integer(), nullable=False, default=0,
+                                  server_default='0')
+    dispatch_after = sa.Column(sa.DateTime())
+    dispatch_error = sa.Column(sa.String(255))
+    lease_owner = sa.Column(sa.String(255))
+    lease_expires = sa.Column(sa.DateTime())
+    revision = sa.Column(sa.Integer())
+    parent_id = sa.Column(sa.String(36))
+
+
+class ResourceRevision(model_base.BASEV2):
+    """The number of journaled changes of a resource."""
+
+    __tablename__ = 'midonet_resource_revisions'
+
+    data_type = sa.Column(sa.String(length=36), primary_key=True)
+    resource_id = sa.Column(sa.String(36), primary_key=True)
+    revision = sa.Column(sa.Integer(), nullable=False)
+
+
+class TaskConsumer(model_base.BASEV2):
+    """How far a consumer has processed the task journal."""
+
+    __tablename__ = 'midonet_task_consumers'
+
+    id = sa.Column(sa.String(255), primary_key=True)
+    watermark = sa.Column(sa.Integer(), nullable=False, default=0)
+    updated_at = sa.Column(sa.DateTime(), default=datetime.datetime.utcnow)
+
+
+class JsonCodec(object):
+    """Plain JSON, as written by the journal before encodings existed."""
+
+    def encode(self, data):
+        return jsonutils.dumps(data)
+
+    def decode(self, value):
+        return jsonutils.loads(value)
+
+
+class ZlibJsonCodec(object):
+    """zlib-compressed JSON, base64-encoded to fit the text column."""
+
+    def encode(self, data):
+        compressed = zlib.compress(encodeutils.safe_encode(
+            jsonutils.dumps(data)))
+        return base64.b64encode(compressed).decode('ascii')
+
+    def decode(self, value):
+        return jsonutils.loads(zlib.decompress(base64.b64decode(value)))
+
+
+class MsgpackCodec(object):
+    """msgpack, base64-encoded to fit the text column."""
+
+    def encode(self, data):
+        return base64.b64encode(msgpackutils.dumps(data)).decode('ascii')
+
+    def decode(self, value):
+        return msgpackutils.loads(base64.b64decode(value))
+
+
+_CODECS = {}
+
+
+def register_codec(encoding, codec):
+    """Register a codec for task data.
+
+    :param encoding: The marker stored in the encoding column of the tasks
+                     written with this codec.
+    :param codec: An object with encode(data) and decode(value) methods.
+    """
+    _CODECS[encoding] = codec
+
+
+register_codec(ENCODING_JSON, JsonCodec())
+register_codec(ENCODING_ZLIB, ZlibJsonCodec())
+register_codec(ENCODING_MSGPACK, MsgpackCodec())
+
+
+class TaskEncodingNotFound(n_exc.NotFound):
+    message = _("Task data encoding %(encoding)s could not be found")
+
+
+def _get_codec(encoding):
+    try:
+        return _CODECS[encoding]
+    except KeyError:
+        raise TaskEncodingNotFound(encoding=encoding)
+
+
+def encode_task_data(data, encoding=None):
+    """Encode task data with the given or the configured encoding.
+
+    :returns: A tuple of the encoding used and the encoded value.
+    """
+    encoding = encoding or cfg.CONF.MIDONET.task_data_encoding
+    return encoding, _get_codec(encoding).encode(data)
+
+
+def decode_task_data(value, encoding=None):
+    """Decode task data stored with the given encoding.
+
+    Tasks written before the encoding column existed have no encoding and
+    are plain JSON.
+    """
+    if value is None:
+        return None
+    return _get_codec(encoding or ENCODING_JSON).decode(value)
+
+
+def get_task_data(task):
+    """Return the decoded data of a task row or model."""
+    return decode_task_data(task.data, task.encoding)
+
+
+def _make_task_row(context, type, task_id=None, data_type=None,
+                   resource_id=None, data=None, dispatch_status=None,
+                   revision=None, parent_id=None):
+    encoding, value = None, None
+    if data is not None:
+        encoding, value = encode_task_data(data)
+    row = {'type': type,
+           'tenant_id': context.tenant,
+           'data_type': data_type,
+           'data': value,
+           'encoding': encoding,
+           'resource_id': resource_id,
+           'transaction_id': context.request_id,
+           'dispatch_status': dispatch_status,
+           'revision': revision,
+           'parent_id': parent_id}
+    if task_id is not None:
+        row['id'] = task_id
+    return row
+
+
+class TaskBatch(object):
+    """Collects task rows and writes them with a single INSERT statement.
+
+    The rows are handed to the DB API as one executemany call instead of
+    going through the ORM unit of work one object at a time.  They are
+    written in the order they were added.  The parents and revisions of
+    the resources the tasks change are resolved for the whole batch when
+    it is written, with a few statements whatever its size.
+    """
+
+    def __init__(self, session, size=None):
+        self.session = session
+        self.size = size or cfg.CONF.MIDONET.task_batch_size
+        self.rows = []
+        self.changes = []
+
+    def add(self, row):
+        """Add a row written as it is."""
+        self.rows.append(row)
+        if len(self.rows) >= self.size:
+            self.flush()
+
+    def add_change(self, row, revision=None):
+        """Add the row of a task changing a resource.
+
+        :param revision: The revision of the resource the change was made
+                         from, or None to take its current revision.
+        """
+        self.changes.append((row, revision))
+        self.add(row)
+
+    def flush(self):
+        rows, self.rows = self.rows, []
+        changes, self.changes = self.changes, []
+        _write_tasks(self.session, rows, changes)
+
+
+@contextlib.contextmanager
+def batch(context):
+    """Defer the tasks created in the block and write them in bulk.
+
+    All the tasks created with create_task() on the same session while the
+    block is active are collected and written when the block exits.  The
+    block runs in a (sub)transaction so the journal rows are committed or
+    rolled back together with the resources they describe.  Nested blocks
+    share the outermost batch.
+    """
+    session = context.session
+    current = session.info.get(_BATCH_KEY)
+    if current is not None:
+        yield current
+        return
+
+    task_batch = TaskBatch(session)
+    session.info[_BATCH_KEY] = task_batch
+    try:
+        with session.begin(subtransactions=True):
+            yield task_batch
+            task_batch.flush()
+    finally:
+        session.info.pop(_BATCH_KEY, None)
+
+
+def _escape_pointer(key):
+    return key.replace('~', '~0').replace('/', '~1')
+
+
+def _unescape_pointer(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_task_patch(old, new):
+    """Return the JSON Patch (RFC 6902) that turns old into new.
+
+    Only the top-level attributes are compared; an attribute that changed
+    is replaced as a whole.
+    """
+    patch = []
+    for key in sorted(set(old) - set(new)):
+        patch.append({'op': 'remove', 'path': '/' + _escape_pointer(key)})
+    for key in sorted(new):
+        if key not in old:
+            patch.append({'op': 'add', 'path': '/' + _escape_pointer(key),
+                          'value': new[key]})
+        elif old[key] != new[key]:
+            patch.append({'op': 'replace', 'path': '/' + _escape_pointer(key),
+                          'value': new[key]})
+    return patch
+
+
+def apply_task_patch(data, patch):
+    """Return a copy of data with a patch from make_task_patch applied."""
+    data = dict(data)
+    for operation in patch:
+        key = _unescape_pointer(operation['path'][1:])
+        if operation['op'] == 'remove':
+            data.pop(key, None)
+        else:
+            data[key] = operation['value']
+    return data
+
+
+class TaskPatchBaseNotFound(n_exc.NotFound):
+    message = _("No previous state found for the PATCH task %(task_id)s of "
+                "%(data_type)s %(resource_id)s")
+
+
+def iter_task_data(tasks):
+    """Yield each task with the full resource data it leaves behind.
+
+    The data of PATCH tasks is rebuilt by applying their patch to the state
+    left by the previous tasks of the resource, so the tasks must be given
+    in journal order and start at the beginning of the journal, at a FLUSH
+    or at a full CREATE or UPDATE task of every patched resource.  DELETE
+    and FLUSH tasks are yielded with their own data.
+    """
+    states = {}
+    for t in tasks:
+        key = (t.data_type, t.resource_id)
+        if t.type == FLUSH:
+            states.clear()
+            data = get_task_data(t)
+        elif t.type == DELETE:
+            states.pop(key, None)
+            data = get_task_data(t)
+        elif t.type == PATCH:
+            if key not in states:
+                raise TaskPatchBaseNotFound(task_id=t.id,
+                                            data_type=t.data_type,
+                                            resource_id=t.resource_id)
+            data = states[key] = apply_task_patch(states[key],
+                                                  get_task_data(t))
+        else:
+            data = states[key] = get_task_data(t)
+        yield t, data
+
+
+def _get_resource_history(session, data_type, resource_id, limit=None,
+                          upto=None):
+    """Return the tasks of a resource since its last full task.
+
+    The tasks are returned oldest first, starting at the last task that is
+    not a PATCH unless more than limit tasks would be returned.  Only the
+    tasks up to the task ID upto are considered if it is given.
+    """
+    query = session.query(Task).filter_by(
+        data_type=data_type, resource_id=resource_id).order_by(Task.id.desc())
+    if upto is not None:
+        query = query.filter(Task.id <= upto)
+    if limit is not None:
+        query = query.limit(limit)
+    history = []
+    for t in query:
+        history.append(t)
+        if t.type != PATCH:
+            break
+    history.reverse()
+    return history
+
+
+def _rebuild_resource_data(history):
+    data = None
+    for _t, data in iter_task_data(history):
+        pass
+    return data
+
+
+def get_resource_data(session, data_type, resource_id, upto=None):
+    """Rebuild the latest journaled state of a resource.
+
+    :param upto: Rebuild the state left by the task with this ID instead.
+    :returns: The data of the resource, or None if the journal does not
+              hold it or its last task is a DELETE.
+    """
+    history = _get_resource_history(session, data_type, resource_id,
+                                    upto=upto)
+    if not history or history[0].type == PATCH:
+        return None
+    return _rebuild_resource_data(history)
+
+
+def _make_update_delta(context, data_type, resource_id, data):
+    """Return the type and data of the task journaling an update.
+
+    The update is journaled as a PATCH against the journaled state of the
+    resource, or as a full UPDATE checkpoint once task_checkpoint_interval
+    - 1 PATCH tasks follow its last full task.
+    """
+    limit = cfg.CONF.MIDONET.task_checkpoint_interval - 1
+    if limit < 1:
+        return UPDATE, data
+
+    # The previous tasks of the resource may still be waiting in the batch.
+    task_batch = context.session.info.get(_BATCH_KEY)
+    if task_batch is not None:
+        task_batch.flush()
+
+    history = _get_resource_history(context.session, data_type, resource_id,
+                                    limit=limit)
+    if not history or history[0].type not in (CREATE, UPDATE):
+        return UPDATE, data
+    return PATCH, make_task_patch(_rebuild_resource_data(history),
+                                  jsonutils.to_primitive(data))
+
+
+class RevisionConflict(n_exc.Conflict):
+    message = _("%(data_type)s %(resource_id)s was modified concurrently, "
+                "its revision is no longer %(revision)s")
+
+
+def get_revision(session, data_type, resource_id):
+    """Return the revision of a resource, 0 if it has none."""
+    revisions = ResourceRevision.__table__
+    revision = session.execute(sa.select([revisions.c.revision]).where(
+        sa.and_(revisions.c.data_type == data_type,
+                revisions.c.resource_id == resource_id))).scalar()
+    return revision or 0
+
+
+def bump_revision(session, data_type, resource_id, revision, delete=False):
+    """Compare and swap the revision of a resource.
+
+    Moves the resource from the revision read at the start of a transaction
+    to the next one, or drops its revision when it is deleted.  Writers
+    are not serialized: the one committing last finds the revision it read
+    changed and fails with RevisionConflict, to be retried with its whole
+    transaction.
+
+    :returns: The new revision.
+    """
+    revisions = ResourceRevision.__table__
+    match = sa.and_(revisions.c.data_type == data_type,
+                    revisions.c.resource_id == resource_id,
+                    revisions.c.revision == revision)
+    with session.begin(subtransactions=True):
+        if delete:
+            result = session.execute(revisions.delete().where(match))
+        else:
+            result = session.execute(revisions.update().where(match).values(
+                revision=revisions.c.revision + 1))
+        if not result.rowcount:
+            conflict = RevisionConflict(data_type=data_type,
+                                        resource_id=resource_id,
+                                        revision=revision)
+            # A resource journaled for the first time has no revision yet.
+            if revision:
+                raise conflict
+            if not delete:
+                try:
+                    session.execute(revisions.insert(),
+                                    {'data_type': data_type,
+                                     'resource_id': resource_id,
+                                     'revision': 1})
+                except db_exc.DBDuplicateEntry:
+                    raise conflict
+    return revision + 1
+
+
+def _bump_revisions(session, changes):
+    """Move the revisions of the resources changed by task rows.
+
+    The revision of each resource moves by the number of its changes, with
+    a single statement for all the resources.  It is compared and swapped
+    when the first change of the resource gives the revision it was made
+    from, and only incremented otherwise, the last writer winning.  Every
+    row gets the revision its change brings the resource to.
+
+    :param changes: (row, revision) pairs in journal order.
+    :raises: RevisionConflict if a resource is no longer at the revision
+             given, or is created twice.
+    """
+    resources = collections.OrderedDict()
+    for row, revision in changes:
+        if (row['data_type'] not in DISPATCHED_DATA_TYPES or
+                row['resource_id'] is None):
+            continue
+        key = (row['data_type'], row['resource_id'])
+        resources.setdefault(key, (revision, []))[1].append(row)
+    if not resources:
+        return
+
+    revisions = ResourceRevision.__table__
+    match_key = sa.and_(
+        revisions.c.data_type == sa.bindparam('b_data_type'),
+        revisions.c.resource_id == sa.bindparam('b_resource_id'))
+    bases = {}
+    increments = []
+    inserts = []
+    deletes = []
+    with session.begin(subtransactions=True):
+        for key, (revision, rows) in six.iteritems(resources):
+            deleted = rows[-1]['type'] == DELETE
+            if rows[0]['type'] == CREATE:
+                bases[key] = 0
+                if not deleted:
+                    inserts.append(key)
+            elif revision is None:
+                increments.append(key)
+            else:
+                bases[key] = revision
+                match = sa.and_(revisions.c.data_type == key[0],
+                                revisions.c.resource_id == key[1],
+                                revisions.c.revision == revision)
+                if deleted:
+                    result = session.execute(revisions.delete().where(match))
+                else:
+                    result = session.execute(
+                        revisions.update().where(match).values(
+                            revision=revisions.c.revision + len(rows)))
+                if not result.rowcount:
+                    # A resource journaled for the first time has no
+                    # revision yet.
+                    if revision:
+                        raise RevisionConflict(data_type=key[0],
+                                               resource_id=key[1],
+                                               revision=revision)
+                    if not deleted:
+                        inserts.append(key)
+
+        if increments:
+            session.execute(
+                revisions.update().where(match_key).values(
+                    revision=revisions.c.revision + sa.bindparam('b_count')),
+                [{'b_data_type': data_type, 'b_resource_id': resource_id,
+                  'b_count': len(resources[(data_type, resource_id)][1])}
+                 for data_type, resource_id in increments])
+            current = dict(
+                ((data_type, resource_id), value)
+                for data_type, resource_id, value in session.execute(
+                    sa.select([revisions.c.data_type,
+                               revisions.c.resource_id,
+                               revisions.c.revision]).where(
+                        revisions.c.resource_id.in_(
+                            [key[1] for key in increments]))))
+            for key in increments:
+                rows = resources[key][1]
+                deleted = rows[-1]['type'] == DELETE
+                if key in current:
+                    bases[key] = current[key] - len(rows)
+                    if deleted:
+                        deletes.append(key)
+                else:
+                    bases[key] = 0
+                    if not deleted:
+                        inserts.append(key)
+
+        if inserts:
+            try:
+                session.execute(revisions.insert(),
+                                [{'data_type': data_type,
+                                  'resource_id': resource_id,
+                                  'revision': len(resources[
+                                      (data_type, resource_id)][1])}
+                                 for data_type, resource_id in inserts])
+            except db_exc.DBDuplicateEntry:
+                raise RevisionConflict(data_type=inserts[0][0],
+                                       resource_id=inserts[0][1],
+                                       revision=0)
+        if deletes:
+            session.execute(revisions.delete().where(match_key),
+                            [{'b_data_type': data_type,
+                              'b_resource_id': resource_id}
+                             for data_type, resource_id in deletes])
+
+    for key, (_revision, rows) in six.iteritems(resources):
+        for index, row in enumerate(rows, 1):
+            row['revision'] = bases[key] + index
+
+
+def _set_parent_ids(session, rows):
+    """Fill in the parent of the task rows of resources naming none.
+
+    It is taken from the last task of the resource naming one, earlier in
+    rows or else in the journal, as the DELETE tasks carry no data.  The
+    journal is read once for all the rows.
+    """
+    missing = set(row['resource_id'] for row in rows
+                  if row['parent_id'] is None and
+                  row['data_type'] in PARENT_KEYS and
+                  row['resource_id'] is not None)
+    if not missing:
+        return
+    parents = {}
+    query = session.query(Task.data_type, Task.resource_id,
+                          Task.parent_id).filter(
+        Task.resource_id.in_(sorted(missing)),
+        Task.parent_id.isnot(None)).order_by(Task.id)
+    for data_type, resource_id, parent_id in query:
+        parents[(data_type, resource_id)] = parent_id
+    for row in rows:
+        key = (row['data_type'], row['resource_id'])
+        if row['parent_id'] is not None:
+            parents[key] = row['parent_id']
+        elif row['data_type'] in PARENT_KEYS:
+            row['parent_id'] = parents.get(key)
+
+
+def _write_tasks(session, rows, changes=()):
+    """Insert task rows, the ones of changes once resolved.
+
+    :param changes: (row, revision) pairs of the rows changing resources,
+                    as taken by TaskBatch.add_change.
+    """
+    with session.begin(subtransactions=True):
+        _set_parent_ids(session, [row for row, _revision in changes])
+        _bump_revisions(session, changes)
+        # executemany requires every row to carry the same set of columns,
+        # so rows with an explicit id are inserted separately.
+        for _has_id, group in itertools.groupby(rows,
+                                                key=lambda r: 'id' in r):
+            session.execute(Task.__table__.insert(), list(group))
 
 
 def create_task(context, type, task_id=None, data_type=None,
-                resource_id=None, data=None):
+                resource_id=None, data=None, delta=None, revision=None,
+                parent_id=None):
+    """Write a task to the journal.
+
+    The tasks of the resources dispatched to the MidoNet API carry the
+    revision the change brings the resource to, so that their consumers
+    can tell a stale change from the latest one, and the ID of the
+    resource they depend on, so that the outbox dispatches them in order.
+
+    :param delta: Journal an UPDATE as a PATCH task holding the changes to
+                  the previous state of the resource.  Defaults to the
+                  task_update_delta option.
+    :param revision: The revision of the resource the change was made from,
+                     read at the start of the transaction, for the change
+                     to fail with RevisionConflict if another one was
+                     committed since.  Without it, the revision is only
+                     incremented and the last writer wins.
+    :param parent_id: The ID of the resource the resource depends on.
+                      Defaults to the one named by its PARENT_KEYS
+                      attribute.
+    """
+    # The tasks lacking data are given the parent of their resource when
+    # they are written.
+    if parent_id is None and data is not None and data_type in PARENT_KEYS:
+        parent_id = data.get(PARENT_KEYS[data_type]) or None
+    if delta is None:
+        delta = cfg.CONF.MIDONET.task_update_delta
+    if delta and type == UPDATE and data is not None:
+        type, data = _make_update_delta(context, data_type, resource_id,
+                                        data)
+
+    dispatch_status = None
+    if is_outbox_enabled() and data_type in DISPATCHED_DATA_TYPES:
+        dispatch_status = DISPATCH_PENDING
+
+    row = _make_task_row(context, type, task_id=task_id, data_type=data_type,
+                         resource_id=resource_id, data=data,
+                         dispatch_status=dispatch_status,
+                         parent_id=parent_id)
+
+    task_batch = context.session.info.get(_BATCH_KEY)
+    if task_batch is not None:
+        task_batch.add_change(row, revision)
+        return
 
-    with context.session.begin(subtransactions=True):
-        db = Task(id=task_id,
-                  type=type,
-                  tenant_id=context.tenant,
-                  data_type=data_type,
-                  data=None if data is None else jsonutils.dumps(data),
-                  resource_id=resource_id,
-                  transaction_id=context.request_id)
-        context.session.add(db)
+    _write_tasks(context.session, [row], [(row, revision)])
 
 
 def create_config_task(session, data):
     data['id'] = CONF_ID
+    encoding, value = encode_task_data(data)
     with session.begin(subtransactions=True):
         db = Task(type=CREATE,
                   tenant_id=None,
                   data_type=CONFIG,
-                  data=jsonutils.dumps(data),
+                  data=value,
+                  encoding=encoding,
                   resource_id=data['id'],
                   transaction_id=uuid.uuid4())
         session.add(db)
 
 
+class TaskConsumerNotFound(n_exc.NotFound):
+    message = _("Task journal consumer %(consumer_id)s could not be found")
+
+
+def advance_consumer_watermark(session, consumer_id, watermark):
+    """Record that a consumer has processed every task up to watermark.
+
+    The consumer is registered on its first call.  Its watermark never
+    moves backwards: an older watermark than the recorded one is ignored.
+
+    :returns: The watermark of the consumer after the call.
+    """
+    with session.begin(subtransactions=True):
+        consumer = session.query(TaskConsumer).filter_by(
+            id=consumer_id).with_lockmode('update').first()
+        if consumer is None:
+            consumer = TaskConsumer(id=consumer_id, watermark=watermark)
+            session.add(consumer)
+        elif watermark > consumer.watermark:
+            consumer.watermark = watermark
+            consumer.updated_at = datetime.datetime.utcnow()
+        return consumer.watermark
+
+
+def get_consumer_watermark(session, consumer_id):
+    """Return the watermark of a consumer, or None if it is unknown."""
+    consumer = session.query(TaskConsumer).get(consumer_id)
+    return consumer.watermark if consumer else None
+
+
+def delete_consumer(session, consumer_id):
+    """Unregister a consumer so it no longer holds back compaction."""
+    with session.begin(subtransactions=True):
+        session.query(TaskConsumer).filter_by(id=consumer_id).delete()
+
+
+def _get_min_consumer_watermark(session):
+    return session.query(sa.func.min(TaskConsumer.watermark)).scalar()
+
+
+def _make_lag_dict(session, consumer, now):
+    oldest = session.query(Task.created_at).filter(
+        Task.id > consumer.watermark).order_by(Task.id).first()
+    age = 0
+    if oldest is not None and oldest[0] is not None:
+        age = max(int((now - oldest[0]).total_seconds()), 0)
+    return {'id': consumer.id,
+            'watermark': consumer.watermark,
+            'tasks_behind': session.query(Task).filter(
+                Task.id > consumer.watermark).count(),
+            'oldest_unconsumed_age': age}
+
+
+def get_journal_lag(session, consumer_id=None):
+    """Return how far behind the journal its consumers are.
+
+    :param consumer_id: Only return the lag of this consumer.
+    :returns: A list of dicts with the id and watermark of each consumer,
+              the number of tasks above its watermark (tasks_behind) and
+              the age in seconds of the oldest of them
+              (oldest_unconsumed_age).
+    """
+    query = session.query(TaskConsumer).order_by(TaskConsumer.id)
+    if consumer_id is not None:
+        query = query.filter_by(id=consumer_id)
+    now = datetime.datetime.utcnow()
+    return [_make_lag_dict(session, consumer, now) for consumer in query]
+
+
+def _get_superseded_task_ids(session, lower, upper, watermark):
+    """Return the IDs in [lower, upper) of tasks that are superseded.
+
+    An UPDATE or PATCH task is superseded when a later task for the same
+    resource other than a PATCH exists at or below the watermark, since it
+    carries the full state of the resource (or its deletion).  A CREATE
+    task is only superseded by a later DELETE, so that the first surviving
+    task of a resource still alive is always its CREATE.  Tasks still
+    waiting to be dispatched by the outbox worker are kept.
+    """
+    tasks = Task.__table__
+    later = tasks.alias('later')
+    query = sa.select([tasks.c.id]).where(sa.and_(
+        tasks.c.id >= lower,
+        tasks.c.id < upper,
+        tasks.c.type.in_([CREATE, UPDATE, PATCH]),
+        sa.or_(tasks.c.dispatch_status.is_(None),
+               tasks.c.dispatch_status.in_([DISPATCH_DONE, DISPATCH_FAILED])),
+        sa.exists().where(sa.and_(
+            later.c.resource_id == tasks.c.resource_id,
+            later.c.data_type == tasks.c.data_type,
+            sa.or_(later.c.type == DELETE,
+                   sa.and_(tasks.c.type != CREATE,
+                           later.c.type != PATCH)),
+            later.c.id > tasks.c.id,
+            later.c.id <= watermark))))
+    return [row[0] for row in session.execute(query)]
+
+
+def compact_tasks(session, watermark=None, chunk_size=None):
+    """Delete the superseded tasks at or below the watermark.
+
+    The journal is walked in ranges of chunk_size task IDs and each range
+    is compacted in its own short transaction, so concurrent writers are
+    never blocked for more than one chunk.  The superseded IDs are selected
+    first and deleted by primary key, which keeps the row locks taken by
+    the DELETE limited to the rows being removed.
+
+    :param watermark: The highest task ID every consumer has processed.
+                      Tasks above it are never touched.  Defaults to the
+                      lowest watermark of the registered consumers.
+                      Nothing is compacted when there are none, since the
+                      MidoNet cluster may not have read the journal yet.
+    :param chunk_size: Number of task IDs examined per transaction.
+    :returns: The number of deleted tasks.
+    """
+    chunk_size = chunk_size or cfg.CONF.MIDONET.task_compaction_chunk_size
+    if watermark is None:
+        watermark = _get_min_consumer_watermark(session)
+    if watermark is None:
+        LOG.warn(_LW('Not compacting the task journal: no watermark given '
+                     'and no consumer registered'))
+        return 0
+    lower, tail = session.query(sa.func.min(Task.id),
+                                sa.func.max(Task.id)).one()
+    if tail is None:
+        return 0
+    watermark = min(watermark, tail)
+
+    tasks = Task.__table__
+    deleted = 0
+    while lower <= watermark:
+        upper = min(lower + chunk_size, watermark + 1)
+        with session.begin(subtransactions=True):
+            task_ids = _get_superseded_task_ids(session, lower, upper,
+                                                watermark)
+            if task_ids:
+                session.execute(tasks.delete().where(
+                    tasks.c.id.in_(task_ids)))
+        deleted += len(task_ids)
+        lower = upper
+
+    LOG.info(_LI('Compacted %(deleted)d tasks up to task %(watermark)d'),
+             {'deleted': deleted, 'watermark': watermark})
+    return deleted
+
+
+def is_outbox_enabled():
+    return cfg.CONF.MIDONET.dispatch_mode == DISPATCH_OUTBOX
+
+
+def _dispatch_due(tasks, now):
+    return sa.or_(
+        sa.and_(tasks.c.dispatch_status == DISPATCH_PENDING,
+                sa.or_(tasks.c.dispatch_after.is_(None),
+                       tasks.c.dispatch_after <= now)),
+        # The worker that leased the task crashed or got stuck.
+        sa.and_(tasks.c.dispatch_status == DISPATCH_RUNNING,
+                tasks.c.lease_expires < now))
+
+
+def _get_claimable_query(now, limit=None):
+    """Select the tasks that are due and not held back by an earlier task.
+
+    A task is held back while an earlier task of the same resource, of the
+    resource it depends on or of a resource depending on it is leased to a
+    worker or waits for a retry, so the MidoNet API calls for a resource
+    and its parent are made in journal order.  A task is held back for good
+    once such an earlier task has FAILED, until an operator resolves it.
+    """
+    tasks = Task.__table__
+    earlier = tasks.alias('earlier')
+    query = sa.select([tasks.c.id, tasks.c.data_type, tasks.c.resource_id,
+                       tasks.c.parent_id])
+    query = query.where(sa.and_(
+        _dispatch_due(tasks, now),
+        ~sa.exists().where(sa.and_(
+            sa.or_(earlier.c.resource_id == tasks.c.resource_id,
+                   earlier.c.resource_id == tasks.c.parent_id,
+                   earlier.c.parent_id == tasks.c.resource_id),
+            earlier.c.id < tasks.c.id,
+            sa.or_(
+                earlier.c.dispatch_status == DISPATCH_FAILED,
+                sa.and_(earlier.c.dispatch_status.in_([DISPATCH_PENDING,
+                                                       DISPATCH_RUNNING]),
+                        ~_dispatch_due(earlier, now))))))).order_by(
+                            tasks.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _get_ordered_claims(session, rows):
+    """Return the IDs of the candidate rows that keep resources in order.
+
+    SKIP LOCKED hides the tasks locked by concurrent claims, so a candidate
+    may be a later task of a resource, or of a resource related to it,
+    whose earlier task is being claimed by another worker.  Such
+    candidates, and every later task of their resource and of the
+    resources related to it, are dropped.
+    """
+    tasks = Task.__table__
+    candidates = set(row.id for row in rows)
+    resource_ids = set(row.resource_id for row in rows)
+    resource_ids.update(row.parent_id for row in rows if row.parent_id)
+    query = sa.select([tasks.c.id, tasks.c.resource_id, tasks.c.parent_id])
+    query = query.where(sa.and_(
+        sa.or_(tasks.c.resource_id.in_(resource_ids),
+               tasks.c.parent_id.in_(resource_ids)),
+        tasks.c.id <= max(candidates),
+        tasks.c.dispatch_status.in_([DISPATCH_PENDING, DISPATCH_RUNNING])))
+    query = query.order_by(tasks.c.id)
+    blocked = set()
+    blocked_parents = set()
+    task_ids = []
+    for row in session.execute(query):
+        if (row.id in candidates and row.resource_id not in blocked and
+                row.resource_id not in blocked_parents and
+                row.parent_id not in blocked):
+            task_ids.append(row.id)
+        else:
+            blocked.add(row.resource_id)
+            if row.parent_id:
+                blocked_parents.add(row.parent_id)
+    return task_ids
+
+
+def claim_tasks(session, owner, limit=None):
+    """Lease the tasks that can be dispatched now to a worker.
+
+    The candidate rows are locked with SELECT ... FOR UPDATE SKIP LOCKED
+    where the database supports it, so workers in several neutron-server
+    processes claim disjoint batches without waiting for each other.  The
+    leases expire after dispatch_lease_time seconds, after which the tasks
+    of a worker that died are claimed again.
+
+    :param owner: The name of the worker, recorded on the leased tasks.
+    :param limit: Maximum number of tasks to lease.
+    :returns: The leased tasks, oldest first.  The tasks of a resource
+              must be dispatched in this order, and the remaining ones
+              left alone once one of them fails.
+    """
+    journal = _get_journal_dialect(session)
+    now = datetime.datetime.utcnow()
+    lease_expires = now + datetime.timedelta(
+        seconds=cfg.CONF.MIDONET.dispatch_lease_time)
+    tasks = Task.__table__
+    task_ids = []
+    with session.begin(subtransactions=True):
+        query = journal.lock_for_claim(session,
+                                       _get_claimable_query(now, limit))
+        rows = session.execute(query).fetchall()
+        if rows:
+            task_ids = _get_ordered_claims(session, rows)
+        if task_ids:
+            session.execute(tasks.update().where(
+                tasks.c.id.in_(task_ids)).values(
+                    dispatch_status=DISPATCH_RUNNING,
+                    lease_owner=owner,
+                    lease_expires=lease_expires))
+    if not task_ids:
+        return []
+    return session.query(Task).filter(Task.id.in_(task_ids)).order_by(
+        Task.id).all()
+
+
+def _update_dispatch(session, task_id, owner, values):
+    tasks = Task.__table__
+    values.update(lease_owner=None, lease_expires=None)
+    with session.begin(subtransactions=True):
+        # A worker whose lease expired must not overwrite the outcome of
+        # the worker that claimed the task after it.
+        return session.execute(tasks.update().where(sa.and_(
+            tasks.c.id == task_id,
+            tasks.c.lease_owner == owner)).values(**values)).rowcount
+
+
+def complete_task(session, task, owner):
+    """Mark a task leased by owner as dispatched."""
+    _update_dispatch(session, task.id, owner,
+                     {'dispatch_status': DISPATCH_DONE,
+                      'dispatch_error': None})
+
+
+def release_tasks(session, task_ids, owner):
+    """Give back leased tasks that were not dispatched."""
+    if not task_ids:
+        return
+    tasks = Task.__table__
+    with session.begin(subtransactions=True):
+        session.execute(tasks.update().where(sa.and_(
+            tasks.c.id.in_(task_ids),
+            tasks.c.lease_owner == owner)).values(
+                dispatch_status=DISPATCH_PENDING,
+                lease_owner=None,
+                lease_expires=None))
+
+
+def fail_task(session, task, owner, error):
+    """Record a failed dispatch of a task and schedule its retry.
+
+    The retries back off exponentially from dispatch_retry_interval.  The
+    task is marked FAILED after dispatch_max_attempts attempts.
+
+    :returns: Whether the task has been marked FAILED.
+    """
+    conf = cfg.CONF.MIDONET
+    attempts = task.dispatch_attempts + 1
+    values = {'dispatch_attempts': attempts,
+              'dispatch_error': six.text_type(error)[:255]}
+    failed = attempts >= conf.dispatch_max_attempts
+    if failed:
+        values['dispatch_status'] = DISPATCH_FAILED
+    else:
+        delay = conf.dispatch_retry_interval * 2 ** (attempts - 1)
+        values['dispatch_status'] = DISPATCH_PENDING
+        values['dispatch_after'] = (datetime.datetime.utcnow() +
+                                    datetime.timedelta(seconds=delay))
+    return _update_dispatch(session, task.id, owner, values) == 1 and failed
+
+
+def get_dispatch_status(session, data_type, resource_id):
+    """Return the dispatch status of the last dispatched task of a resource.
+
+    :returns: One of the DISPATCH_* statuses, or None if no task of the
+              resource went through the outbox.
+    """
+    status = session.query(Task.dispatch_status).filter(
+        Task.data_type == data_type,
+        Task.resource_id == resource_id,
+        Task.dispatch_status.isnot(None)).order_by(Task.id.desc()).first()
+    return status[0] if status else None
+
+
 class MidonetClusterException(n_exc.NeutronException):
     message = _("Midonet Cluster Error: %(msg)s")
 
 
+# The resources exported by IMPORT and the plural names used by their
+# get_* plugin methods, in the order they are written to the journal.
+IMPORT_RESOURCES = [(NETWORK, 'networks'),
+                    (SUBNET, 'subnets'),
+                    (PORT, 'ports'),
+                    (ROUTER, 'routers'),
+                    (FLOATING_IP, 'floatingips'),
+                    (SECURITY_GROUP, 'security_groups'),
+                    (SECURITY_GROUP_RULE, 'security_group_rules'),
+                    (POOL, 'pools'),
+                    (VIP, 'vips'),
+                    (HEALTH_MONITOR, 'health_monitors'),
+                    (MEMBER, 'members')]
+
+# The LBaaS v1 DB mixin does not support pagination, so those resources are
+# read with a single call.
+_PAGINATED_RESOURCES = frozenset([NETWORK, SUBNET, PORT, ROUTER, FLOATING_IP,
+                                  SECURITY_GROUP, SECURITY_GROUP_RULE])
+
+
+# Columns copied when a task is replayed after a snapshot import.
+_REPLAY_COLUMNS = ['type', 'tenant_id', 'data_type', 'data', 'encoding',
+                   'resource_id', 'transaction_id', 'revision', 'parent_id']
+
+
+def _get_journal_position(session):
+    """Return the ID of the last task of the journal.
+
+    Task IDs are allocated when a task is inserted, not when it is
+    committed, so the caller holds the write lock to make sure that no
+    task below the returned ID is still being committed.
+    """
+    return session.query(sa.func.max(Task.id)).scalar() or 0
+
+
+class _TaskSpool(object):
+    """Buffers task rows in a temporary file instead of in memory."""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+
+    def write(self, row):
+        self._file.write(encodeutils.safe_encode(jsonutils.dumps(row)))
+        self._file.write(b'\n')
+
+    def __iter__(self):
+        self._file.seek(0)
+        for line in self._file:
+            yield jsonutils.loads(line)
+
+    def close(self):
+        self._file.close()
+
+
+# SQLite has no explicit table locks.  A write statement, even one that
+# matches no rows, makes the transaction take the database RESERVED lock,
+# which keeps every other writer out until the transaction ends.
+_SQLITE_WRITE_LOCK = 'DELETE FROM midonet_tasks WHERE 0 = 1'
+
+
+class _MySQLJournal(object):
+    """Journal locking on MySQL."""
+
+    @contextlib.contextmanager
+    def read_locked(self, session):
+        # lock the entire database so we can take a snapshot of the data
+        # we need.
+        session.execute('FLUSH TABLES WITH READ LOCK')
+        try:
+            with session.begin(subtransactions=True):
+                yield
+        finally:
+            session.execute('UNLOCK TABLES')
+
+    @contextlib.contextmanager
+    def write_locked(self, session):
+        session.execute('LOCK TABLES midonet_tasks WRITE')
+        try:
+            with session.begin(subtransactions=True):
+                yield
+        finally:
+            session.execute('UNLOCK TABLES')
+
+    @contextlib.contextmanager
+    def snapshot(self, session):
+        # The isolation level has to be set on the connection before its
+        # transaction starts, since SET TRANSACTION fails within one and
+        # START TRANSACTION commits it.  The session must thus not be in a
+        # transaction yet.  InnoDB takes the snapshot at the first read,
+        # and reads every table from it.
+        with session.begin():
+            session.connection(
+                execution_options={'isolation_level': 'REPEATABLE READ'})
+            yield
+
+    def truncate(self, session):
+        session.execute('TRUNCATE TABLE midonet_tasks')
+
+    def lock_for_claim(self, session, query):
+        # SKIP LOCKED needs MySQL 8.0.1.  Without it, concurrent claims
+        # queue up on the locked rows instead of skipping them.
+        version = session.get_bind().dialect.server_version_info or ()
+        if 'MariaDB' in version or version < (8, 0, 1):
+            return query.with_for_update()
+        return query.suffix_with('FOR UPDATE SKIP LOCKED')
+
+
+class _PostgreSQLJournal(object):
+    """Journal locking on PostgreSQL.
+
+    Every Neutron write goes with a task insert in the same transaction, so
+    locking midonet_tasks against writes holds back every writer at its
+    task insert.  Their uncommitted changes are not visible to a
+    REPEATABLE READ transaction, which gives the same guarantees as the
+    global read lock used on MySQL.
+    """
+
+    @contextlib.contextmanager
+    def read_locked(self, session):
+        with session.begin(subtransactions=True):
+            session.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            session.execute('LOCK TABLE midonet_tasks IN SHARE MODE')
+            yield
+
+    @contextlib.contextmanager
+    def write_locked(self, session):
+        with session.begin(subtransactions=True):
+            session.execute('LOCK TABLE midonet_tasks IN EXCLUSIVE MODE')
+            yield
+
+    @contextlib.contextmanager
+    def snapshot(self, session):
+        with session.begin(subtransactions=True):
+            session.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            yield
+
+    def truncate(self, session):
+        session.execute('TRUNCATE midonet_tasks RESTART IDENTITY')
+        # The FLUSH task is inserted with the explicit ID 1.
+        session.execute("SELECT setval(pg_get_serial_sequence("
+                        "'midonet_tasks', 'id'), 1)")
+
+    def lock_for_claim(self, session, query):
+        # SKIP LOCKED needs PostgreSQL 9.5.
+        version = session.get_bind().dialect.server_version_info or ()
+        if version < (9, 5):
+            return query.with_for_update()
+        return query.suffix_with('FOR UPDATE SKIP LOCKED')
+
+
+class _SQLiteJournal(object):
+    """Journal locking on SQLite.
+
+    SQLite allows a single writer for the whole database, so both locks
+    are the same write lock.  Snapshot reads do not take it; they are not
+    isolated from concurrent writers, but the tasks replayed after a
+    snapshot import still bring the journal to the current state.
+    """
+
+    @contextlib.contextmanager
+    def read_locked(self, session):
+        with session.begin(subtransactions=True):
+            session.execute(_SQLITE_WRITE_LOCK)
+            yield
+
+    write_locked = read_locked
+
+    @contextlib.contextmanager
+    def snapshot(self, session):
+        with session.begin(subtransactions=True):
+            yield
+
+    def truncate(self, session):
+        session.execute('DELETE FROM midonet_tasks')
+
+    def lock_for_claim(self, session, query):
+        # There are no row locks; the write lock serializes the claims.
+        session.execute(_SQLITE_WRITE_LOCK)
+        return query
+
+
+_JOURNAL_DIALECTS = {'mysql': _MySQLJournal(),
+                     'postgresql': _PostgreSQLJournal(),
+                     'sqlite': _SQLiteJournal()}
+
+
+def _get_journal_dialect(session):
+    name = session.get_bind().dialect.name
+    try:
+        return _JOURNAL_DIALECTS[name]
+    except KeyError:
+        error_msg = _("Cluster operations are not supported on %s") % name
+        raise MidonetClusterException(msg=error_msg)
+
+
 class MidoClusterMixin(object):
 
     def _flush(self, context):
+        journal = _get_journal_dialect(context.session)
+        with journal.write_locked(context.session):
+            undispatched = context.session.query(Task).filter(
+                Task.dispatch_status.in_([DISPATCH_PENDING,
+                                          DISPATCH_RUNNING])).count()
+            if undispatched:
+                error_msg = (_("%d tasks are still waiting to be dispatched "
+                               "to the MidoNet API") % undispatched)
+                raise MidonetClusterException(msg=error_msg)
+
+            journal.truncate(context.session)
+            create_task(context, FLUSH, task_id=1)
+
+        # The task IDs start over, so every consumer starts over too.
+        with context.session.begin(subtransactions=True):
+            context.session.query(TaskConsumer).update({'watermark': 0})
+
+    def _iter_resources(self, context, data_type, collection):
+        """Yield every resource of a type, one page at a time."""
+        get_resources = getattr(self, 'get_%s' % collection)
+        if data_type not in _PAGINATED_RESOURCES:
+            for item in get_resources(context):
+                yield item
+            return
+
+        page_size = cfg.CONF.MIDONET.import_page_size
+        marker = None
+        while True:
+            page = get_resources(context, sorts=[('id', True)],
+                                 limit=page_size, marker=marker)
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                break
+            marker = page[-1]['id']
+
+    def _spool_resources(self, context, resources):
+        """Spool the CREATE task rows of the given resource types."""
+        spool = _TaskSpool()
         try:
-            context.session.execute('LOCK TABLES midonet_tasks WRITE')
-            with context.session.begin(subtransactions=True):
-                context.session.execute('TRUNCATE TABLE midonet_tasks')
-                create_task(context, FLUSH, task_id=1)
-        finally:
-            context.session.execute('UNLOCK TABLES')
+            for data_type, collection in resources:
+                for item in self._iter_resources(context, data_type,
+                                                 collection):
+                    spool.write(_make_task_row(
+                        context, CREATE, data_type=data_type,
+                        resource_id=item['id'], data=item))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                spool.close()
+        return spool
+
+    def _get_import_context(self, context):
+        """Return a context with its own DB session for an import reader."""
+        return n_context.Context(context.user_id, context.tenant_id,
+                                 is_admin=context.is_admin,
+                                 request_id=context.request_id,
+                                 overwrite=False)
+
+    def _spool_resources_in_worker(self, context, resource, snapshot=False):
+        worker_context = self._get_import_context(context)
+        session = worker_context.session
+        if snapshot:
+            with _get_journal_dialect(session).snapshot(session):
+                return self._spool_resources(worker_context, [resource])
+
+        with session.begin(subtransactions=True):
+            return self._spool_resources(worker_context, [resource])
+
+    def _spool_topology(self, context, snapshot=False):
+        """Spool the tasks describing the whole topology.
+
+        The topology is paged through and spooled to temporary files so
+        that memory use does not depend on the size of the deployment.
+        With more than one import worker, the resource types are read
+        concurrently by a bounded pool of workers, each with its own DB
+        session, and the spools are returned in the IMPORT_RESOURCES order
+        whatever order the workers finish in.
+
+        :param snapshot: Whether to read from consistent snapshots.  If
+                         not, the caller must hold the read lock.
+        :returns: The list of spools.
+        """
+        workers = cfg.CONF.MIDONET.import_workers
+        if workers <= 1:
+            if not snapshot:
+                return [self._spool_resources(context, IMPORT_RESOURCES)]
+
+            # A snapshot starts a transaction of its own.
+            snapshot_context = self._get_import_context(context)
+            session = snapshot_context.session
+            with _get_journal_dialect(session).snapshot(session):
+                return [self._spool_resources(snapshot_context,
+                                              IMPORT_RESOURCES)]
+
+        pool = eventlet.GreenPool(workers)
+        return list(pool.imap(
+            functools.partial(self._spool_resources_in_worker, context,
+                              snapshot=snapshot), IMPORT_RESOURCES))
 
     def _import(self, context):
+        if cfg.CONF.MIDONET.import_mode == IMPORT_MODE_SNAPSHOT:
+            self._import_snapshot(context)
+        else:
+            self._import_locked(context)
+
+    def _import_locked(self, context):
+        journal = _get_journal_dialect(context.session)
+        spools = []
         try:
-            # lock the entire database so we can take a snapshot of the
-            # data we need.
-            context.session.execute('FLUSH TABLES WITH READ LOCK')
-
-            database = collections.OrderedDict({
-                NETWORK: self.get_networks(context),
-                SUBNET: self.get_subnets(context),
-                PORT: self.get_ports(context),
-                ROUTER: self.get_routers(context),
-                FLOATING_IP: self.get_floatingips(context),
-                SECURITY_GROUP: self.get_security_groups(context),
-                SECURITY_GROUP_RULE: self.get_security_group_rules(context),
-                POOL: self.get_pools(context),
-                VIP: self.get_vips(context),
-                HEALTH_MONITOR: self.get_health_monitors(context),
-                MEMBER: self.get_members(context)})
-
-            # record how much items we have processed so far. We compare
-            # this to another count after we lock midonet_tasks to make
-            # sure nothing snuck in between the locks.
-            task_count = context.session.query(Task).count()
+            with journal.read_locked(context.session):
+                spools = self._spool_topology(context)
+
+                # record how much items we have processed so far. We
+                # compare this to another count after we lock midonet_tasks
+                # to make sure nothing snuck in between the locks.
+                task_count = context.session.query(Task).count()
+
+            with journal.write_locked(context.session):
+                with batch(context) as task_batch:
+                    if task_count != context.session.query(Task).count():
+                        error_msg = ("The database has been updated while "
+                                     "the rebuild operation is in progress")
+                        raise MidonetClusterException(msg=error_msg)
+
+                    for row in itertools.chain(*spools):
+                        task_batch.add(row)
         finally:
-            context.session.execute('UNLOCK TABLES')
+            for spool in spools:
+                spool.close()
+
+    def _replay_tasks(self, context, tail):
+        """Append copies of the tasks following a journal position."""
+        tasks = Task.__table__
+        query = sa.select([getattr(tasks.c, c) for c in _REPLAY_COLUMNS])
+        query = query.where(sa.and_(
+            tasks.c.id > tail,
+            tasks.c.type.in_([CREATE, UPDATE, PATCH, DELETE]),
+            tasks.c.transaction_id != context.request_id)).order_by(
+                tasks.c.id)
+        replayed = 0
+        with batch(context) as task_batch:
+            for row in context.session.execute(query).fetchall():
+                # The original task is the one the outbox dispatches.
+                task_batch.add(dict(zip(_REPLAY_COLUMNS, row),
+                                    dispatch_status=None))
+                replayed += 1
+        return replayed
+
+    def _import_snapshot(self, context):
+        """Import the topology without blocking writers.
+
+        The position of the journal is read under the write lock, so that
+        every task up to it is committed, and the topology is then read in
+        consistent-snapshot transactions while Neutron keeps writing.  The
+        snapshot is appended to the journal, followed by copies of every
+        task following the position, which include every change the
+        snapshot may have missed.  A consumer reading the journal in order
+        thus rebuilds the snapshot and re-applies the changes made since,
+        ending up in the current state.  Only the reading of the position
+        and the short replay hold a lock on the journal table.
+        """
+        session = context.session
+        journal = _get_journal_dialect(session)
+        with journal.write_locked(session):
+            tail = _get_journal_position(session)
+
+        spools = []
         try:
-            context.session.execute('LOCK TABLES midonet_tasks WRITE')
-            with context.session.begin(subtransactions=True):
-                if task_count != context.session.query(Task).count():
-                    error_msg = ("The database has been updated while the "
-                                 "rebuild operation is in progress")
-                    raise MidonetClusterException(msg=error_msg)
-
-                for key in database:
-                    for item in database[key]:
-                        create_task(context, CREATE, data_type=key,
-                                    resource_id=item['id'], data=item)
+            spools = self._spool_topology(context, snapshot=True)
+
+            LOG.info(_LI('Importing snapshot taken after task %d'), tail)
+            with batch(context) as task_batch:
+                for row in itertools.chain(*spools):
+                    task_batch.add(row)
         finally:
-            context.session.execute('UNLOCK TABLES')
+            for spool in spools:
+                spool.close()
+
+        with journal.write_locked(session):
+            replayed = self._replay_tasks(context, tail)
+        LOG.info(_LI('Replayed %d tasks written during the snapshot import'),
+                 replayed)
+
+    def _compact(self, context, watermark=None):
+        if watermark is not None:
+            watermark = int(watermark)
+        compact_tasks(context.session, watermark=watermark)
 
     def create_cluster(self, context, cluster):
         LOG.info(_LI('MidoClusterMixin.create_cluster called: cluster=%r'),
                  cluster)
 
         op = cluster['cluster']['op']
+        # The API controllers only validate a watermark given in the
+        # request, and leave it unspecified otherwise.
+        if not attributes.is_attr_set(cluster['cluster'].get('watermark')):
+            cluster['cluster']['watermark'] = None
         if op == OP_FLUSH:
             self._flush(context)
         elif op == OP_IMPORT:
             self._import(context)
+        elif op == OP_COMPACT:
+            self._compact(context, cluster['cluster']['watermark'])
 
         # Neutron assumes that any create_* call returns a dictionary. Even
         # though we do nothing with 'cluster', we still return it back to
@@ -175,3 +1576,22 @@ class MidoClusterMixin(object):
         LOG.info(_LI("MidoClusterMixin.create_cluster exiting: cluster=%r"),
                  cluster)
         return cluster
+
+    def _make_cluster_dict(self, lag, fields=None):
+        if fields:
+            return dict((k, v) for k, v in lag.items() if k in fields)
+        return lag
+
+    def get_clusters(self, context, filters=None, fields=None):
+        """Return the journal lag of every consumer of the journal."""
+        consumer_ids = (filters or {}).get('id')
+        return [self._make_cluster_dict(lag, fields)
+                for lag in get_journal_lag(context.session)
+                if not consumer_ids or lag['id'] in consumer_ids]
+
+    def get_cluster(self, context, id, fields=None):
+        """Return the journal lag of one consumer of the journal."""
+        lags = get_journal_lag(context.session, consumer_id=id)
+        if not lags:
+            raise TaskConsumerNotFound(consumer_id=id)
+        return self._make_cluster_dict(lags[0], fields)
@@ -0,0 +1,268 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+
+from oslo_config import cfg
+
+from midonet.neutron.common import fanout
+from midonet.neutron.db import task
+from neutron import context as n_context
+from neutron import i18n
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+
+
+LOG = logging.getLogger(__name__)
+_LE = i18n._LE
+_LW = i18n._LW
+
+# The names used for the resources by the MidoNet API client methods.
+API_RESOURCE_NAMES = {task.NETWORK: 'network',
+                      task.SUBNET: 'subnet',
+                      task.PORT: 'port',
+                      task.ROUTER: 'router',
+                      task.FLOATING_IP: 'floating_ip',
+                      task.SECURITY_GROUP: 'security_group',
+                      task.SECURITY_GROUP_RULE: 'security_group_rule',
+                      task.POOL: 'pool',
+                      task.VIP: 'vip',
+                      task.HEALTH_MONITOR: 'health_monitor',
+                      task.MEMBER: 'member'}
+
+# The API client methods adding and removing the associations between
+# resources, with the keys of the task data holding their arguments.
+API_ASSOCIATION_CALLS = {
+    task.ROUTER_INTERFACE: {
+        task.CREATE: ('add_router_interface',
+                      ('router_id', 'interface_info')),
+        task.DELETE: ('remove_router_interface',
+                      ('router_id', 'interface_info'))},
+    task.POOL_HEALTH_MONITOR: {
+        task.CREATE: ('create_pool_health_monitor',
+                      ('health_monitor', 'pool_id')),
+        task.DELETE: ('delete_pool_health_monitor',
+                      ('health_monitor_id', 'pool_id'))}}
+
+
+def _raise(ex):
+    raise ex
+
+
+class TaskDispatcher(object):
+    """Makes the MidoNet API calls of the tasks written in outbox mode.
+
+    Each of the dispatch_workers workers polls the journal every
+    dispatch_interval seconds and leases a batch of due tasks.  Every task
+    is turned into the create, update or delete call of its resource and
+    marked DONE, or scheduled for a retry if the call fails.  Workers in
+    other neutron-server processes lease disjoint batches from the same
+    journal.
+    """
+
+    def __init__(self, api_cli, on_failure=None, on_success=None):
+        """Initialize the dispatcher.
+
+        :param api_cli: The MidoNet API client making the calls.
+        :param on_failure: Called with an admin context and the task when a
+                           task is marked FAILED.
+        :param on_success: Called with an admin context and the task when a
+                           task is marked DONE.
+        """
+        self.api_cli = api_cli
+        self.on_failure = on_failure
+        self.on_success = on_success
+        self._loops = []
+
+    def start(self):
+        for index in range(cfg.CONF.MIDONET.dispatch_workers):
+            loop = loopingcall.FixedIntervalLoopingCall(self._poll, index)
+            loop.start(interval=cfg.CONF.MIDONET.dispatch_interval)
+            self._loops.append(loop)
+
+    def stop(self):
+        for loop in self._loops:
+            loop.stop()
+        self._loops = []
+
+    def get_owner(self, index=0):
+        """Return the lease owner name of a worker of this process."""
+        return '%s:%d:%d' % (socket.gethostname(), os.getpid(), index)
+
+    def _poll(self, index):
+        try:
+            self.dispatch_pending(n_context.get_admin_context(),
+                                  self.get_owner(index))
+        except Exception:
+            LOG.exception(_LE("Failed to dispatch the pending tasks"))
+
+    def _make_call(self, context, t):
+        """Return the API client method and arguments dispatching a task."""
+        if t.data_type in API_ASSOCIATION_CALLS:
+            name, keys = API_ASSOCIATION_CALLS[t.data_type][t.type]
+            data = task.get_task_data(t)
+            return (getattr(self.api_cli, name),
+                    tuple(data[key] for key in keys))
+        name = API_RESOURCE_NAMES[t.data_type]
+        if t.type == task.CREATE:
+            return (getattr(self.api_cli, 'create_' + name),
+                    (task.get_task_data(t),))
+        elif t.type == task.DELETE:
+            return getattr(self.api_cli, 'delete_' + name), (t.resource_id,)
+        if t.type == task.PATCH:
+            data = task.get_resource_data(context.session, t.data_type,
+                                          t.resource_id, upto=t.id)
+        else:
+            data = task.get_task_data(t)
+        return getattr(self.api_cli, 'update_' + name), (t.resource_id, data)
+
+    def _call_api(self, call):
+        """Make the call of a task.
+
+        :returns: The error of the call, or None once it succeeded.
+        """
+        _t, method, args = call
+        if method is None:
+            return None
+        try:
+            method(*args)
+        except Exception as ex:
+            return ex
+        return None
+
+    def _handle_failure(self, context, t, owner, ex):
+        LOG.warn(_LW("Failed to dispatch task %(id)s (%(type)s "
+                     "%(data_type)s %(resource_id)s): %(err)s"),
+                 {'id': t.id, 'type': t.type, 'data_type': t.data_type,
+                  'resource_id': t.resource_id, 'err': ex})
+        if task.fail_task(context.session, t, owner, ex):
+            LOG.error(_LE("Giving up dispatching task %s"), t.id)
+            if self.on_failure is not None:
+                self.on_failure(context, t)
+
+    def _complete_task(self, context, t, owner):
+        task.complete_task(context.session, t, owner)
+        if self.on_success is not None:
+            self.on_success(context, t)
+
+    def _get_stale_task_ids(self, tasks):
+        """Return the IDs of the updates superseded by a later task.
+
+        An UPDATE or PATCH is stale when a task of a later revision of the
+        resource, replacing or deleting it as a whole, is in the same batch.
+        """
+        stale = set()
+        latest = {}
+        for t in reversed(tasks):
+            if t.revision is None:
+                continue
+            resource = (t.data_type, t.resource_id)
+            if (t.type in (task.UPDATE, task.PATCH) and
+                    t.revision < latest.get(resource, t.revision)):
+                stale.add(t.id)
+            if t.type in (task.UPDATE, task.DELETE):
+                latest[resource] = max(t.revision,
+                                       latest.get(resource, t.revision))
+        return stale
+
+    def _get_levels(self, calls):
+        """Split the calls of a batch into levels of unrelated tasks.
+
+        A task is put one level below every earlier task of the batch of
+        its resource, of the resource it depends on and of the resources
+        depending on it, so that the levels dispatched in turn keep the
+        related tasks in journal order.  The tasks of a level are unrelated
+        to each other.
+        """
+        levels = []
+        resource_levels = {}
+        child_levels = {}
+        for call in calls:
+            t = call[0]
+            level = 1 + max(resource_levels.get(t.resource_id, -1),
+                            resource_levels.get(t.parent_id, -1),
+                            child_levels.get(t.resource_id, -1))
+            resource_levels[t.resource_id] = level
+            if t.parent_id:
+                child_levels[t.parent_id] = max(
+                    level, child_levels.get(t.parent_id, -1))
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(call)
+        return levels
+
+    def dispatch_pending(self, context, owner=None):
+        """Lease a batch of due tasks and dispatch them.
+
+        The batch is dispatched a level of unrelated tasks at a time, the
+        calls of a level being made concurrently, up to
+        api_fanout_concurrency at a time.  The tasks of a resource and of
+        the resources related to it are thus dispatched in journal order,
+        and the ones following a failed task are left for a later poll.
+        The updates superseded by a later task of the batch are completed
+        without calling the API.  The outcome of the calls is recorded from
+        the green thread of the worker alone.
+
+        :returns: The number of tasks dispatched successfully.
+        """
+        owner = owner or self.get_owner()
+        leased = task.claim_tasks(context.session, owner,
+                                  limit=cfg.CONF.MIDONET.dispatch_batch_size)
+        stale = self._get_stale_task_ids(leased)
+        calls = []
+        for t in leased:
+            if t.id in stale:
+                LOG.debug("Skipping stale task %(id)s of revision "
+                          "%(revision)s", {'id': t.id,
+                                           'revision': t.revision})
+                calls.append((t, None, None))
+            else:
+                try:
+                    calls.append((t,) + self._make_call(context, t))
+                except Exception as ex:
+                    # Fail the task like a failed call.
+                    calls.append((t, _raise, (ex,)))
+
+        dispatched = 0
+        released = []
+        blocked = set()
+        blocked_parents = set()
+        for level in self._get_levels(calls):
+            runnable = []
+            for call in level:
+                t = call[0]
+                if (t.resource_id in blocked or t.parent_id in blocked or
+                        t.resource_id in blocked_parents):
+                    # Keep the tasks following a failure for a later poll.
+                    released.append(t.id)
+                    blocked.add(t.resource_id)
+                    if t.parent_id:
+                        blocked_parents.add(t.parent_id)
+                else:
+                    runnable.append(call)
+            results = fanout.fan_out(self._call_api, runnable)
+            for call, (ex, _exc_info) in zip(runnable, results):
+                t = call[0]
+                if ex is None:
+                    self._complete_task(context, t, owner)
+                    dispatched += 1
+                else:
+                    self._handle_failure(context, t, owner, ex)
+                    blocked.add(t.resource_id)
+                    if t.parent_id:
+                        blocked_parents.add(t.parent_id)
+        task.release_tasks(context.session, released, owner)
+        return dispatched
@@ -19,6 +19,7 @@ from neutron.api import extensions
 from neutron.api.v2 import base
 from neutron.common import exceptions as nexception
 from neutron import manager
+from oslo_config import cfg
 import six
 
 
@@ -83,7 +84,9 @@ class Agent_membership(extensions.ExtensionDescriptor):
         collection_name = AGENT_MEMBERSHIPS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         agent_membership_controller = base.create_resource(
-            collection_name, resource_name, plugin, params)
+            collection_name, resource_name, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name,
                                           agent_membership_controller)
         exts.append(ex)
@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -101,7 +102,9 @@ class Bgp(object):
         collection_name = BGPS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         bgp_controller = base.create_resource(
-            collection_name, resource_name, plugin, params)
+            collection_name, resource_name, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, bgp_controller)
         exts.append(ex)
 
@@ -110,7 +113,9 @@ class Bgp(object):
         collection_name = ADROUTES
         ad_route_params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         ad_route_controller = base.create_resource(
-            collection_name, resource_name, plugin, ad_route_params)
+            collection_name, resource_name, plugin, ad_route_params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, ad_route_controller)
         exts.append(ex)
 
@@ -14,6 +14,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -76,7 +77,9 @@ class Bridge(extensions.ExtensionDescriptor):
         collection_name = BRIDGES
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         controller = base.create_resource(
-            collection_name, BRIDGE, plugin, params)
+            collection_name, BRIDGE, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, controller)
         exts.append(ex)
 
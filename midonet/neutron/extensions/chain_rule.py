@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -281,7 +282,9 @@ class Chain_rule(object):
         collection_name = CHAINS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         chain_controller = base.create_resource(
-            collection_name, CHAIN, plugin, params)
+            collection_name, CHAIN, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, chain_controller)
         exts.append(ex)
 
@@ -289,7 +292,9 @@ class Chain_rule(object):
         collection_name = RULES
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         rule_controller = base.create_resource(
-            collection_name, RULE, plugin, params)
+            collection_name, RULE, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, rule_controller)
         exts.append(ex)
 
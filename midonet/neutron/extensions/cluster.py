@@ -16,6 +16,7 @@
 import abc
 
 from neutron.api import extensions
+from neutron.api.v2 import attributes as attr
 from neutron.api.v2 import base
 from neutron import manager
 
@@ -26,12 +27,22 @@ CLUSTERS = '%ss' % CLUSTER
 
 RESOURCE_ATTRIBUTE_MAP = {
     CLUSTERS: {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
         'tenant_id': {'allow_post': True, 'allow_put': False,
                       'validate': {'type:string': None},
                       'is_visible': True, 'default': None},
         'op': {'allow_post': True, 'allow_put': False,
-               'validate': {'type:values': ['FLUSH', 'IMPORT']},
+               'validate': {'type:values': ['FLUSH', 'IMPORT', 'COMPACT']},
                'is_visible': True, 'default': None},
+        'watermark': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:non_negative': None},
+                      'is_visible': True,
+                      'default': attr.ATTR_NOT_SPECIFIED},
+        'tasks_behind': {'allow_post': False, 'allow_put': False,
+                         'is_visible': True},
+        'oldest_unconsumed_age': {'allow_post': False, 'allow_put': False,
+                                  'is_visible': True},
     }
 }
 
@@ -78,3 +89,11 @@ class ClusterPluginBase(object):
     @abc.abstractmethod
     def create_cluster(self, context, cluster):
         pass
+
+    @abc.abstractmethod
+    def get_clusters(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_cluster(self, context, id, fields=None):
+        pass
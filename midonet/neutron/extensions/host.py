@@ -17,6 +17,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -31,6 +32,9 @@ HOST = 'host'
 HOSTS = '%ss' % HOST
 HOST_INTERFACE = 'host_interfaces'
 HOST_INTERFACES = '%ss' % HOST_INTERFACE
+# The names of the host interfaces sub-resource of a host.
+HOST_INTERFACE_MEMBER = 'host_interface'
+HOST_INTERFACE_COLLECTION = '%ss' % HOST_INTERFACE_MEMBER
 
 HOST_INTERFACE_ATTRIBUTE_MAP = {
     'host_id': {'allow_post': False, 'allow_put': False,
@@ -80,11 +84,13 @@ RESOURCE_ATTRIBUTE_MAP = {
                                   'is_visible': True, 'default': False},
         'version': {'allow_post': False, 'allow_put': False,
                     'is_visible': True},
+        # Only read when it is listed in the fields of the request.
         'host_interfaces': {'allow_post': False, 'allow_put': False,
                             'is_visible': True, 'default': [],
                             'type:list_of_host_interfaces_or_none':
                             HOST_INTERFACE_ATTRIBUTE_MAP}
-    }
+    },
+    HOST_INTERFACE_COLLECTION: HOST_INTERFACE_ATTRIBUTE_MAP
 }
 
 
@@ -132,14 +138,27 @@ class Host(object):
         resource_name = HOST
         collection_name = HOSTS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
-        controller_host = base.create_resource(collection_name,
-                                               resource_name,
-                                               plugin,
-                                               params)
+        controller_host = base.create_resource(
+            collection_name, resource_name, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
 
         ex = extensions.ResourceExtension(collection_name, controller_host)
+        exts = [ex]
 
-        return [ex]
+        # host interfaces
+        parent = dict(member_name=HOST,
+                      collection_name=HOSTS)
+        collection_name = HOST_INTERFACE_COLLECTION
+        params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
+        controller_host_interface = base.create_resource(
+            collection_name, HOST_INTERFACE_MEMBER, plugin, params,
+            parent=parent)
+        ex = extensions.ResourceExtension(
+            collection_name, controller_host_interface, parent=parent)
+        exts.append(ex)
+
+        return exts
 
     def update_attributes_map(self, attributes):
         for resource_map, attrs in RESOURCE_ATTRIBUTE_MAP.iteritems():
@@ -172,3 +191,12 @@ class HostPluginBase(object):
     @abc.abstractmethod
     def get_hosts(self, context, filters=None, fields=None):
         pass
+
+
+@six.add_metaclass(abc.ABCMeta)
+class HostInterfacePluginBase(object):
+
+    @abc.abstractmethod
+    def get_host_host_interfaces(self, context, host_id, filters=None,
+                                 fields=None):
+        pass
@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -87,7 +88,9 @@ class Ip_addr_group(object):
         collection_name = IP_ADDR_GROUPS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         ip_addr_group_controller = base.create_resource(
-            collection_name, IP_ADDR_GROUP, plugin, params)
+            collection_name, IP_ADDR_GROUP, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(
             collection_name, ip_addr_group_controller)
         exts.append(ex)
@@ -96,7 +99,9 @@ class Ip_addr_group(object):
         collection_name = IP_ADDR_GROUP_ADDRS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         ip_addr_group_addr_controller = base.create_resource(
-            collection_name, IP_ADDR_GROUP_ADDR, plugin, params)
+            collection_name, IP_ADDR_GROUP_ADDR, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(
             collection_name, ip_addr_group_addr_controller)
         exts.append(ex)
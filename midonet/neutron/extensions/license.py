@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -93,7 +94,9 @@ class License(object):
         collection_name = LICENSES
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         controller = base.create_resource(
-            collection_name, resource_name, plugin, params)
+            collection_name, resource_name, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, controller)
         exts.append(ex)
 
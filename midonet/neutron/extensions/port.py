@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -136,7 +137,9 @@ class Port(object):
         collection_name = PORTS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         controller = base.create_resource(
-            collection_name, resource_name, plugin, params)
+            collection_name, resource_name, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, controller)
         exts.append(ex)
 
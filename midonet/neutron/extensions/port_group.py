@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -90,7 +91,9 @@ class Port_group(object):
         collection_name = PORT_GROUPS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         port_group_controller = base.create_resource(
-            collection_name, PORT_GROUP, plugin, params)
+            collection_name, PORT_GROUP, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(
             collection_name, port_group_controller)
         exts.append(ex)
@@ -99,7 +102,9 @@ class Port_group(object):
         collection_name = PORT_GROUP_PORTS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         port_group_port_controller = base.create_resource(
-            collection_name, PORT_GROUP_PORT, plugin, params)
+            collection_name, PORT_GROUP_PORT, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(
             collection_name, port_group_port_controller)
         exts.append(ex)
@@ -14,6 +14,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -79,8 +80,10 @@ class Router(extensions.ExtensionDescriptor):
         plugin = manager.NeutronManager.get_plugin()
         collection_name = ROUTERS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
-        controller_host = base.create_resource(collection_name, ROUTER, plugin,
-                                               params)
+        controller_host = base.create_resource(
+            collection_name, ROUTER, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
 
         ex = extensions.ResourceExtension(collection_name, controller_host)
         exts.append(ex)
@@ -15,6 +15,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -95,10 +96,10 @@ class Routing_table(object):
         resource_name = ROUTE
         collection_name = ROUTES
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
-        controller_host = base.create_resource(collection_name,
-                                               resource_name,
-                                               plugin,
-                                               params)
+        controller_host = base.create_resource(
+            collection_name, resource_name, plugin, params,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
 
         ex = extensions.ResourceExtension(collection_name, controller_host)
         exts.append(ex)
@@ -14,6 +14,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -124,7 +125,9 @@ class Subnet(extensions.ExtensionDescriptor):
         collection_name = SUBNETS
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         subnet_controller = base.create_resource(
-            collection_name, SUBNET, plugin, params, allow_bulk=True)
+            collection_name, SUBNET, plugin, params, allow_bulk=True,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, subnet_controller)
         exts.append(ex)
 
@@ -135,7 +138,9 @@ class Subnet(extensions.ExtensionDescriptor):
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
         host_controller = base.create_resource(
             collection_name, DHCP_HOST, plugin, params,
-            parent=parent, allow_bulk=True)
+            parent=parent, allow_bulk=True,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(
             collection_name, host_controller, parent=parent)
         exts.append(ex)
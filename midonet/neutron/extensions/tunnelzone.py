@@ -16,6 +16,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 from neutron.api import extensions
@@ -97,8 +98,10 @@ class Tunnelzone(extensions.ExtensionDescriptor):
         resource_name = TUNNELZONE
         collection_name = TUNNELZONES
         params = RESOURCE_ATTRIBUTE_MAP.get(collection_name, dict())
-        controller = base.create_resource(collection_name, resource_name,
-                                          plugin, params, allow_bulk=False)
+        controller = base.create_resource(
+            collection_name, resource_name, plugin, params, allow_bulk=False,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         ex = extensions.ResourceExtension(collection_name, controller)
         exts.append(ex)
 
@@ -114,7 +117,9 @@ class Tunnelzone(extensions.ExtensionDescriptor):
         tunnelzonehost_controller = base.create_resource(
             collection_name, resource_name,
             tunnelzone_plugin, params,
-            parent=parent, allow_bulk=True)
+            parent=parent, allow_bulk=True,
+            allow_pagination=cfg.CONF.allow_pagination,
+            allow_sorting=cfg.CONF.allow_sorting)
         tunnelzonehost_extension = extensions.ResourceExtension(
             collection_name, tunnelzonehost_controller, parent=parent)
         exts.append(tunnelzonehost_extension)
@@ -17,17 +17,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
+
 from oslo_config import cfg
-from oslo_db import exception as db_exc
 from oslo_utils import excutils
 from oslo_utils import importutils
 
 from midonet.neutron import api
+from midonet.neutron.common import cache
+from midonet.neutron.common import client_pool
+from midonet.neutron.common import fanout
 from midonet.neutron.common import util
 from midonet.neutron.db import db_agent_membership as db_am
 from midonet.neutron.db import db_util
 from midonet.neutron.db import routedserviceinsertion_db as rsi_db
 from midonet.neutron.db import task
+from midonet.neutron import dispatcher
 from midonet.neutron import extensions
 from midonet.neutron.extensions import routedserviceinsertion as rsi
 from midonetclient import client
@@ -39,13 +44,14 @@ from neutron.common import constants as n_const
 from neutron.common import exceptions as n_exc
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
-from neutron.common import utils
 from neutron.db import agents_db
 from neutron.db import agentschedulers_db
 import neutron.db.api as db
 from neutron.db import db_base_plugin_v2
 from neutron.db import external_net_db
+from neutron.db import l3_db
 from neutron.db import l3_gwmode_db
+from neutron.db import models_v2
 from neutron.db import portbindings_db
 from neutron.db import securitygroups_db
 from neutron.extensions import portbindings
@@ -63,6 +69,35 @@ cfg.CONF.register_opts([cfg.StrOpt('tunnel_protocol', default='vxlan',
                                    help=_('tunnel protocol used by Midonet'))],
                        'MIDONET')
 
+# The models of the resources with a status, which is set to ERROR when the
+# outbox worker gives up dispatching a change of the resource.
+_STATUS_MODELS = {task.NETWORK: models_v2.Network,
+                  task.PORT: models_v2.Port,
+                  task.ROUTER: l3_db.Router,
+                  task.FLOATING_IP: l3_db.FloatingIP,
+                  task.POOL: loadbalancer_db.Pool,
+                  task.VIP: loadbalancer_db.Vip,
+                  task.MEMBER: loadbalancer_db.Member}
+
+# The models of the resources whose status stays PENDING_CREATE or
+# PENDING_UPDATE until the outbox worker has dispatched their change.
+_PENDING_STATUS_MODELS = {task.POOL: loadbalancer_db.Pool,
+                          task.VIP: loadbalancer_db.Vip,
+                          task.MEMBER: loadbalancer_db.Member}
+
+# The cached MidoNet API responses changed by the Neutron port writes, and
+# by the router writes, which change the router ports and their routes.
+_PORT_CACHE_ALIASES = (api.PortHandlerMixin.ALIAS,)
+_ROUTER_CACHE_ALIASES = (api.PortHandlerMixin.ALIAS,
+                         api.RoutingTableHandlerMixin.ALIAS)
+
+
+def _create_client(uri):
+    """Create a MidoNet API client for an endpoint."""
+    conf = cfg.CONF.MIDONET
+    return client.MidonetClient(uri, conf.username, conf.password,
+                                project_id=conf.project_id)
+
 
 class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                    portbindings_db.PortBindingMixin,
@@ -102,13 +137,19 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         # Instantiate MidoNet API client
         conf = cfg.CONF.MIDONET
         neutron_extensions.append_api_extensions_path(extensions.__path__)
-        self.api_cli = client.MidonetClient(conf.midonet_uri, conf.username,
-                                            conf.password,
-                                            project_id=conf.project_id)
+        self.api_cli = client_pool.MidonetEndpointBalancer(
+            conf.midonet_uris or [conf.midonet_uri], _create_client)
+        if len(self.api_cli.endpoints) > 1:
+            self.api_cli.start_health_check()
 
         self.setup_rpc()
         task.create_config_task(db.get_session(), dict(conf))
 
+        if task.is_outbox_enabled():
+            self.dispatcher = dispatcher.TaskDispatcher(
+                self.api_cli, on_failure=self._set_resource_error,
+                on_success=self._set_resource_active)
+
         self.base_binding_dict = {
             portbindings.VIF_TYPE: portbindings.VIF_TYPE_MIDONET,
             portbindings.VNIC_TYPE: portbindings.VNIC_NORMAL,
@@ -120,6 +161,14 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             cfg.CONF.network_scheduler_driver
         )
 
+        # The API controllers look for native bulk support under the name
+        # mangled for the class of the plugin.  It holds for every resource
+        # allowing bulk requests, so each of them has a *_bulk method
+        # undoing its MidoNet changes.  Pagination and sorting are left to
+        # the controllers, since the MidoNet API offers no paged lists.
+        setattr(self, '_%s__native_bulk_support' % self.__class__.__name__,
+                True)
+
     def setup_rpc(self):
         # RPC support
         self.topic = topics.PLUGIN
@@ -131,6 +180,100 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         # Consume from all consumers in a thread
         self.conn.consume_in_threads()
 
+    def start_rpc_listeners(self):
+        """Start the outbox dispatcher in a neutron-server RPC worker.
+
+        The plugin is loaded before neutron-server forks its workers, and
+        a dispatcher started with it would have its threads and DB
+        connections copied into every worker.  Neutron calls this method
+        once per RPC worker after the fork, or once in the server process
+        when it has no RPC workers.
+        """
+        if task.is_outbox_enabled():
+            self.dispatcher.start()
+        return []
+
+    def _call_api(self, method, *args):
+        """Call the MidoNet API, unless the outbox worker does it later.
+
+        In outbox mode the task written to the journal in the same
+        transaction is all that is needed: the call is made from it once
+        the transaction has committed.
+        """
+        if not task.is_outbox_enabled():
+            method(*args)
+
+    def _create_bulk_in_midonet(self, resource, items):
+        """Create resources in MidoNet, removing them all if one fails.
+
+        Called within the transaction creating the resources in Neutron, so
+        that a failure rolls it back too.  The calls are made concurrently.
+        """
+        if task.is_outbox_enabled():
+            return
+        create = getattr(self.api_cli, 'create_' + resource)
+        results = fanout.fan_out(create, items)
+        failed = [(item, exc_info) for item, (_r, exc_info)
+                  in zip(items, results) if exc_info is not None]
+        if not failed:
+            return
+        item, exc_info = failed[0]
+        LOG.error(_LE("Failed to create a %(resource)s %(id)s in Midonet, "
+                      "rolling back the bulk request: %(err)s"),
+                  {'resource': resource, 'id': item['id'],
+                   'err': exc_info[1]})
+        self._delete_bulk_in_midonet(
+            resource, [item['id'] for item, (_r, exc_info)
+                       in zip(items, results) if exc_info is None])
+        fanout.raise_first_error(results)
+
+    def _delete_bulk_in_midonet(self, resource, ids):
+        """Delete resources from MidoNet concurrently, logging failures."""
+        if task.is_outbox_enabled():
+            return
+        delete = getattr(self.api_cli, 'delete_' + resource)
+        results = fanout.fan_out(delete, ids)
+        for item_id, (_result, exc_info) in zip(ids, results):
+            if exc_info is not None:
+                LOG.error(_LE("Failed to delete %(resource)s %(id)s from "
+                              "Midonet: %(err)s"),
+                          {'resource': resource, 'id': item_id,
+                           'err': exc_info[1]})
+
+    def _set_resource_error(self, context, t):
+        """Mark a resource whose change could not be dispatched."""
+        model = _STATUS_MODELS.get(t.data_type)
+        if model is None or t.type == task.DELETE:
+            return
+        with context.session.begin(subtransactions=True):
+            context.session.query(model).filter_by(
+                id=t.resource_id).update({'status': constants.ERROR})
+
+    def _set_resource_active(self, context, t):
+        """Mark a resource whose last journaled change was dispatched."""
+        model = _PENDING_STATUS_MODELS.get(t.data_type)
+        if model is None or t.type == task.DELETE:
+            return
+        with context.session.begin(subtransactions=True):
+            if task.get_dispatch_status(context.session, t.data_type,
+                                        t.resource_id) != task.DISPATCH_DONE:
+                return
+            context.session.query(model).filter_by(
+                id=t.resource_id).update({'status': constants.ACTIVE})
+
+    def _set_dispatch_status(self, context, model, resource, pending):
+        """Set the status of a resource whose change was just journaled.
+
+        The resource is ACTIVE once its change reached MidoNet, so at once
+        when the API is called synchronously, and it is left in the pending
+        status until the outbox worker dispatches the change otherwise.
+        """
+        if task.is_outbox_enabled():
+            resource['status'] = pending
+        else:
+            resource['status'] = constants.ACTIVE
+        self.update_status(context, model, resource['id'], resource['status'])
+
     def _process_create_network(self, context, network):
 
         net_data = network['network']
@@ -140,9 +283,9 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             net = super(MidonetMixin, self).create_network(context, network)
+            self._process_l3_create(context, net, net_data)
             task.create_task(context, task.CREATE, data_type=task.NETWORK,
                              resource_id=net['id'], data=net)
-            self._process_l3_create(context, net, net_data)
 
         return net
 
@@ -158,7 +301,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         net = self._process_create_network(context, network)
 
         try:
-            self.api_cli.create_network(net)
+            self._call_api(self.api_cli.create_network, net)
         except Exception as ex:
             LOG.error(_LE("Failed to create a network %(net_id)s in Midonet:"
                           "%(err)s"), {"net_id": net["id"], "err": ex})
@@ -168,6 +311,26 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.info(_LI("MidonetMixin.create_network exiting: net=%r"), net)
         return net
 
+    @util.handle_api_error
+    def create_network_bulk(self, context, networks):
+        """Create several Neutron networks and their MidoNet bridges.
+
+        The networks are created in a single transaction, and either all of
+        them or none are.
+        """
+        LOG.info(_LI('MidonetMixin.create_network_bulk called: '
+                     'networks=%r'), networks)
+
+        with context.session.begin(subtransactions=True):
+            with task.batch(context):
+                nets = [self._process_create_network(context, network)
+                        for network in networks['networks']]
+            self._create_bulk_in_midonet('network', nets)
+
+        LOG.info(_LI("MidonetMixin.create_network_bulk exiting: nets=%r"),
+                 nets)
+        return nets
+
     @util.handle_api_error
     def update_network(self, context, id, network):
         """Update Neutron network.
@@ -181,37 +344,36 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             net = super(MidonetMixin, self).update_network(
                 context, id, network)
+            self._process_l3_update(context, net, network['network'])
             task.create_task(context, task.UPDATE, data_type=task.NETWORK,
                              resource_id=id, data=net)
-
-            self._process_l3_update(context, net, network['network'])
-            self.api_cli.update_network(id, net)
+            self._call_api(self.api_cli.update_network, id, net)
 
         LOG.info(_LI("MidonetMixin.update_network exiting: net=%r"), net)
         return net
 
     @util.handle_api_error
-    @utils.synchronized('midonet-network-lock', external=True)
-    @util.retry_on_error(2, 1, db_exc.DBError)
+    @util.retry_on_db_error
     def delete_network(self, context, id):
         """Delete a network and its corresponding MidoNet bridge.
 
-        This method is wrapped by 'retry_on_error' decorator because concurrent
-        requests to the API server often causes DB deadlock error because
-        eventlet green threads do not yield properly when they block inside
-        the transaction.  This hack should no longer become available once
-        we moved to the model where API requests are asynchronous or when
+        This method is wrapped by 'retry_on_db_error' decorator because
+        concurrent requests to the API server often causes DB deadlock error
+        because eventlet green threads do not yield properly when they block
+        inside the transaction.  This hack should no longer become available
+        once we moved to the model where API requests are asynchronous or when
         eventlet-compatible mysqlconnector is used for the DB driver instead.
         """
         LOG.info(_LI("MidonetMixin.delete_network called: id=%r"), id)
 
         with context.session.begin(subtransactions=True):
+            revision = task.get_revision(context.session, task.NETWORK, id)
             self._process_l3_delete(context, id)
             task.create_task(context, task.DELETE, data_type=task.NETWORK,
-                             resource_id=id)
+                             resource_id=id, revision=revision)
             super(MidonetMixin, self).delete_network(context, id)
 
-            self.api_cli.delete_network(id)
+            self._call_api(self.api_cli.delete_network, id)
 
         LOG.info(_LI("MidonetMixin.delete_network exiting: id=%r"), id)
 
@@ -228,7 +390,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                          resource_id=sn_entry['id'], data=sn_entry)
 
         try:
-            self.api_cli.create_subnet(sn_entry)
+            self._call_api(self.api_cli.create_subnet, sn_entry)
         except Exception as ex:
             LOG.error(_LE("Failed to create a subnet %(s_id)s in Midonet:"
                           "%(err)s"), {"s_id": sn_entry["id"], "err": ex})
@@ -240,6 +402,33 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                  sn_entry)
         return sn_entry
 
+    @util.handle_api_error
+    def create_subnet_bulk(self, context, subnets):
+        """Create several Neutron subnets and their DHCP entries in MidoNet.
+
+        The subnets are created in a single transaction, and either all of
+        them or none are.
+        """
+        LOG.info(_LI("MidonetMixin.create_subnet_bulk called: "
+                     "subnets=%r"), subnets)
+
+        with context.session.begin(subtransactions=True):
+            with task.batch(context):
+                sn_entries = []
+                for subnet in subnets['subnets']:
+                    sn_entry = super(MidonetMixin, self).create_subnet(
+                        context, subnet)
+                    task.create_task(context, task.CREATE,
+                                     data_type=task.SUBNET,
+                                     resource_id=sn_entry['id'],
+                                     data=sn_entry)
+                    sn_entries.append(sn_entry)
+            self._create_bulk_in_midonet('subnet', sn_entries)
+
+        LOG.info(_LI("MidonetMixin.create_subnet_bulk exiting: "
+                     "sn_entries=%r"), sn_entries)
+        return sn_entries
+
     @util.handle_api_error
     def delete_subnet(self, context, id):
         """Delete Neutron subnet.
@@ -252,7 +441,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_subnet(context, id)
             task.create_task(context, task.DELETE, data_type=task.SUBNET,
                              resource_id=id)
-            self.api_cli.delete_subnet(id)
+            self._call_api(self.api_cli.delete_subnet, id)
 
         LOG.info(_LI("MidonetMixin.delete_subnet exiting"))
 
@@ -266,7 +455,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             s = super(MidonetMixin, self).update_subnet(context, id, subnet)
             task.create_task(context, task.UPDATE, data_type=task.SUBNET,
                              resource_id=id, data=s)
-            self.api_cli.update_subnet(id, s)
+            self._call_api(self.api_cli.update_subnet, id, s)
 
         return s
 
@@ -276,8 +465,6 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             # Create a Neutron port
             new_port = super(MidonetMixin, self).create_port(context, port)
-            task.create_task(context, task.CREATE, data_type=task.PORT,
-                             resource_id=new_port['id'], data=new_port)
 
             # Make sure that the port created is valid
             if "id" not in new_port:
@@ -294,19 +481,44 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
 
             self._process_portbindings_create_and_update(context, port_data,
                                                          new_port)
+            task.create_task(context, task.CREATE, data_type=task.PORT,
+                             resource_id=new_port['id'], data=new_port)
 
         return new_port
 
+    def _ensure_network_exists(self, context, net_id):
+        """Read the network of a new port, keeping it until commit.
+
+        The row is read with a shared lock, so a concurrent deletion of the
+        network waits for the port to be committed, and the port creation
+        fails if the network is already gone.  Ports created concurrently
+        on the network do not conflict with each other.
+        """
+        network = context.session.query(models_v2.Network.id).filter_by(
+            id=net_id).with_for_update(read=True).first()
+        if network is None:
+            raise n_exc.NetworkNotFound(net_id=net_id)
+
+    @cache.invalidating(*_PORT_CACHE_ALIASES)
     @util.handle_api_error
-    @utils.synchronized('midonet-port-lock', external=True)
+    @util.retry_on_db_error
     def create_port(self, context, port):
-        """Create a L2 port in Neutron/MidoNet."""
+        """Create a L2 port in Neutron/MidoNet.
+
+        The port is journaled at the first revision of its own, and its
+        network is guarded against a concurrent deletion.  Each attempt
+        works on a copy of the request, as _process_create_port fills it
+        in and a retry has to start from the original one.
+        """
         LOG.info(_LI("MidonetMixin.create_port called: port=%r"), port)
+        port = copy.deepcopy(port)
 
-        new_port = self._process_create_port(context, port)
+        with context.session.begin(subtransactions=True):
+            self._ensure_network_exists(context, port['port']['network_id'])
+            new_port = self._process_create_port(context, port)
 
         try:
-            self.api_cli.create_port(new_port)
+            self._call_api(self.api_cli.create_port, new_port)
         except Exception as ex:
             LOG.error(_LE("Failed to create a port %(new_port)s: %(err)s"),
                       {"new_port": new_port, "err": ex})
@@ -317,23 +529,51 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.info(_LI("MidonetMixin.create_port exiting: port=%r"), new_port)
         return new_port
 
+    @cache.invalidating(*_PORT_CACHE_ALIASES)
     @util.handle_api_error
-    @utils.synchronized('midonet-port-lock', external=True)
-    @util.retry_on_error(2, 1, db_exc.DBError)
+    @util.retry_on_db_error
+    def create_port_bulk(self, context, ports):
+        """Create several L2 ports in Neutron/MidoNet.
+
+        The ports are created in a single transaction, and either all of
+        them or none are.  Each of their networks is guarded once, and each
+        attempt works on a copy of the request, as in create_port.
+        """
+        LOG.info(_LI("MidonetMixin.create_port_bulk called: ports=%r"),
+                 ports)
+        ports = copy.deepcopy(ports)
+
+        with context.session.begin(subtransactions=True):
+            for net_id in sorted(set(port['port']['network_id']
+                                     for port in ports['ports'])):
+                self._ensure_network_exists(context, net_id)
+            with task.batch(context):
+                new_ports = [self._process_create_port(context, port)
+                             for port in ports['ports']]
+            self._create_bulk_in_midonet('port', new_ports)
+
+        LOG.info(_LI("MidonetMixin.create_port_bulk exiting: ports=%r"),
+                 new_ports)
+        return new_ports
+
+    @util.handle_api_error
+    @util.retry_on_db_error
     def _process_port_delete(self, context, id):
         """Delete the Neutron and MidoNet ports
 
-        This method is wrapped by 'retry_on_error' decorator.  See the
+        This method is wrapped by 'retry_on_db_error' decorator.  See the
         explanation in the 'delete_network' comment.
         """
         with context.session.begin(subtransactions=True):
+            revision = task.get_revision(context.session, task.PORT, id)
             super(MidonetMixin, self).disassociate_floatingips(
                 context, id, do_notify=False)
             super(MidonetMixin, self).delete_port(context, id)
             task.create_task(context, task.DELETE, data_type=task.PORT,
-                             resource_id=id)
-            self.api_cli.delete_port(id)
+                             resource_id=id, revision=revision)
+            self._call_api(self.api_cli.delete_port, id)
 
+    @cache.invalidating(*_PORT_CACHE_ALIASES)
     def delete_port(self, context, id, l3_port_check=True):
         """Delete a neutron port and corresponding MidoNet bridge port."""
         LOG.info(_LI("MidonetMixin.delete_port called: id=%(id)s "
@@ -359,6 +599,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             sg_ids = self._get_security_groups_on_port(context, in_port)
             self._process_port_create_security_group(context, out_port, sg_ids)
 
+    @cache.invalidating(*_PORT_CACHE_ALIASES)
     @util.handle_api_error
     def update_port(self, context, id, port):
         """Handle port update, including security groups and fixed IPs."""
@@ -368,13 +609,13 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
 
             # update the port DB
             p = super(MidonetMixin, self).update_port(context, id, port)
-            task.create_task(context, task.UPDATE, data_type=task.PORT,
-                             resource_id=id, data=p)
 
             self._process_port_update(context, id, port, p)
             self._process_portbindings_create_and_update(context,
                                                          port['port'], p)
-            self.api_cli.update_port(id, p)
+            task.create_task(context, task.UPDATE, data_type=task.PORT,
+                             resource_id=id, data=p)
+            self._call_api(self.api_cli.update_port, id, p)
 
         LOG.info(_LI("MidonetMixin.update_port exiting: p=%r"), p)
         return p
@@ -397,7 +638,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                          resource_id=r['id'], data=r)
 
         try:
-            self.api_cli.create_router(r)
+            self._call_api(self.api_cli.create_router, r)
         except Exception as ex:
             LOG.error(_LE("Failed to create a router %(r_id)s in Midonet:"
                           "%(err)s"), {"r_id": r["id"], "err": ex})
@@ -408,6 +649,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                      "router=%(router)s."), {"router": r})
         return r
 
+    @cache.invalidating(*_ROUTER_CACHE_ALIASES)
     @util.handle_api_error
     def update_router(self, context, id, router):
         """Handle router updates."""
@@ -418,11 +660,12 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             r = super(MidonetMixin, self).update_router(context, id, router)
             task.create_task(context, task.UPDATE, data_type=task.ROUTER,
                              resource_id=id, data=r)
-            self.api_cli.update_router(id, r)
+            self._call_api(self.api_cli.update_router, id, r)
 
         LOG.info(_LI("MidonetMixin.update_router exiting: router=%r"), r)
         return r
 
+    @cache.invalidating(*_ROUTER_CACHE_ALIASES)
     @util.handle_api_error
     def delete_router(self, context, id):
         """Handler for router deletion.
@@ -438,10 +681,11 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_router(context, id)
             task.create_task(context, task.DELETE, data_type=task.ROUTER,
                              resource_id=id)
-            self.api_cli.delete_router(id)
+            self._call_api(self.api_cli.delete_router, id)
 
         LOG.info(_LI("MidonetMixin.delete_router exiting: id=%s"), id)
 
+    @cache.invalidating(*_ROUTER_CACHE_ALIASES)
     @util.handle_api_error
     def add_router_interface(self, context, router_id, interface_info):
         """Handle router linking with network."""
@@ -452,9 +696,15 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
 
         info = super(MidonetMixin, self).add_router_interface(
             context, router_id, interface_info)
+        task.create_task(context, task.CREATE,
+                         data_type=task.ROUTER_INTERFACE,
+                         resource_id=info['port_id'],
+                         data={'router_id': router_id,
+                               'interface_info': info})
 
         try:
-            self.api_cli.add_router_interface(router_id, info)
+            self._call_api(self.api_cli.add_router_interface, router_id,
+                           info)
         except Exception:
             LOG.error(_LE("Failed to create MidoNet resources to add router "
                           "interface. info=%(info)s, router_id=%(router_id)s"),
@@ -466,6 +716,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                  info)
         return info
 
+    @cache.invalidating(*_ROUTER_CACHE_ALIASES)
     @util.handle_api_error
     def remove_router_interface(self, context, router_id, interface_info):
         """Handle router un-linking with network."""
@@ -477,7 +728,14 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             info = super(MidonetMixin, self).remove_router_interface(
                 context, router_id, interface_info)
-            self.api_cli.remove_router_interface(router_id, interface_info)
+            task.create_task(context, task.DELETE,
+                             data_type=task.ROUTER_INTERFACE,
+                             resource_id=info['port_id'],
+                             data={'router_id': router_id,
+                                   'interface_info': interface_info})
+
+        self._call_api(self.api_cli.remove_router_interface, router_id,
+                       interface_info)
 
         LOG.info(_LI("MidonetMixin.remove_router_interface exiting: "
                      "info=%r"), info)
@@ -495,7 +753,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                          resource_id=fip['id'], data=fip)
 
         try:
-            self.api_cli.create_floating_ip(fip)
+            self._call_api(self.api_cli.create_floating_ip, fip)
         except Exception as ex:
             LOG.error(_LE("Failed to create floating ip %(fip)s: %(err)s"),
                       {"fip": fip, "err": ex})
@@ -516,7 +774,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_floatingip(context, id)
             task.create_task(context, task.DELETE,
                              data_type=task.FLOATING_IP, resource_id=id)
-            self.api_cli.delete_floating_ip(id)
+            self._call_api(self.api_cli.delete_floating_ip, id)
 
         LOG.info(_LI("MidonetMixin.delete_floatingip exiting: id=%r"), id)
 
@@ -530,9 +788,6 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             fip = super(MidonetMixin, self).update_floatingip(context, id,
                                                               floatingip)
-            task.create_task(context, task.UPDATE,
-                             data_type=task.FLOATING_IP, resource_id=id,
-                             data=fip)
 
             # Update status based on association
             if fip.get('port_id') is None:
@@ -540,8 +795,11 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             else:
                 fip['status'] = n_const.FLOATINGIP_STATUS_ACTIVE
             self.update_floatingip_status(context, id, fip['status'])
+            task.create_task(context, task.UPDATE,
+                             data_type=task.FLOATING_IP, resource_id=id,
+                             data=fip)
 
-            self.api_cli.update_floating_ip(id, fip)
+            self._call_api(self.api_cli.update_floating_ip, id, fip)
 
         LOG.info(_LI("MidonetMixin.update_floating_ip exiting: fip=%s"), fip)
         return fip
@@ -572,7 +830,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
 
         try:
             # Process the MidoNet side
-            self.api_cli.create_security_group(sg)
+            self._call_api(self.api_cli.create_security_group, sg)
         except Exception:
             LOG.error(_LE("Failed to create MidoNet resources for sg %(sg)r"),
                       {"sg": sg})
@@ -583,6 +841,38 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         LOG.info(_LI("MidonetMixin.create_security_group exiting: sg=%r"), sg)
         return sg
 
+    @util.handle_api_error
+    def create_security_group_bulk(self, context, security_groups):
+        """Create several security groups and their MidoNet resources.
+
+        The security groups are created in a single transaction, and either
+        all of them or none are, as the networks in create_network_bulk.
+        The default security groups of their tenants are created first.
+        """
+        LOG.info(_LI("MidonetMixin.create_security_group_bulk called: "
+                     "security_groups=%r"), security_groups)
+
+        sg_items = security_groups['security_groups']
+        for tenant_id in set(self._get_tenant_id_for_create(
+                context, item['security_group']) for item in sg_items):
+            self._ensure_default_security_group(context, tenant_id)
+
+        with context.session.begin(subtransactions=True):
+            with task.batch(context):
+                sgs = []
+                for item in sg_items:
+                    sg = super(MidonetMixin, self).create_security_group(
+                        context, item)
+                    task.create_task(context, task.CREATE,
+                                     data_type=task.SECURITY_GROUP,
+                                     resource_id=sg['id'], data=sg)
+                    sgs.append(sg)
+            self._create_bulk_in_midonet('security_group', sgs)
+
+        LOG.info(_LI("MidonetMixin.create_security_group_bulk exiting: "
+                     "sgs=%r"), sgs)
+        return sgs
+
     @util.handle_api_error
     def delete_security_group(self, context, id):
         """Delete chains for Neutron security group."""
@@ -600,7 +890,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             task.create_task(context, task.DELETE,
                              data_type=task.SECURITY_GROUP, resource_id=id)
 
-            self.api_cli.delete_security_group(id)
+            self._call_api(self.api_cli.delete_security_group, id)
 
         LOG.info(_LI("MidonetMixin.delete_security_group exiting: id=%r"), id)
 
@@ -622,7 +912,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                          resource_id=rule['id'], data=rule)
 
         try:
-            self.api_cli.create_security_group_rule(rule)
+            self._call_api(self.api_cli.create_security_group_rule, rule)
         except Exception as ex:
             LOG.error(_LE('Failed to create security group rule %(sg)s,'
                       'error: %(err)s'), {'sg': rule, 'err': ex})
@@ -645,19 +935,30 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
                      "security_group_rules=%(security_group_rules)r"),
                  {'security_group_rules': security_group_rules})
 
-        rules = super(
-            MidonetMixin,
-            self).create_security_group_rule_bulk_native(context,
-                                                         security_group_rules)
+        with task.batch(context):
+            rules = super(
+                MidonetMixin, self).create_security_group_rule_bulk_native(
+                    context, security_group_rules)
+            for rule in rules:
+                task.create_task(context, task.CREATE,
+                                 data_type=task.SECURITY_GROUP_RULE,
+                                 resource_id=rule['id'], data=rule)
         try:
-            self.api_cli.create_security_group_rule_bulk(rules)
+            self._call_api(self.api_cli.create_security_group_rule_bulk, rules)
         except Exception as ex:
             LOG.error(_LE("Failed to create bulk security group rules %(sg)s, "
                           "error: %(err)s"), {"sg": rules, "err": ex})
             with excutils.save_and_reraise_exception():
-                for rule in rules:
-                    super(MidonetMixin, self).delete_security_group_rule(
-                        context, rule['id'])
+                with task.batch(context):
+                    for rule in rules:
+                        super(MidonetMixin, self).delete_security_group_rule(
+                            context, rule['id'])
+                        task.create_task(context, task.DELETE,
+                                         data_type=task.SECURITY_GROUP_RULE,
+                                         resource_id=rule['id'])
+                # The failed bulk call may have created some of the rules.
+                self._delete_bulk_in_midonet('security_group_rule',
+                                             [rule['id'] for rule in rules])
 
         LOG.info(_LI("MidonetMixin.create_security_group_rule_bulk exiting: "
                      "rules=%r"), rules)
@@ -679,7 +980,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             task.create_task(context, task.DELETE,
                              data_type=task.SECURITY_GROUP_RULE,
                              resource_id=sg_rule_id)
-            self.api_cli.delete_security_group_rule(sg_rule_id)
+            self._call_api(self.api_cli.delete_security_group_rule, sg_rule_id)
 
         LOG.info(_LI("MidonetMixin.delete_security_group_rule exiting: "
                      "id=%r"), id)
@@ -713,10 +1014,9 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             v = super(MidonetMixin, self).create_vip(context, vip)
             task.create_task(context, task.CREATE, data_type=task.VIP,
                              resource_id=v['id'], data=v)
-            self.api_cli.create_vip(v)
-            v['status'] = constants.ACTIVE
-            self.update_status(context, loadbalancer_db.Vip, v['id'],
-                               v['status'])
+            self._call_api(self.api_cli.create_vip, v)
+            self._set_dispatch_status(context, loadbalancer_db.Vip, v,
+                                      constants.PENDING_CREATE)
 
         LOG.debug("MidonetMixin.create_vip exiting: id=%r", v['id'])
         return v
@@ -730,7 +1030,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_vip(context, id)
             task.create_task(context, task.DELETE, data_type=task.VIP,
                              resource_id=id)
-            self.api_cli.delete_vip(id)
+            self._call_api(self.api_cli.delete_vip, id)
 
         LOG.debug("MidonetMixin.delete_vip existing: id=%(id)r",
                   {'id': id})
@@ -744,7 +1044,9 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             v = super(MidonetMixin, self).update_vip(context, id, vip)
             task.create_task(context, task.UPDATE, data_type=task.VIP,
                              resource_id=id, data=v)
-            self.api_cli.update_vip(id, v)
+            self._call_api(self.api_cli.update_vip, id, v)
+            self._set_dispatch_status(context, loadbalancer_db.Vip, v,
+                                      constants.PENDING_UPDATE)
 
         LOG.debug("MidonetMixin.update_vip exiting: id=%(id)r, "
                   "vip=%(vip)r", {'id': id, 'vip': v})
@@ -775,8 +1077,6 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
 
         with context.session.begin(subtransactions=True):
             p = super(MidonetMixin, self).create_pool(context, pool)
-            task.create_task(context, task.CREATE, data_type=task.POOL,
-                             resource_id=p['id'], data=p)
             res = {
                 'id': p['id'],
                 rsi.ROUTER_ID: router_id
@@ -784,12 +1084,12 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             self._process_create_resource_router_id(context, res,
                                                     loadbalancer_db.Pool)
             p[rsi.ROUTER_ID] = router_id
+            task.create_task(context, task.CREATE, data_type=task.POOL,
+                             resource_id=p['id'], data=p)
 
-            self.api_cli.create_pool(p)
-
-            p['status'] = constants.ACTIVE
-            self.update_status(context, loadbalancer_db.Pool, p['id'],
-                               p['status'])
+            self._call_api(self.api_cli.create_pool, p)
+            self._set_dispatch_status(context, loadbalancer_db.Pool, p,
+                                      constants.PENDING_CREATE)
 
         LOG.debug("MidonetMixin.create_pool exiting: %(pool)r",
                   {'pool': p})
@@ -804,7 +1104,9 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             p = super(MidonetMixin, self).update_pool(context, id, pool)
             task.create_task(context, task.UPDATE, data_type=task.POOL,
                              resource_id=id, data=p)
-            self.api_cli.update_pool(id, p)
+            self._call_api(self.api_cli.update_pool, id, p)
+            self._set_dispatch_status(context, loadbalancer_db.Pool, p,
+                                      constants.PENDING_UPDATE)
 
         LOG.debug("MidonetMixin.update_pool exiting: id=%(id)r, "
                   "pool=%(pool)r", {'id': id, 'pool': pool})
@@ -820,7 +1122,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_pool(context, id)
             task.create_task(context, task.DELETE, data_type=task.POOL,
                              resource_id=id)
-            self.api_cli.delete_pool(id)
+            self._call_api(self.api_cli.delete_pool, id)
 
         LOG.debug("MidonetMixin.delete_pool exiting: %(id)r", {'id': id})
 
@@ -833,10 +1135,9 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             m = super(MidonetMixin, self).create_member(context, member)
             task.create_task(context, task.CREATE, data_type=task.MEMBER,
                              resource_id=m['id'], data=m)
-            self.api_cli.create_member(m)
-            m['status'] = constants.ACTIVE
-            self.update_status(context, loadbalancer_db.Member, m['id'],
-                               m['status'])
+            self._call_api(self.api_cli.create_member, m)
+            self._set_dispatch_status(context, loadbalancer_db.Member, m,
+                                      constants.PENDING_CREATE)
 
         LOG.debug("MidonetMixin.create_member exiting: %(member)r",
                   {'member': m})
@@ -851,7 +1152,9 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             m = super(MidonetMixin, self).update_member(context, id, member)
             task.create_task(context, task.UPDATE, data_type=task.MEMBER,
                              resource_id=id, data=m)
-            self.api_cli.update_member(id, m)
+            self._call_api(self.api_cli.update_member, id, m)
+            self._set_dispatch_status(context, loadbalancer_db.Member, m,
+                                      constants.PENDING_UPDATE)
 
         LOG.debug("MidonetMixin.update_member exiting: id=%(id)r, "
                   "member=%(member)r", {'id': id, 'member': m})
@@ -866,7 +1169,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_member(context, id)
             task.create_task(context, task.DELETE,
                              data_type=task.MEMBER, resource_id=id)
-            self.api_cli.delete_member(id)
+            self._call_api(self.api_cli.delete_member, id)
 
         LOG.debug("MidonetMixin.delete_member exiting: %(id)r",
                   {'id': id})
@@ -882,7 +1185,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             task.create_task(context, task.CREATE,
                              data_type=task.HEALTH_MONITOR,
                              resource_id=hm['id'], data=hm)
-            self.api_cli.create_health_monitor(hm)
+            self._call_api(self.api_cli.create_health_monitor, hm)
 
         LOG.debug("MidonetMixin.create_health_monitor exiting: "
                   "%(health_monitor)r", {'health_monitor': hm})
@@ -900,7 +1203,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             task.create_task(context, task.UPDATE,
                              data_type=task.HEALTH_MONITOR,
                              resource_id=id, data=hm)
-            self.api_cli.update_health_monitor(id, hm)
+            self._call_api(self.api_cli.update_health_monitor, id, hm)
 
         LOG.debug("MidonetMixin.update_health_monitor exiting: id=%(id)r, "
                   "health_monitor=%(health_monitor)r",
@@ -916,7 +1219,7 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
             super(MidonetMixin, self).delete_health_monitor(context, id)
             task.create_task(context, task.DELETE,
                              data_type=task.HEALTH_MONITOR, resource_id=id)
-            self.api_cli.delete_health_monitor(id)
+            self._call_api(self.api_cli.delete_health_monitor, id)
 
         LOG.debug("MidonetMixin.delete_health_monitor exiting: %(id)r",
                   {'id': id})
@@ -937,7 +1240,13 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             monitors = super(MidonetMixin, self).create_pool_health_monitor(
                 context, health_monitor, pool_id)
-            self.api_cli.create_pool_health_monitor(hm, pool_id)
+            task.create_task(context, task.CREATE,
+                             data_type=task.POOL_HEALTH_MONITOR,
+                             resource_id=pool_id, parent_id=hm['id'],
+                             data={'health_monitor': hm,
+                                   'pool_id': pool_id})
+            self._call_api(self.api_cli.create_pool_health_monitor, hm,
+                           pool_id)
 
         LOG.debug("MidonetMixin.create_pool_health_monitor exiting: "
                   "%(health_monitor)r, %(pool_id)r",
@@ -953,7 +1262,13 @@ class MidonetMixin(db_base_plugin_v2.NeutronDbPluginV2,
         with context.session.begin(subtransactions=True):
             super(MidonetMixin, self).delete_pool_health_monitor(
                 context, id, pool_id)
-            self.api_cli.delete_pool_health_monitor(id, pool_id)
+            task.create_task(context, task.DELETE,
+                             data_type=task.POOL_HEALTH_MONITOR,
+                             resource_id=pool_id, parent_id=id,
+                             data={'health_monitor_id': id,
+                                   'pool_id': pool_id})
+            self._call_api(self.api_cli.delete_pool_health_monitor, id,
+                           pool_id)
 
         LOG.debug("MidonetMixin.delete_pool_health_monitor exiting: "
                   "%(id)r, %(pool_id)r", {'id': id, 'pool_id': pool_id})
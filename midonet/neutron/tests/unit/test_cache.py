@@ -0,0 +1,138 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_config import cfg
+
+from neutron.tests import base
+
+from midonet.neutron.common import cache
+
+
+class TTLCacheTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.cache.TTLCache."""
+
+    def setUp(self):
+        super(TTLCacheTestCase, self).setUp()
+        self.cache = cache.TTLCache(max_bytes=100)
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_get_and_expiry(self):
+        self.assertEqual((False, None), self.cache.get('host', 'a'))
+        self.cache.set('host', 'a', {'id': 'a'}, 5)
+
+        self.assertEqual((True, {'id': 'a'}), self.cache.get('host', 'a'))
+        self.time.return_value += 5
+        self.assertEqual((False, None), self.cache.get('host', 'a'))
+        self.assertEqual({'hits': 1, 'misses': 2, 'evictions': 0,
+                          'entries': 0, 'bytes': 0},
+                         self.cache.get_stats())
+
+    def test_hits_are_copies(self):
+        self.cache.set('host', 'a', {'id': 'a'}, 5)
+        self.cache.get('host', 'a')[1]['id'] = 'b'
+
+        self.assertEqual({'id': 'a'}, self.cache.get('host', 'a')[1])
+
+    def test_lru_eviction(self):
+        value = 'x' * 30
+        for key in ('a', 'b', 'c'):
+            self.cache.set('host', key, value, 5)
+        # 'a' becomes the most recently used.
+        self.cache.get('host', 'a')
+        self.cache.set('host', 'd', value, 5)
+
+        self.assertFalse(self.cache.get('host', 'b')[0])
+        for key in ('a', 'c', 'd'):
+            self.assertTrue(self.cache.get('host', key)[0])
+        self.assertEqual(1, self.cache.get_stats()['evictions'])
+        self.assertTrue(self.cache.size <= 100)
+
+    def test_too_large_value(self):
+        self.cache.set('host', 'a', 'x' * 200, 5)
+
+        self.assertFalse(self.cache.get('host', 'a')[0])
+
+    def test_invalidate(self):
+        self.cache.set('host', 'a', 1, 5)
+        self.cache.set('tunnelzone', 'a', 2, 5)
+        self.cache.invalidate('host')
+
+        self.assertFalse(self.cache.get('host', 'a')[0])
+        self.assertEqual((True, 2), self.cache.get('tunnelzone', 'a'))
+
+    def test_set_stale_generation(self):
+        generation = self.cache.get_generation('host')
+        self.cache.invalidate('host')
+        self.cache.set('host', 'a', 1, 5, generation)
+
+        self.assertFalse(self.cache.get('host', 'a')[0])
+        self.cache.set('host', 'a', 1, 5, self.cache.get_generation('host'))
+        self.assertEqual((True, 1), self.cache.get('host', 'a'))
+
+
+class CachedTestCase(base.BaseTestCase):
+    """Test for the cached and invalidating decorators."""
+
+    def setUp(self):
+        super(CachedTestCase, self).setUp()
+        self.addCleanup(cache.API_CACHE.clear)
+        calls = self.calls = []
+
+        class FooPlugin(object):
+
+            @cache.cached('foo', default_ttl=10)
+            def get_foo(self, context, id, fields=None):
+                calls.append(id)
+                if id == 'written':
+                    # A write made while the read is in progress.
+                    self.update_foo(context, id, {})
+                return {'id': id}
+
+            @cache.invalidating('foo')
+            def update_foo(self, context, id, foo):
+                return foo
+
+        self.plugin = FooPlugin()
+        self.context = mock.Mock(tenant_id='tenant')
+
+    def test_cached(self):
+        for i in range(3):
+            self.assertEqual({'id': 'a'},
+                             self.plugin.get_foo(self.context, 'a'))
+        self.plugin.get_foo(self.context, 'b')
+
+        self.assertEqual(['a', 'b'], self.calls)
+
+    def test_invalidated_by_writes(self):
+        self.plugin.get_foo(self.context, 'a')
+        self.plugin.update_foo(self.context, 'a', {})
+        self.plugin.get_foo(self.context, 'a')
+
+        self.assertEqual(['a', 'a'], self.calls)
+
+    def test_ttl_override(self):
+        cfg.CONF.set_override('api_cache_ttl', {'foo': '0'}, 'MIDONET')
+        self.plugin.get_foo(self.context, 'a')
+        self.plugin.get_foo(self.context, 'a')
+
+        self.assertEqual(['a', 'a'], self.calls)
+
+    def test_write_during_read_is_not_cached(self):
+        self.plugin.get_foo(self.context, 'written')
+        self.plugin.get_foo(self.context, 'written')
+
+        self.assertEqual(['written', 'written'], self.calls)
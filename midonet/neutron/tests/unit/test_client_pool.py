@@ -0,0 +1,301 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+
+import eventlet
+from eventlet import event as e_event
+import mock
+from oslo_config import cfg
+from webob import exc as w_exc
+
+from neutron.tests import base
+
+from midonet.neutron.common import client_pool
+
+
+class FakeClient(object):
+
+    def get_network(self, id):
+        eventlet.sleep(0)
+        return id
+
+    def delete_network(self, id):
+        raise ValueError(id)
+
+
+class TimedClientTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.client_pool.TimedClient."""
+
+    def setUp(self):
+        super(TimedClientTestCase, self).setUp()
+        self.client = client_pool.TimedClient(FakeClient())
+
+    def test_calls_are_concurrent(self):
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(self.client.get_network, range(10)))
+
+        self.assertEqual(list(range(10)), results)
+        self.assertEqual(10, self.client.get_stats()['get_network']['count'])
+
+    def test_stats(self):
+        self.client.get_network('a')
+        self.assertRaises(ValueError, self.client.delete_network, 'a')
+
+        stats = self.client.get_stats()
+        self.assertEqual(1, stats['get_network']['count'])
+        self.assertEqual(0, stats['get_network']['errors'])
+        self.assertEqual(1, stats['delete_network']['errors'])
+
+
+class FakeNode(object):
+    """A fake MidoNet API endpoint, which can be brought down."""
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.up = True
+        self.calls = 0
+        self.event = None
+        self.deleted = False
+        self.lose_response = False
+
+    def get_network(self, id):
+        if not self.up:
+            raise socket.error('connection refused')
+        self.calls += 1
+        if self.event is not None:
+            self.event.wait()
+        return self.uri
+
+    def create_network(self, data):
+        return self.get_network(data['id'])
+
+    def delete_network(self, id):
+        self.get_network(id)
+        self.deleted = True
+        if self.lose_response:
+            # The node goes down after deleting, before answering.
+            self.up = False
+            raise socket.error('connection reset')
+
+
+class MidonetEndpointBalancerTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.client_pool.MidonetEndpointBalancer.
+    """
+
+    def setUp(self):
+        super(MidonetEndpointBalancerTestCase, self).setUp()
+        cfg.CONF.set_override('api_retry_attempts', 1, 'MIDONET')
+        cfg.CONF.set_override('api_breaker_threshold', 100, 'MIDONET')
+        self.nodes = dict((uri, FakeNode(uri)) for uri in ['a', 'b', 'c'])
+        self.balancer = client_pool.MidonetEndpointBalancer(
+            sorted(self.nodes), lambda uri: self.nodes[uri],
+            probe=lambda uri: self.nodes[uri].up)
+
+    def test_calls_are_spread(self):
+        for i in range(6):
+            self.balancer.get_network(i)
+
+        self.assertEqual([2, 2, 2],
+                         [self.nodes[uri].calls for uri in 'abc'])
+
+    def test_least_outstanding(self):
+        event = e_event.Event()
+        for node in self.nodes.values():
+            node.event = event
+        pool = eventlet.GreenPool()
+        pool.spawn(self.balancer.get_network, 0)
+        eventlet.sleep(0)
+        busy = [e.uri for e in self.balancer.endpoints if e.outstanding]
+        for uri in self.nodes:
+            if uri not in busy:
+                self.nodes[uri].event = None
+
+        results = [self.balancer.get_network(i) for i in range(4)]
+        event.send()
+        pool.waitall()
+
+        self.assertEqual(1, len(busy))
+        self.assertNotIn(busy[0], results)
+
+    def test_ejection_and_reinstatement(self):
+        self.nodes['b'].up = False
+        for i in range(9):
+            try:
+                self.balancer.get_network(i)
+            except socket.error:
+                pass
+
+        stats = self.balancer.get_stats()
+        self.assertTrue(stats['b']['ejected'])
+        self.assertEqual(['a', 'c'],
+                         sorted(self.balancer.get_network(i)
+                                for i in range(2)))
+
+        self.balancer.check_endpoints()
+        self.assertTrue(self.balancer.get_stats()['b']['ejected'])
+        self.nodes['b'].up = True
+        self.balancer.check_endpoints()
+        self.assertFalse(self.balancer.get_stats()['b']['ejected'])
+
+    def test_all_ejected(self):
+        for node in self.nodes.values():
+            node.up = False
+        for i in range(9):
+            self.assertRaises(socket.error, self.balancer.get_network, i)
+        self.nodes['a'].up = True
+
+        results = []
+        for i in range(3):
+            try:
+                results.append(self.balancer.get_network(i))
+            except socket.error:
+                pass
+        self.assertIn('a', results)
+        self.assertEqual('a', self.balancer.get_network(0))
+
+
+class CircuitBreakerTestCase(base.BaseTestCase):
+    """Test for the circuit breaker and the retries of the balancer."""
+
+    def setUp(self):
+        super(CircuitBreakerTestCase, self).setUp()
+        cfg.CONF.set_override('api_breaker_threshold', 2, 'MIDONET')
+        cfg.CONF.set_override('api_breaker_reset_timeout', 30, 'MIDONET')
+        cfg.CONF.set_override('api_retry_attempts', 3, 'MIDONET')
+        cfg.CONF.set_override('api_eject_threshold', 10, 'MIDONET')
+        self.nodes = dict((uri, FakeNode(uri)) for uri in ['a', 'b'])
+        self.balancer = client_pool.MidonetEndpointBalancer(
+            sorted(self.nodes), lambda uri: self.nodes[uri])
+        self.sleep = mock.patch('eventlet.sleep').start()
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_idempotent_calls_are_retried(self):
+        self.nodes['b'].up = False
+        cfg.CONF.set_override('api_breaker_threshold', 5, 'MIDONET')
+
+        results = [self.balancer.get_network(i) for i in range(4)]
+
+        self.assertEqual(['a'] * 4, results)
+        self.assertTrue(self.sleep.called)
+        self.assertEqual(self.balancer.endpoints[1].failures,
+                         self.sleep.call_count)
+        for (delay,), kwargs in self.sleep.call_args_list:
+            self.assertTrue(0 <= delay <= 0.5)
+
+    def _delete_deleted_network(self, id):
+        if any(node.deleted for node in self.nodes.values()):
+            raise w_exc.HTTPNotFound()
+
+    def test_retried_delete_of_deleted_resource(self):
+        self.nodes['a'].lose_response = True
+        self.nodes['b'].delete_network = self._delete_deleted_network
+        self.balancer._next = 1
+
+        self.assertIsNone(self.balancer.delete_network('n'))
+        self.assertTrue(self.nodes['a'].deleted)
+        self.assertEqual(1, self.sleep.call_count)
+
+    def test_first_delete_of_missing_resource(self):
+        self.nodes['a'].deleted = True
+        for node in self.nodes.values():
+            node.delete_network = self._delete_deleted_network
+
+        self.assertRaises(w_exc.HTTPNotFound, self.balancer.delete_network,
+                          'n')
+        self.assertFalse(self.sleep.called)
+
+    def test_other_calls_are_not_retried(self):
+        for node in self.nodes.values():
+            node.up = False
+
+        self.assertRaises(socket.error, self.balancer.create_network,
+                          {'id': 'n'})
+        self.assertFalse(self.sleep.called)
+
+    def test_retry_delay_is_bounded(self):
+        cfg.CONF.set_override('api_retry_max_delay', 2, 'MIDONET')
+        for attempt in range(1, 10):
+            delay = client_pool.get_retry_delay(attempt)
+            self.assertTrue(0 <= delay <= 2)
+
+    def _get_breaker_states(self):
+        return sorted(stats['breaker']
+                      for stats in self.balancer.get_stats().values())
+
+    def _open_breakers(self):
+        for node in self.nodes.values():
+            node.up = False
+        # Each endpoint fails twice in turn.
+        cfg.CONF.set_override('api_retry_attempts', 4, 'MIDONET')
+        self.assertRaises(socket.error, self.balancer.get_network, 0)
+
+    def test_opens_and_fails_fast(self):
+        self._open_breakers()
+
+        self.assertEqual([client_pool.BREAKER_OPEN] * 2,
+                         self._get_breaker_states())
+        self.assertRaises(client_pool.CircuitOpenError,
+                          self.balancer.get_network, 1)
+
+        self.nodes['a'].up = True
+        self.assertRaises(client_pool.CircuitOpenError,
+                          self.balancer.get_network, 2)
+        self.assertEqual(0, self.nodes['a'].calls)
+
+    def test_breakers_are_per_endpoint(self):
+        cfg.CONF.set_override('api_retry_attempts', 1, 'MIDONET')
+        self.nodes['b'].up = False
+        for i in range(4):
+            try:
+                self.balancer.get_network(i)
+            except socket.error:
+                pass
+
+        stats = self.balancer.get_stats()
+        self.assertEqual(client_pool.BREAKER_OPEN, stats['b']['breaker'])
+        self.assertEqual(client_pool.BREAKER_CLOSED, stats['a']['breaker'])
+        # The open breaker of b does not hold back the calls to a.
+        self.assertEqual(['a'] * 4,
+                         [self.balancer.get_network(i) for i in range(4)])
+
+    def test_half_open_probe(self):
+        self._open_breakers()
+
+        self.time.return_value += 31
+        self.assertRaises(socket.error, self.balancer.create_network,
+                          {'id': 'n'})
+        self.assertEqual([client_pool.BREAKER_OPEN] * 2,
+                         self._get_breaker_states())
+
+        self.time.return_value += 31
+        for node in self.nodes.values():
+            node.up = True
+        self.assertIn(self.balancer.create_network({'id': 'n'}), 'ab')
+        self.assertEqual([client_pool.BREAKER_CLOSED,
+                          client_pool.BREAKER_OPEN],
+                         self._get_breaker_states())
+
+    def test_single_probe(self):
+        breaker = client_pool.CircuitBreaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.time.return_value += 31
+
+        breaker.before_call()
+        self.assertRaises(client_pool.CircuitOpenError, breaker.before_call)
+        breaker.record_success()
+        breaker.before_call()
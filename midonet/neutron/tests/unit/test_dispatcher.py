@@ -0,0 +1,323 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+import eventlet
+import mock
+from oslo_config import cfg
+
+from neutron import context
+from neutron.openstack.common import uuidutils
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+from midonet.neutron import dispatcher
+
+_uuid = uuidutils.generate_uuid
+
+
+class TaskDispatcherTestCase(testlib_api.SqlTestCase):
+    """Test for midonet.neutron.dispatcher."""
+
+    def setUp(self):
+        super(TaskDispatcherTestCase, self).setUp()
+        cfg.CONF.set_override('dispatch_mode', task.DISPATCH_OUTBOX,
+                              'MIDONET')
+        self.ctx = context.get_admin_context()
+        self.api_cli = mock.Mock()
+        self.on_failure = mock.Mock()
+        self.on_success = mock.Mock()
+        self.dispatcher = dispatcher.TaskDispatcher(
+            self.api_cli, on_failure=self.on_failure,
+            on_success=self.on_success)
+
+    def _get_tasks(self):
+        self.ctx.session.expire_all()
+        return self.ctx.session.query(task.Task).order_by(task.Task.id).all()
+
+    def _create_task(self, type, data_type, res_id, data=None, **kwargs):
+        task.create_task(self.ctx, type, data_type=data_type,
+                         resource_id=res_id, data=data, **kwargs)
+
+    def test_create_task_is_pending(self):
+        self._create_task(task.CREATE, task.NETWORK, _uuid(), {})
+        self._create_task(task.CREATE, task.AGENT_MEMBERSHIP, _uuid(), {})
+        cfg.CONF.set_override('dispatch_mode', task.DISPATCH_SYNC, 'MIDONET')
+        self._create_task(task.CREATE, task.NETWORK, _uuid(), {})
+
+        self.assertEqual([task.DISPATCH_PENDING, None, None],
+                         [t.dispatch_status for t in self._get_tasks()])
+
+    def test_dispatch_pending(self):
+        net_id = _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.UPDATE, task.NETWORK, net_id,
+                          {'id': net_id, 'name': 'net'})
+
+        self.assertEqual(2, self.dispatcher.dispatch_pending(self.ctx))
+        self._create_task(task.DELETE, task.NETWORK, net_id)
+        self.assertEqual(1, self.dispatcher.dispatch_pending(self.ctx))
+
+        self.assertEqual([mock.call.create_network({'id': net_id}),
+                          mock.call.update_network(
+                              net_id, {'id': net_id, 'name': 'net'}),
+                          mock.call.delete_network(net_id)],
+                         self.api_cli.mock_calls)
+        self.assertEqual([task.DISPATCH_DONE] * 3,
+                         [t.dispatch_status for t in self._get_tasks()])
+        self.assertEqual(task.DISPATCH_DONE, task.get_dispatch_status(
+            self.ctx.session, task.NETWORK, net_id))
+        self.assertEqual(3, self.on_success.call_count)
+
+    def test_dispatch_patch(self):
+        port = {'id': _uuid(), 'name': 'port'}
+        self._create_task(task.CREATE, task.PORT, port['id'], port)
+        self._create_task(task.UPDATE, task.PORT, port['id'],
+                          dict(port, name='new'), delta=True)
+
+        self.dispatcher.dispatch_pending(self.ctx)
+
+        self.api_cli.update_port.assert_called_once_with(
+            port['id'], dict(port, name='new'))
+
+    def test_dispatch_associations(self):
+        router_id, port_id, pool_id, hm_id = (_uuid() for i in range(4))
+        info = {'id': router_id, 'port_id': port_id}
+        self._create_task(task.CREATE, task.ROUTER_INTERFACE, port_id,
+                          {'router_id': router_id, 'interface_info': info})
+        self._create_task(task.DELETE, task.ROUTER_INTERFACE, port_id,
+                          {'router_id': router_id,
+                           'interface_info': {'port_id': port_id}})
+        self._create_task(task.CREATE, task.POOL_HEALTH_MONITOR, pool_id,
+                          {'health_monitor': {'id': hm_id},
+                           'pool_id': pool_id})
+        self._create_task(task.DELETE, task.POOL_HEALTH_MONITOR, pool_id,
+                          {'health_monitor_id': hm_id, 'pool_id': pool_id})
+
+        self.assertEqual(4, self.dispatcher.dispatch_pending(self.ctx))
+
+        self.assertEqual(
+            [mock.call.add_router_interface(router_id, info),
+             mock.call.remove_router_interface(router_id,
+                                               {'port_id': port_id})],
+            [c for c in self.api_cli.mock_calls if port_id in str(c)])
+        self.assertEqual(
+            [mock.call.create_pool_health_monitor({'id': hm_id}, pool_id),
+             mock.call.delete_pool_health_monitor(hm_id, pool_id)],
+            [c for c in self.api_cli.mock_calls if pool_id in str(c)])
+
+    def test_dispatch_skips_stale_updates(self):
+        port = {'id': _uuid(), 'name': 'port'}
+        self._create_task(task.CREATE, task.PORT, port['id'], port)
+        for name in ('a', 'b', 'c'):
+            self._create_task(task.UPDATE, task.PORT, port['id'],
+                              dict(port, name=name))
+
+        self.assertEqual(4, self.dispatcher.dispatch_pending(self.ctx))
+
+        self.assertEqual([mock.call.create_port(port),
+                          mock.call.update_port(port['id'],
+                                                dict(port, name='c'))],
+                         self.api_cli.mock_calls)
+        self.assertEqual([1, 2, 3, 4],
+                         [t.revision for t in self._get_tasks()])
+        self.assertEqual([task.DISPATCH_DONE] * 4,
+                         [t.dispatch_status for t in self._get_tasks()])
+
+    def test_dispatch_resources_concurrently(self):
+        in_flight = []
+        calls = []
+
+        def create_port(data):
+            in_flight.append(data['id'])
+            calls.append(len(in_flight))
+            eventlet.sleep(0.01)
+            in_flight.remove(data['id'])
+
+        self.api_cli.create_port.side_effect = create_port
+        port_ids = [_uuid() for i in range(4)]
+        for port_id in port_ids:
+            self._create_task(task.CREATE, task.PORT, port_id,
+                              {'id': port_id})
+            self._create_task(task.UPDATE, task.PORT, port_id,
+                              {'id': port_id, 'name': 'port'})
+
+        self.assertEqual(8, self.dispatcher.dispatch_pending(self.ctx))
+
+        self.assertTrue(max(calls) > 1)
+        for port_id in port_ids:
+            self.assertEqual(
+                [mock.call.create_port({'id': port_id}),
+                 mock.call.update_port(port_id,
+                                       {'id': port_id, 'name': 'port'})],
+                [c for c in self.api_cli.mock_calls
+                 if port_id in str(c)])
+
+    def test_dispatch_related_resources_in_order(self):
+        net_id, port_id = _uuid(), _uuid()
+        port = {'id': port_id, 'network_id': net_id}
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_id, port)
+        self._create_task(task.DELETE, task.PORT, port_id)
+        self._create_task(task.DELETE, task.NETWORK, net_id)
+
+        self.assertEqual(4, self.dispatcher.dispatch_pending(self.ctx))
+
+        self.assertEqual([mock.call.create_network({'id': net_id}),
+                          mock.call.create_port(port),
+                          mock.call.delete_port(port_id),
+                          mock.call.delete_network(net_id)],
+                         self.api_cli.mock_calls)
+
+    def test_dispatch_failure_holds_back_children(self):
+        net_id, port_id, other_id = _uuid(), _uuid(), _uuid()
+        self.api_cli.create_network.side_effect = Exception('boom')
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_id,
+                          {'id': port_id, 'network_id': net_id})
+        self._create_task(task.CREATE, task.PORT, other_id,
+                          {'id': other_id, 'network_id': _uuid()})
+
+        self.assertEqual(1, self.dispatcher.dispatch_pending(self.ctx))
+
+        self.api_cli.create_port.assert_called_once_with(
+            {'id': other_id, 'network_id': mock.ANY})
+        self.assertEqual([task.DISPATCH_PENDING, task.DISPATCH_PENDING,
+                          task.DISPATCH_DONE],
+                         [t.dispatch_status for t in self._get_tasks()])
+
+    def test_dispatch_failure_holds_back_resource(self):
+        port_a, port_b = _uuid(), _uuid()
+        self.api_cli.create_port.side_effect = [Exception('boom'), None]
+        self._create_task(task.CREATE, task.PORT, port_a, {'id': port_a})
+        self._create_task(task.CREATE, task.PORT, port_b, {'id': port_b})
+        self._create_task(task.DELETE, task.PORT, port_a)
+
+        self.assertEqual(1, self.dispatcher.dispatch_pending(self.ctx))
+        # The retry of the first task is not due yet.
+        self.assertEqual(0, self.dispatcher.dispatch_pending(self.ctx))
+
+        tasks = self._get_tasks()
+        self.assertEqual([task.DISPATCH_PENDING, task.DISPATCH_DONE,
+                          task.DISPATCH_PENDING],
+                         [t.dispatch_status for t in tasks])
+        self.assertEqual(1, tasks[0].dispatch_attempts)
+        self.assertIsNotNone(tasks[0].dispatch_after)
+        self.assertFalse(self.api_cli.delete_port.called)
+
+    def test_dispatch_gives_up(self):
+        cfg.CONF.set_override('dispatch_max_attempts', 1, 'MIDONET')
+        net_id = _uuid()
+        self.api_cli.update_network.side_effect = Exception('boom')
+        self._create_task(task.UPDATE, task.NETWORK, net_id, {'id': net_id})
+
+        self.assertEqual(0, self.dispatcher.dispatch_pending(self.ctx))
+
+        [t] = self._get_tasks()
+        self.assertEqual(task.DISPATCH_FAILED, t.dispatch_status)
+        self.assertEqual('boom', t.dispatch_error)
+        self.on_failure.assert_called_once_with(self.ctx, mock.ANY)
+        self.assertFalse(self.on_success.called)
+
+    def test_compact_tasks_keeps_pending_tasks(self):
+        net_id = _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.UPDATE, task.NETWORK, net_id, {'id': net_id})
+
+        self.assertEqual(0, task.compact_tasks(self.ctx.session))
+        self.dispatcher.dispatch_pending(self.ctx)
+        self.assertEqual(1, task.compact_tasks(self.ctx.session))
+
+    def test_claim_tasks_keeps_resources_in_order(self):
+        port_a, port_b = _uuid(), _uuid()
+        self._create_task(task.CREATE, task.PORT, port_a, {'id': port_a})
+        self._create_task(task.CREATE, task.PORT, port_b, {'id': port_b})
+        self._create_task(task.DELETE, task.PORT, port_a)
+
+        first = task.claim_tasks(self.ctx.session, 'x', limit=1)
+        second = task.claim_tasks(self.ctx.session, 'y')
+
+        self.assertEqual([port_a], [t.resource_id for t in first])
+        # The DELETE of port_a waits until its CREATE is dispatched.
+        self.assertEqual([(task.CREATE, port_b)],
+                         [(t.type, t.resource_id) for t in second])
+        self.assertEqual(['x', 'y', None],
+                         [t.lease_owner for t in self._get_tasks()])
+
+    def test_claim_tasks_holds_back_dependent_resources(self):
+        net_id, port_a, port_b = _uuid(), _uuid(), _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_a,
+                          {'id': port_a, 'network_id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_b,
+                          {'id': port_b, 'network_id': _uuid()})
+
+        first = task.claim_tasks(self.ctx.session, 'x', limit=1)
+        second = task.claim_tasks(self.ctx.session, 'y')
+
+        self.assertEqual([net_id], [t.resource_id for t in first])
+        # The port of the network waits until the network is created.
+        self.assertEqual([port_b], [t.resource_id for t in second])
+
+    def test_claim_tasks_holds_back_parent_deletion(self):
+        net_id, port_id = _uuid(), _uuid()
+        self._create_task(task.CREATE, task.PORT, port_id,
+                          {'id': port_id, 'network_id': net_id})
+        self._create_task(task.DELETE, task.PORT, port_id)
+        self._create_task(task.DELETE, task.NETWORK, net_id)
+
+        first = task.claim_tasks(self.ctx.session, 'x', limit=1)
+        second = task.claim_tasks(self.ctx.session, 'y')
+
+        self.assertEqual([port_id], [t.resource_id for t in first])
+        # The network is deleted once its port is.
+        self.assertEqual([], second)
+        self.assertEqual([net_id, net_id, None],
+                         [t.parent_id for t in self._get_tasks()])
+
+    def test_claim_tasks_stops_after_failure(self):
+        cfg.CONF.set_override('dispatch_max_attempts', 1, 'MIDONET')
+        net_id, port_id = _uuid(), _uuid()
+        self.api_cli.create_network.side_effect = Exception('boom')
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        self.dispatcher.dispatch_pending(self.ctx)
+        self._create_task(task.UPDATE, task.NETWORK, net_id, {'id': net_id})
+        self._create_task(task.CREATE, task.PORT, port_id,
+                          {'id': port_id, 'network_id': net_id})
+
+        self.assertEqual([], task.claim_tasks(self.ctx.session, 'x'))
+        self.assertEqual([task.DISPATCH_FAILED, task.DISPATCH_PENDING,
+                          task.DISPATCH_PENDING],
+                         [t.dispatch_status for t in self._get_tasks()])
+
+    def test_claim_tasks_after_lease_expiry(self):
+        net_id = _uuid()
+        self._create_task(task.CREATE, task.NETWORK, net_id, {'id': net_id})
+        [t] = task.claim_tasks(self.ctx.session, 'x')
+        self.assertEqual([], task.claim_tasks(self.ctx.session, 'y'))
+
+        with self.ctx.session.begin():
+            self.ctx.session.query(task.Task).update(
+                {'lease_expires': datetime.datetime(2000, 1, 1)})
+        [t] = task.claim_tasks(self.ctx.session, 'y')
+
+        # The late worker can no longer record the outcome of the task.
+        task.complete_task(self.ctx.session, t, 'x')
+        self.assertEqual(task.DISPATCH_RUNNING,
+                         self._get_tasks()[0].dispatch_status)
+        task.complete_task(self.ctx.session, t, 'y')
+        self.assertEqual(task.DISPATCH_DONE,
+                         self._get_tasks()[0].dispatch_status)
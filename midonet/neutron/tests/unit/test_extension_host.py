@@ -114,3 +114,37 @@ class HostExtensionTestCase(test_api_v2_extension.ExtensionTestCase):
 
         instance.delete_host.assert_called_once_with(mock.ANY, host_id)
         self.assertEqual(exc.HTTPNoContent.code, res.status_int)
+
+
+class HostInterfaceExtensionTestCase(
+        test_api_v2_extension.ExtensionTestCase):
+    """Test the endpoints for the host interfaces."""
+    fmt = "json"
+
+    def setUp(self):
+        super(HostInterfaceExtensionTestCase, self).setUp()
+        plural_mappings = {'host_interface': 'host_interfaces'}
+        self._setUpExtension(
+            'midonet.neutron.extensions.host.HostInterfacePluginBase',
+            None, host.RESOURCE_ATTRIBUTE_MAP,
+            host.Host, '', plural_mappings=plural_mappings)
+
+    def test_host_interface_list(self):
+        host_id = _uuid()
+        return_value = [{'host_id': host_id,
+                         'name': 'eth0',
+                         'mac': '00:00:01:23:43:FE',
+                         'status': 'UP'}]
+
+        instance = self.plugin.return_value
+        instance.get_host_host_interfaces.return_value = return_value
+
+        path = 'hosts/%s/host_interfaces' % host_id
+        res = self.api.get(_get_path(path, fmt=self.fmt))
+        self.assertEqual(exc.HTTPOk.code, res.status_int)
+
+        instance.get_host_host_interfaces.assert_called_once_with(
+            mock.ANY, host_id=host_id, fields=mock.ANY, filters=mock.ANY)
+
+        res = self.deserialize(res)
+        self.assertEqual(1, len(res['host_interfaces']))
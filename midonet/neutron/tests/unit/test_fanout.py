@@ -0,0 +1,61 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+
+from neutron.tests import base
+
+from midonet.neutron.common import fanout
+
+
+class FanOutTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.fanout."""
+
+    def setUp(self):
+        super(FanOutTestCase, self).setUp()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _call(self, item):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        eventlet.sleep(0.01 if item % 2 else 0)
+        self.in_flight -= 1
+        if item < 0:
+            raise ValueError(item)
+        return item * 2
+
+    def test_results_in_order(self):
+        results = fanout.fan_out(self._call, range(10))
+
+        self.assertEqual([(i * 2, None) for i in range(10)], results)
+        self.assertTrue(self.max_in_flight > 1)
+
+    def test_concurrency_cap(self):
+        fanout.fan_out(self._call, range(20), concurrency=3)
+
+        self.assertEqual(3, self.max_in_flight)
+
+    def test_errors(self):
+        results = fanout.fan_out(self._call, [1, -1, 2, -3])
+
+        self.assertEqual([2, None, 4, None], [r for r, _e in results])
+        self.assertIsNone(results[0][1])
+        self.assertIsInstance(results[1][1][1], ValueError)
+        e = self.assertRaises(ValueError, fanout.raise_first_error, results)
+        self.assertEqual((-1,), e.args)
+
+    def test_no_error(self):
+        fanout.raise_first_error(fanout.fan_out(self._call, [1, 2]))
@@ -16,14 +16,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import mock
 import os
 
+from oslo_db import exception as db_exc
 from oslo_utils import importutils
+from sqlalchemy import event
 
+from midonet.neutron.common import cache
 from midonet.neutron.db import db_agent_membership  # noqa
 from midonet.neutron.db import task  # noqa
+from midonet.neutron import dispatcher
+from neutron.common import exceptions as n_exc
+from neutron import context
+import neutron.db.api as db_api
+from neutron.db import db_base_plugin_v2
+from neutron.db import l3_db
 from neutron.extensions import portbindings
+from neutron import manager
 from neutron.tests.unit import _test_extension_portbindings as test_bindings
 import neutron.tests.unit.test_db_plugin as test_plugin
 import neutron.tests.unit.test_extension_ext_gw_mode as test_gw_mode
@@ -134,3 +145,197 @@ class TestExtGwMode(MidonetPluginV2TestCase,
     def setUp(self):
         self.skipTest("It fails because of constraints")
     pass
+
+
+class TestMidonetBulkCreate(MidonetPluginV2TestCase):
+    """Test the native bulk creation of networks and ports."""
+
+    def setUp(self):
+        super(TestMidonetBulkCreate, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.task_inserts = []
+        engine = db_api.get_engine()
+        event.listen(engine, 'before_cursor_execute', self._count_insert)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute',
+                        self._count_insert)
+
+    def _count_insert(self, conn, cursor, statement, parameters, ctx,
+                      executemany):
+        if statement.startswith('INSERT INTO midonet_tasks'):
+            self.task_inserts.append(statement)
+
+    def _get_tasks(self, data_type):
+        return self.ctx.session.query(task.Task).filter_by(
+            data_type=data_type).order_by(task.Task.id).all()
+
+    def _fail_nth_call(self, method, n):
+        calls = []
+
+        def call(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == n:
+                raise Exception('boom')
+        method.side_effect = call
+
+    def test_create_network_bulk_writes_one_insert(self):
+        res = self._create_network_bulk(self.fmt, 3, 'net', True)
+
+        self.assertEqual(201, res.status_int)
+        self.assertEqual(1, len(self.task_inserts))
+        self.assertEqual(3, len(self._get_tasks(task.NETWORK)))
+
+    def test_create_network_bulk_rolls_back_midonet(self):
+        self._fail_nth_call(self.mock_class.create_network, 3)
+
+        res = self._create_network_bulk(self.fmt, 3, 'net', True)
+
+        self.assertEqual(500, res.status_int)
+        self.assertEqual([], self._list('networks')['networks'])
+        self.assertEqual([], self._get_tasks(task.NETWORK))
+        # The two networks created in MidoNet are deleted again.
+        self.assertEqual(2, self.mock_class.delete_network.call_count)
+
+    def _test_create_port_bulk_rolls_back(self):
+        create_port = db_base_plugin_v2.NeutronDbPluginV2.create_port
+        calls = []
+
+        def fail_second_port(plugin, context, port):
+            calls.append(port)
+            if len(calls) == 2:
+                raise n_exc.BadRequest(resource='port', msg='boom')
+            return create_port(plugin, context, port)
+
+        with self.network() as net:
+            net_id = net['network']['id']
+            with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                                   'create_port', fail_second_port):
+                res = self._create_port_bulk(self.fmt, 3, net_id, 'port',
+                                             True)
+
+            self.assertEqual(400, res.status_int)
+            self.assertEqual([], self._list('ports')['ports'])
+            self.assertEqual([], self._get_tasks(task.PORT))
+
+    def test_create_port_bulk_rolls_back(self):
+        self._test_create_port_bulk_rolls_back()
+        self.assertFalse(self.mock_class.create_port.called)
+
+    def test_create_port_bulk_rolls_back_in_outbox_mode(self):
+        cfg.CONF.set_override('dispatch_mode', task.DISPATCH_OUTBOX,
+                              'MIDONET')
+        self._test_create_port_bulk_rolls_back()
+        self.assertFalse(self.mock_class.create_port.called)
+
+    def test_create_port_bulk_rolls_back_midonet(self):
+        self._fail_nth_call(self.mock_class.create_port, 2)
+        with self.network() as net:
+            net_id = net['network']['id']
+            res = self._create_port_bulk(self.fmt, 3, net_id, 'port', True)
+
+            self.assertEqual(500, res.status_int)
+            self.assertEqual([], self._list('ports')['ports'])
+            self.assertEqual(2, self.mock_class.delete_port.call_count)
+
+    def test_create_port_retry_starts_from_request(self):
+        create_port = db_base_plugin_v2.NeutronDbPluginV2.create_port
+        create_task = task.create_task
+        bodies = []
+
+        def record_port(plugin, context, port):
+            bodies.append(copy.deepcopy(port))
+            return create_port(plugin, context, port)
+
+        def fail_first_port(context, type, **kwargs):
+            if kwargs.get('data_type') == task.PORT and len(bodies) == 1:
+                raise db_exc.DBDeadlock()
+            return create_task(context, type, **kwargs)
+
+        mock.patch('eventlet.sleep').start()
+        self.addCleanup(mock.patch.stopall)
+        with self.network() as net:
+            with mock.patch.object(db_base_plugin_v2.NeutronDbPluginV2,
+                                   'create_port', record_port):
+                with mock.patch.object(task, 'create_task',
+                                       fail_first_port):
+                    res = self._create_port(self.fmt,
+                                            net['network']['id'])
+
+            self.assertEqual(201, res.status_int)
+            self.assertEqual(2, len(bodies))
+            # The second attempt gets the request the first one got.
+            self.assertEqual(bodies[0], bodies[1])
+
+    def test_create_port_bulk_leaves_network_revision(self):
+        with self.network() as net:
+            net_id = net['network']['id']
+            revision = task.get_revision(self.ctx.session, task.NETWORK,
+                                         net_id)
+            del self.task_inserts[:]
+
+            res = self._create_port_bulk(self.fmt, 3, net_id, 'port', True)
+
+            self.assertEqual(201, res.status_int)
+            self.assertEqual(1, len(self.task_inserts))
+            self.assertEqual(revision, task.get_revision(
+                self.ctx.session, task.NETWORK, net_id))
+            self.assertEqual([1] * 3, [t.revision for t in
+                                       self._get_tasks(task.PORT)])
+
+
+class TestMidonetApiCacheInvalidation(MidonetPluginV2TestCase):
+    """Test the invalidation of the cached MidoNet API responses."""
+
+    def setUp(self):
+        super(TestMidonetApiCacheInvalidation, self).setUp()
+        cache.API_CACHE.clear()
+        self.addCleanup(cache.API_CACHE.clear)
+        self.plugin = manager.NeutronManager.get_plugin()
+
+    def _get_generations(self):
+        return [cache.API_CACHE.get_generation(alias)
+                for alias in ('midonet_port', 'routing_table')]
+
+    def test_port_writes_invalidate_ports(self):
+        with self.network() as net:
+            generations = [self._get_generations()]
+            with self.port(network=net) as port:
+                generations.append(self._get_generations())
+                self._update('ports', port['port']['id'],
+                             {'port': {'name': 'x'}})
+                generations.append(self._get_generations())
+            generations.append(self._get_generations())
+
+        self.assertEqual([[0, 0], [1, 0], [2, 0], [3, 0]], generations)
+
+    def test_router_interface_writes_invalidate_routes(self):
+        info = {'port_id': 'port', 'subnet_id': 'subnet'}
+        ctx = context.get_admin_context()
+        with mock.patch.object(l3_db.L3_NAT_db_mixin,
+                               'add_router_interface', return_value=info):
+            self.plugin.add_router_interface(ctx, 'router', info)
+        self.assertEqual([1, 1], self._get_generations())
+
+        with mock.patch.object(l3_db.L3_NAT_db_mixin,
+                               'remove_router_interface', return_value=info):
+            self.plugin.remove_router_interface(ctx, 'router', info)
+        self.assertEqual([2, 2], self._get_generations())
+
+
+class TestMidonetOutboxDispatcher(MidonetPluginV2TestCase):
+    """Test the start of the outbox dispatcher."""
+
+    def setUp(self):
+        cfg.CONF.set_override('dispatch_mode', task.DISPATCH_OUTBOX,
+                              'MIDONET')
+        self.start = mock.patch.object(dispatcher.TaskDispatcher,
+                                       'start').start()
+        self.addCleanup(mock.patch.stopall)
+        super(TestMidonetOutboxDispatcher, self).setUp()
+        self.plugin = manager.NeutronManager.get_plugin()
+
+    def test_dispatcher_starts_with_rpc_listeners(self):
+        # The plugin is loaded before neutron-server forks its workers.
+        self.assertFalse(self.start.called)
+
+        self.assertEqual([], self.plugin.start_rpc_listeners())
+        self.start.assert_called_once_with()
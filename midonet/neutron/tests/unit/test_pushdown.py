@@ -0,0 +1,91 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.tests import base
+
+from midonet.neutron.common import cache
+from midonet.neutron.common import pushdown
+
+
+class PushdownTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.pushdown."""
+
+    def setUp(self):
+        super(PushdownTestCase, self).setUp()
+        self.addCleanup(cache.API_CACHE.clear)
+
+    def test_split_filters(self):
+        query, remaining = pushdown.split_filters(
+            {'tenant_id': ['t'], 'name': ['x'], 'id': ['a', 'b']},
+            {'tenant_id': 'tenant', 'id': 'id'})
+        self.assertEqual({'tenant': 't'}, query)
+        self.assertEqual({'name': ['x'], 'id': ['a', 'b']}, remaining)
+
+    def test_compile_filters(self):
+        self.assertIsNone(pushdown.compile_filters({}))
+        match = pushdown.compile_filters({'name': ['x', 'y'],
+                                          'alive': ['True']})
+        self.assertTrue(match({'name': 'y', 'alive': True}))
+        self.assertFalse(match({'name': 'z', 'alive': True}))
+        self.assertFalse(match({'name': 'x', 'alive': False}))
+        self.assertFalse(match({'name': 'x'}))
+        self.assertFalse(match({'name': ['x'], 'alive': True}))
+
+    def test_project(self):
+        item = {'id': 'a', 'name': 'x', 'bars': [1]}
+        self.assertEqual({'id': 'a'}, pushdown.project(item, ['id']))
+        self.assertEqual(item, pushdown.project(item, None))
+        self.assertEqual({'id': 'a', 'name': 'x'},
+                         pushdown.project(item, None, ('bars',)))
+        self.assertEqual({'bars': [1]},
+                         pushdown.project(item, ['bars'], ('bars',)))
+
+    def test_get_fetched_fields(self):
+        self.assertIsNone(pushdown.get_fetched_fields(None, ['id']))
+        self.assertEqual(['name', 'id', 'alive'],
+                         pushdown.get_fetched_fields(['name'],
+                                                     ['id', 'alive', 'name']))
+        self.assertEqual(['name', 'id'],
+                         pushdown.get_fetched_fields(['name', 'bars'], [],
+                                                     ('bars',)))
+
+    def test_expand_caches_by_ttl(self):
+        calls = []
+
+        class FooPlugin(object):
+
+            def get_foo_bars(self, context, foo_id=None):
+                calls.append(foo_id)
+                return [{'foo_id': foo_id}]
+
+        foo_plugin = FooPlugin()
+        expanded = {'bars': ('get_foo_bars', 'foo_id')}
+        foos = [{'id': 'a', 'version': 1}, {'id': 'b', 'version': 1}]
+        pushdown.expand(foo_plugin, None, foos, None, expanded, 60)
+        self.assertEqual([], calls)
+
+        pushdown.expand(foo_plugin, None, foos, ['bars'], expanded, 60)
+        self.assertEqual([{'foo_id': 'b'}], foos[1]['bars'])
+        self.assertEqual(['a', 'b'], calls)
+
+        # The version of an item does not tell whether its sub-resources
+        # changed, so they are kept until the TTL expires.
+        foos = [{'id': 'a', 'version': 1}, {'id': 'b', 'version': 2}]
+        pushdown.expand(foo_plugin, None, foos, ['bars'], expanded, 60)
+        self.assertEqual([{'foo_id': 'b'}], foos[1]['bars'])
+        self.assertEqual(['a', 'b'], calls)
+
+        pushdown.expand(foo_plugin, None, foos, ['bars'], expanded, 0)
+        self.assertEqual(['a', 'b', 'a', 'b'], calls)
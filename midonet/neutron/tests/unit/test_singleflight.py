@@ -0,0 +1,107 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+
+from neutron.api.v2 import base as api_base
+from neutron.tests import base
+
+from midonet.neutron.common import singleflight
+from midonet.neutron.common import util
+
+
+class SlowBackend(object):
+    """A fake MidoNet API answering after a delay."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = 0
+        self.error = None
+
+    def get_host(self, id):
+        self.calls += 1
+        eventlet.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {'id': id, 'interfaces': []}
+
+
+class SingleFlightTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.singleflight."""
+
+    def setUp(self):
+        super(SingleFlightTestCase, self).setUp()
+        self.backend = SlowBackend()
+        self.flight = singleflight.SingleFlight()
+
+    def _burst(self, count, key='a'):
+        pool = eventlet.GreenPool()
+        threads = [pool.spawn(self.flight.call, key, self.backend.get_host,
+                              key) for i in range(count)]
+        return threads
+
+    def test_burst_is_coalesced(self):
+        results = [t.wait() for t in self._burst(10)]
+
+        self.assertEqual(1, self.backend.calls)
+        self.assertEqual([{'id': 'a', 'interfaces': []}] * 10, results)
+        # Every caller gets a result of its own.
+        results[1]['interfaces'].append('eth0')
+        self.assertEqual([], results[2]['interfaces'])
+        self.assertEqual({'calls': 1, 'shared': 9}, self.flight.get_stats())
+
+    def test_distinct_keys(self):
+        threads = self._burst(3, 'a') + self._burst(3, 'b')
+        for t in threads:
+            t.wait()
+
+        self.assertEqual(2, self.backend.calls)
+
+    def test_sequential_calls(self):
+        for i in range(3):
+            self.flight.call('a', self.backend.get_host, 'a')
+
+        self.assertEqual(3, self.backend.calls)
+
+    def test_error_is_shared(self):
+        self.backend.error = ValueError('boom')
+        threads = self._burst(5)
+
+        for t in threads:
+            self.assertRaises(ValueError, t.wait)
+        self.assertEqual(1, self.backend.calls)
+
+
+class CoalescedMethodsTestCase(base.BaseTestCase):
+    """Test for the coalescing of the methods built by generate_methods."""
+
+    def test_generated_methods_are_coalesced(self):
+        backend = SlowBackend()
+
+        @util.generate_methods(api_base.Controller.SHOW)
+        class HostPlugin(object):
+            """Host plugin description."""
+
+            def get_host(self, context, id, fields=None):
+                return backend.get_host(id)
+
+        plugin = HostPlugin()
+        pool = eventlet.GreenPool()
+        threads = [pool.spawn(plugin.get_host, None, 'a') for i in range(20)]
+        for t in threads:
+            t.wait()
+        plugin.get_host(None, 'b')
+
+        self.assertEqual(2, backend.calls)
@@ -0,0 +1,487 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo_config import cfg
+from sqlalchemy import event
+
+from neutron.api.v2 import attributes
+from neutron import context
+import neutron.db.api as db_api
+from neutron.openstack.common import uuidutils
+from neutron.tests import base
+from neutron.tests.unit import testlib_api
+
+from midonet.neutron.db import task
+
+_uuid = uuidutils.generate_uuid
+
+
+class TaskTestCase(testlib_api.SqlTestCase):
+    """Test for midonet.neutron.db.task."""
+
+    def setUp(self):
+        super(TaskTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+
+    def _get_tasks(self):
+        return self.ctx.session.query(task.Task).order_by(task.Task.id).all()
+
+    def test_create_task(self):
+        net = {'id': _uuid(), 'name': 'net'}
+        task.create_task(self.ctx, task.CREATE, data_type=task.NETWORK,
+                         resource_id=net['id'], data=net)
+
+        tasks = self._get_tasks()
+        self.assertEqual(1, len(tasks))
+        self.assertEqual(task.CREATE, tasks[0].type)
+        self.assertEqual(task.ENCODING_JSON, tasks[0].encoding)
+        self.assertEqual(net, task.get_task_data(tasks[0]))
+
+    def test_create_task_with_encoding(self):
+        port = {'id': _uuid(), 'name': 'port', 'fixed_ips': []}
+        for encoding in (task.ENCODING_ZLIB, task.ENCODING_MSGPACK):
+            cfg.CONF.set_override('task_data_encoding', encoding, 'MIDONET')
+            task.create_task(self.ctx, task.UPDATE, data_type=task.PORT,
+                             resource_id=port['id'], data=port)
+
+        tasks = self._get_tasks()
+        self.assertEqual([task.ENCODING_ZLIB, task.ENCODING_MSGPACK],
+                         [t.encoding for t in tasks])
+        self.assertEqual([port, port], [task.get_task_data(t) for t in tasks])
+
+    def test_create_task_revision(self):
+        port_id = _uuid()
+        for type in (task.CREATE, task.UPDATE, task.UPDATE, task.DELETE):
+            task.create_task(self.ctx, type, data_type=task.PORT,
+                             resource_id=port_id, data={'id': port_id})
+        task.create_task(self.ctx, task.CREATE,
+                         data_type=task.AGENT_MEMBERSHIP,
+                         resource_id=port_id, data={'id': port_id})
+
+        self.assertEqual([1, 2, 3, 4, None],
+                         [t.revision for t in self._get_tasks()])
+        self.assertEqual(0, task.get_revision(self.ctx.session, task.PORT,
+                                              port_id))
+
+    def test_create_task_revision_conflict(self):
+        net_id = _uuid()
+        task.create_task(self.ctx, task.CREATE, data_type=task.NETWORK,
+                         resource_id=net_id, data={'id': net_id})
+        revision = task.get_revision(self.ctx.session, task.NETWORK, net_id)
+        # A concurrent request commits a change of the network first.
+        task.bump_revision(self.ctx.session, task.NETWORK, net_id, revision)
+
+        self.assertRaises(task.RevisionConflict, task.create_task, self.ctx,
+                          task.DELETE, data_type=task.NETWORK,
+                          resource_id=net_id, revision=revision)
+        self.assertEqual([task.CREATE], [t.type for t in self._get_tasks()])
+        self.assertEqual(2, task.get_revision(self.ctx.session, task.NETWORK,
+                                              net_id))
+
+    def test_create_task_without_revision_increments(self):
+        net_id = _uuid()
+        task.create_task(self.ctx, task.CREATE, data_type=task.NETWORK,
+                         resource_id=net_id, data={'id': net_id})
+        # A concurrent request commits a change of the network first.
+        task.bump_revision(self.ctx.session, task.NETWORK, net_id, 1)
+        task.create_task(self.ctx, task.UPDATE, data_type=task.NETWORK,
+                         resource_id=net_id, data={'id': net_id})
+
+        self.assertEqual([1, 3], [t.revision for t in self._get_tasks()])
+        self.assertEqual(3, task.get_revision(self.ctx.session, task.NETWORK,
+                                              net_id))
+
+    def test_batch_revisions_and_parents(self):
+        net_id, port_a, port_b = _uuid(), _uuid(), _uuid()
+        self._create_tasks((task.CREATE, port_a))
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'midonet_' in statement:
+                statements.append(statement.split()[0])
+        engine = db_api.get_engine()
+        event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute',
+                        record)
+        with task.batch(self.ctx):
+            task.create_task(self.ctx, task.CREATE, data_type=task.PORT,
+                             resource_id=port_b,
+                             data={'id': port_b, 'network_id': net_id})
+            for res_id in (port_a, port_b, port_a):
+                task.create_task(self.ctx, task.UPDATE, data_type=task.PORT,
+                                 resource_id=res_id, data={'id': res_id},
+                                 delta=False)
+            task.create_task(self.ctx, task.DELETE, data_type=task.PORT,
+                             resource_id=port_b)
+
+        # The parents, the revisions and the tasks are each written with
+        # a fixed number of statements.
+        self.assertEqual(['SELECT', 'UPDATE', 'SELECT', 'INSERT'],
+                         statements)
+        tasks = self._get_tasks()[1:]
+        self.assertEqual([1, 2, 2, 3, 3], [t.revision for t in tasks])
+        self.assertEqual([net_id, None, net_id, None, net_id],
+                         [t.parent_id for t in tasks])
+        self.assertEqual(3, task.get_revision(self.ctx.session, task.PORT,
+                                              port_a))
+        self.assertEqual(0, task.get_revision(self.ctx.session, task.PORT,
+                                              port_b))
+
+    def test_bump_revision_of_new_resource_conflict(self):
+        net_id = _uuid()
+        self.assertEqual(1, task.bump_revision(self.ctx.session, task.NETWORK,
+                                               net_id, 0))
+
+        self.assertRaises(task.RevisionConflict, task.bump_revision,
+                          self.ctx.session, task.NETWORK, net_id, 0)
+
+    def test_decode_legacy_task_data(self):
+        self.assertEqual({'id': 'foo'},
+                         task.decode_task_data('{"id": "foo"}', None))
+
+    def test_batch_preserves_order(self):
+        ids = [_uuid() for _i in range(5)]
+        with task.batch(self.ctx):
+            for res_id in ids:
+                task.create_task(self.ctx, task.CREATE, data_type=task.PORT,
+                                 resource_id=res_id, data={'id': res_id})
+            # Nothing is written until the batch exits.
+            self.assertEqual([], self._get_tasks())
+
+        self.assertEqual(ids, [t.resource_id for t in self._get_tasks()])
+
+    def test_batch_is_rolled_back_on_error(self):
+        def _create():
+            with task.batch(self.ctx):
+                task.create_task(self.ctx, task.DELETE, data_type=task.PORT,
+                                 resource_id=_uuid())
+                raise ValueError
+
+        self.assertRaises(ValueError, _create)
+        self.assertEqual([], self._get_tasks())
+
+    def _create_tasks(self, *tasks):
+        for type, res_id in tasks:
+            data = None if type == task.DELETE else {'id': res_id}
+            task.create_task(self.ctx, type, data_type=task.PORT,
+                             resource_id=res_id, data=data)
+
+    def test_compact_tasks(self):
+        port_a, port_b, port_c = _uuid(), _uuid(), _uuid()
+        self._create_tasks((task.CREATE, port_a),
+                           (task.CREATE, port_b),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.CREATE, port_c),
+                           (task.DELETE, port_b))
+
+        deleted = task.compact_tasks(self.ctx.session,
+                                     watermark=self._get_tasks()[-1].id,
+                                     chunk_size=2)
+
+        # A CREATE is only superseded by a DELETE.
+        self.assertEqual(2, deleted)
+        self.assertEqual([(task.CREATE, port_a),
+                          (task.UPDATE, port_a),
+                          (task.CREATE, port_c),
+                          (task.DELETE, port_b)],
+                         [(t.type, t.resource_id) for t in self._get_tasks()])
+
+    def test_compact_tasks_without_watermark(self):
+        port_a = _uuid()
+        self._create_tasks((task.CREATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a))
+
+        self.assertEqual(0, task.compact_tasks(self.ctx.session))
+        self.assertEqual(3, len(self._get_tasks()))
+
+    def test_compact_tasks_keeps_tasks_above_watermark(self):
+        port_a = _uuid()
+        self._create_tasks((task.CREATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a))
+        watermark = self._get_tasks()[2].id
+
+        deleted = task.compact_tasks(self.ctx.session, watermark=watermark)
+
+        self.assertEqual(1, deleted)
+        self.assertEqual([task.CREATE, task.UPDATE, task.UPDATE],
+                         [t.type for t in self._get_tasks()])
+
+    def test_task_patch(self):
+        old = {'id': 'foo', 'name': 'a', 'a/b': 1, 'gone': True}
+        new = {'id': 'foo', 'name': 'b', 'a/b': 2, 'admin_state_up': False}
+
+        patch = task.make_task_patch(old, new)
+
+        self.assertEqual([{'op': 'remove', 'path': '/gone'},
+                          {'op': 'replace', 'path': '/a~1b', 'value': 2},
+                          {'op': 'add', 'path': '/admin_state_up',
+                           'value': False},
+                          {'op': 'replace', 'path': '/name', 'value': 'b'}],
+                         patch)
+        self.assertEqual(new, task.apply_task_patch(old, patch))
+
+    def test_update_delta(self):
+        cfg.CONF.set_override('task_update_delta', True, 'MIDONET')
+        cfg.CONF.set_override('task_checkpoint_interval', 3, 'MIDONET')
+        port = {'id': _uuid(), 'name': 'port', 'admin_state_up': True}
+        task.create_task(self.ctx, task.CREATE, data_type=task.PORT,
+                         resource_id=port['id'], data=port)
+        states = [port]
+        for i in range(4):
+            port = dict(port, name='port-%d' % i)
+            states.append(port)
+            task.create_task(self.ctx, task.UPDATE, data_type=task.PORT,
+                             resource_id=port['id'], data=port)
+
+        tasks = self._get_tasks()
+        self.assertEqual([task.CREATE, task.PATCH, task.PATCH, task.UPDATE,
+                          task.PATCH], [t.type for t in tasks])
+        self.assertEqual([{'op': 'replace', 'path': '/name',
+                           'value': 'port-0'}], task.get_task_data(tasks[1]))
+        self.assertEqual(states,
+                         [d for _t, d in task.iter_task_data(tasks)])
+        self.assertEqual(port, task.get_resource_data(
+            self.ctx.session, task.PORT, port['id']))
+
+    def test_update_delta_after_delete(self):
+        port_id = _uuid()
+        self._create_tasks((task.CREATE, port_id), (task.DELETE, port_id))
+
+        task.create_task(self.ctx, task.UPDATE, data_type=task.PORT,
+                         resource_id=port_id, data={'id': port_id},
+                         delta=True)
+
+        self.assertEqual(task.UPDATE, self._get_tasks()[-1].type)
+        self.assertIsNone(task.get_resource_data(self.ctx.session, task.PORT,
+                                                 _uuid()))
+
+    def test_patch_without_base(self):
+        port_id = _uuid()
+        task.create_task(self.ctx, task.PATCH, data_type=task.PORT,
+                         resource_id=port_id, data=[])
+
+        self.assertRaises(task.TaskPatchBaseNotFound, list,
+                          task.iter_task_data(self._get_tasks()))
+
+    def test_compact_tasks_keeps_patch_base(self):
+        port_a = _uuid()
+        self._create_tasks((task.CREATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a))
+        task.create_task(self.ctx, task.UPDATE, data_type=task.PORT,
+                         resource_id=port_a, data={'id': port_a, 'x': 1},
+                         delta=True)
+
+        deleted = task.compact_tasks(self.ctx.session,
+                                     watermark=self._get_tasks()[-1].id)
+
+        self.assertEqual(1, deleted)
+        self.assertEqual([task.CREATE, task.UPDATE, task.PATCH],
+                         [t.type for t in self._get_tasks()])
+        self.assertEqual({'id': port_a, 'x': 1}, task.get_resource_data(
+            self.ctx.session, task.PORT, port_a))
+
+    def test_consumer_watermark(self):
+        self.assertIsNone(task.get_consumer_watermark(self.ctx.session, 'c'))
+
+        self.assertEqual(5, task.advance_consumer_watermark(
+            self.ctx.session, 'c', 5))
+        # The watermark never moves backwards.
+        self.assertEqual(5, task.advance_consumer_watermark(
+            self.ctx.session, 'c', 3))
+        self.assertEqual(5, task.get_consumer_watermark(self.ctx.session, 'c'))
+
+        task.delete_consumer(self.ctx.session, 'c')
+        self.assertIsNone(task.get_consumer_watermark(self.ctx.session, 'c'))
+
+    def test_get_journal_lag(self):
+        self._create_tasks(*[(task.CREATE, _uuid()) for _i in range(3)])
+        tasks = self._get_tasks()
+        task.advance_consumer_watermark(self.ctx.session, 'a', tasks[0].id)
+        task.advance_consumer_watermark(self.ctx.session, 'b', tasks[-1].id)
+
+        lags = task.get_journal_lag(self.ctx.session)
+
+        self.assertEqual([('a', 2), ('b', 0)],
+                         [(lag['id'], lag['tasks_behind']) for lag in lags])
+        self.assertEqual(0, lags[1]['oldest_unconsumed_age'])
+
+    def test_compact_tasks_stops_at_consumer_watermark(self):
+        port_a = _uuid()
+        self._create_tasks((task.CREATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a),
+                           (task.UPDATE, port_a))
+        task.advance_consumer_watermark(self.ctx.session, 'a',
+                                        self._get_tasks()[2].id)
+
+        self.assertEqual(1, task.compact_tasks(self.ctx.session))
+
+    def test_get_journal_position(self):
+        self.assertEqual(0, task._get_journal_position(self.ctx.session))
+        self._create_tasks(*[(task.CREATE, _uuid()) for _i in range(4)])
+
+        self.assertEqual(self._get_tasks()[-1].id,
+                         task._get_journal_position(self.ctx.session))
+
+
+class FakeClusterPlugin(task.MidoClusterMixin):
+    """Serves the resources exported by IMPORT from memory."""
+
+    def __init__(self, **resources):
+        self.resources = dict((collection, sorted(resources.get(
+            collection, []), key=lambda r: r['id']))
+            for _data_type, collection in task.IMPORT_RESOURCES)
+        self.markers = []
+
+    def __getattr__(self, name):
+        collection = name[len('get_'):]
+        if not name.startswith('get_') or collection not in self.resources:
+            raise AttributeError(name)
+
+        def get_resources(context, filters=None, fields=None, sorts=None,
+                          limit=None, marker=None, page_reverse=False):
+            self.markers.append(marker)
+            items = [r for r in self.resources[collection]
+                     if marker is None or r['id'] > marker]
+            return items[:limit] if limit else items
+        return get_resources
+
+
+class ClusterImportTestCase(base.BaseTestCase):
+    """Test the resource paging of MidoClusterMixin."""
+
+    def test_iter_resources_pages_by_marker(self):
+        cfg.CONF.set_override('import_page_size', 2, 'MIDONET')
+        nets = [{'id': _uuid()} for _i in range(5)]
+        plugin = FakeClusterPlugin(networks=nets)
+
+        result = list(plugin._iter_resources(None, task.NETWORK, 'networks'))
+
+        self.assertEqual(plugin.resources['networks'], result)
+        self.assertEqual([None, result[1]['id'], result[3]['id']],
+                         plugin.markers)
+
+
+class ClusterOperationTestCase(testlib_api.SqlTestCase):
+    """Test FLUSH and IMPORT of MidoClusterMixin on the test database."""
+
+    def setUp(self):
+        super(ClusterOperationTestCase, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.nets = [{'id': _uuid()} for _i in range(3)]
+        self.ports = [{'id': _uuid()} for _i in range(2)]
+        self.plugin = FakeClusterPlugin(networks=self.nets, ports=self.ports)
+
+    def _get_tasks(self):
+        return self.ctx.session.query(task.Task).order_by(task.Task.id).all()
+
+    def _cluster_op(self, op):
+        self.plugin.create_cluster(self.ctx, {'cluster': {'op': op}})
+
+    def test_flush(self):
+        task.create_task(self.ctx, task.CREATE, data_type=task.NETWORK,
+                         resource_id=_uuid(), data={})
+
+        self._cluster_op(task.OP_FLUSH)
+
+        tasks = self._get_tasks()
+        self.assertEqual([(1, task.FLUSH)], [(t.id, t.type) for t in tasks])
+
+    def test_flush_resets_consumers(self):
+        task.advance_consumer_watermark(self.ctx.session, 'a', 10)
+
+        self._cluster_op(task.OP_FLUSH)
+
+        self.assertEqual(0, task.get_consumer_watermark(self.ctx.session,
+                                                        'a'))
+
+    def test_compact_with_unspecified_watermark(self):
+        cluster = {'op': task.OP_COMPACT,
+                   'watermark': attributes.ATTR_NOT_SPECIFIED}
+        with mock.patch.object(task, 'compact_tasks') as compact_tasks:
+            result = self.plugin.create_cluster(self.ctx,
+                                                {'cluster': cluster})
+
+        compact_tasks.assert_called_once_with(self.ctx.session,
+                                              watermark=None)
+        self.assertIsNone(result['cluster']['watermark'])
+
+    def test_get_clusters(self):
+        task.create_task(self.ctx, task.CREATE, data_type=task.NETWORK,
+                         resource_id=_uuid(), data={})
+        task.advance_consumer_watermark(self.ctx.session, 'a', 0)
+
+        self.assertEqual([{'id': 'a', 'tasks_behind': 1}],
+                         self.plugin.get_clusters(
+                             self.ctx, fields=['id', 'tasks_behind']))
+        self.assertEqual(0, self.plugin.get_cluster(self.ctx, 'a')[
+            'watermark'])
+        self.assertRaises(task.TaskConsumerNotFound,
+                          self.plugin.get_cluster, self.ctx, 'b')
+
+    def _test_import(self, mode):
+        cfg.CONF.set_override('import_mode', mode, 'MIDONET')
+        self._cluster_op(task.OP_IMPORT)
+
+        tasks = self._get_tasks()
+        self.assertEqual(
+            [(task.NETWORK, n['id']) for n in self.plugin.resources[
+                'networks']] +
+            [(task.PORT, p['id']) for p in self.plugin.resources['ports']],
+            [(t.data_type, t.resource_id) for t in tasks])
+
+    def test_import_locked(self):
+        self._test_import(task.IMPORT_MODE_LOCK)
+
+    def test_import_snapshot(self):
+        self._test_import(task.IMPORT_MODE_SNAPSHOT)
+
+    def test_import_snapshot_replays_concurrent_writes(self):
+        cfg.CONF.set_override('import_mode', task.IMPORT_MODE_SNAPSHOT,
+                              'MIDONET')
+        spool_topology = self.plugin._spool_topology
+        net_id = self.nets[0]['id']
+        port_id = _uuid()
+
+        def write_during_snapshot(ctx, snapshot=False):
+            # Another request writes while the snapshot is read.
+            task.create_task(context.get_admin_context(), task.CREATE,
+                             data_type=task.PORT, resource_id=port_id,
+                             data={'id': port_id, 'network_id': net_id})
+            return spool_topology(ctx, snapshot=snapshot)
+
+        with mock.patch.object(self.plugin, '_spool_topology',
+                               side_effect=write_during_snapshot):
+            self._cluster_op(task.OP_IMPORT)
+
+        tasks = self._get_tasks()
+        self.assertEqual(1 + len(self.nets) + len(self.ports) + 1,
+                         len(tasks))
+        written, replayed = tasks[0], tasks[-1]
+        self.assertEqual((task.PORT, port_id, net_id),
+                         (replayed.data_type, replayed.resource_id,
+                          replayed.parent_id))
+        self.assertEqual(written.transaction_id, replayed.transaction_id)
+        self.assertIsNone(replayed.dispatch_status)
+
+    def test_import_with_workers(self):
+        cfg.CONF.set_override('import_workers', 3, 'MIDONET')
+        self._test_import(task.IMPORT_MODE_LOCK)
@@ -16,13 +16,21 @@
 
 import abc
 
+import eventlet
+import mock
+from oslo_config import cfg
+from oslo_db import exception as db_exc
 import six
 
 from neutron.api.v2 import base as api_base
+from neutron import context
 from neutron.openstack.common import uuidutils
 from neutron.tests import base
+from neutron.tests.unit import testlib_api
 
+from midonet.neutron.common import cache
 from midonet.neutron.common import util
+from midonet.neutron.db import task
 
 CREATE = api_base.Controller.CREATE
 DELETE = api_base.Controller.DELETE
@@ -161,25 +169,244 @@ class UtilTestCase(base.BaseTestCase):
         self.assertIn('get_foos', FooPlugin.__dict__.keys())
         self.assertNotIn('get_foos', FooPlugin.__abstractmethods__)
 
-    def test_retry_on_error(self):
-        retry_num = 2
+    def test_generated_methods_are_cached(self):
+        calls = []
 
-        class TestClass(object):
+        @util.generate_methods(LIST, SHOW, UPDATE)
+        class FooPlugin(object):
+            """Foo plugin description."""
+            CACHE_TTL = 10
+            CLIENT_METHODS = {UPDATE: 'update_foo'}
+
+            def get_foo(self, context, id, fields=None):
+                calls.append(id)
+                return {'id': id}
+
+        self.addCleanup(cache.API_CACHE.clear)
+        foo_plugin = FooPlugin()
+        foo_plugin.api_cli = mock.Mock()
+        foo_id = _uuid()
+        foo_plugin.get_foo(None, foo_id)
+        foo_plugin.get_foo(None, foo_id)
+        self.assertEqual([foo_id], calls)
+
+        foo_plugin.update_foo(None, foo_id, {'foo': {}})
+        foo_plugin.get_foo(None, foo_id)
+        self.assertEqual([foo_id, foo_id], calls)
+
+    def test_generated_lists_push_filters_down(self):
+        calls = []
+
+        @util.generate_methods(LIST, SHOW)
+        class FooPlugin(object):
+            """Foo plugin description."""
+            FILTER_PARAMS = {'tenant_id': 'tenant'}
+
+            def get_foos(self, context, filters=None, fields=None):
+                calls.append((filters, fields))
+                return [{'id': 'a', 'name': 'x'}, {'id': 'b', 'name': 'y'}]
+
+        foo_plugin = FooPlugin()
+        foos = foo_plugin.get_foos(None, filters={'tenant_id': ['t'],
+                                                  'name': ['y']},
+                                   fields=['id'])
+        self.assertEqual([{'id': 'b'}], foos)
+        self.assertEqual([({'tenant': 't'}, ['id', 'name'])], calls)
+
+    def test_generated_methods_expand_sub_resources(self):
+        calls = []
+
+        @util.generate_methods(LIST)
+        class BarPlugin(object):
+            """Bar plugin description."""
+            ALIAS = 'bar'
+            PARENT = 'foo'
+            CLIENT_METHODS = {LIST: 'get_bars'}
+
+        @util.generate_methods(LIST, SHOW)
+        class FooPlugin(BarPlugin):
+            """Foo plugin description."""
+            EXPANDED_FIELDS = {'bars': ('get_foo_bars', 'foo_id')}
+
+            def get_foos(self, context, filters=None, fields=None):
+                calls.append(fields)
+                return [{'id': 'a', 'version': 1}]
+
+            def get_foo(self, context, id, fields=None):
+                calls.append(fields)
+                return {'id': id, 'version': 1}
+
+        foo_plugin = FooPlugin()
+        foo_plugin.api_cli = mock.Mock()
+        foo_plugin.api_cli.get_bars.return_value = []
+        self.assertEqual([{'id': 'a', 'version': 1}],
+                         foo_plugin.get_foos(None))
+        self.assertEqual([None], calls)
+
+        # The generated list of bars takes the ID of their foo.
+        self.assertEqual({'id': 'a', 'bars': []},
+                         foo_plugin.get_foo(None, 'a',
+                                            fields=['id', 'bars']))
+        self.assertEqual([{'id': 'a', 'bars': []}],
+                         foo_plugin.get_foos(None, fields=['id', 'bars']))
+        self.assertEqual([None, ['id'], ['id']], calls)
+        self.assertEqual([], foo_plugin.get_foo_bars(
+            None, foo_id='a', filters=None, fields=None))
+        foo_plugin.api_cli.get_bars.assert_called_with(filters={},
+                                                       fields=None)
+
+    def test_generated_methods_call_client(self):
+
+        @util.generate_methods(LIST, SHOW, CREATE, UPDATE, DELETE)
+        class FooPlugin(object):
+            """Foo plugin description."""
+            CLIENT_METHODS = {LIST: 'get_foos', SHOW: 'get_foo',
+                              CREATE: 'create_foo', UPDATE: 'update_foo',
+                              DELETE: 'delete_foo'}
 
-            def __init__(self):
-                self.attempt = 0
+        foo_plugin = FooPlugin()
+        api_cli = foo_plugin.api_cli = mock.Mock()
+        api_cli.get_foos.return_value = [{'id': 'a'}, {'id': 'b'}]
+        api_cli.get_foo.return_value = {'id': 'a'}
+
+        self.assertEqual([{'id': 'b'}],
+                         foo_plugin.get_foos(None, filters={'id': ['b']}))
+        api_cli.get_foos.assert_called_once_with(filters={}, fields=None)
+        self.assertEqual({'id': 'a'}, foo_plugin.get_foo(None, 'a'))
+        api_cli.get_foo.assert_called_once_with('a', fields=None)
+        # The API controllers pass the request body by the resource name.
+        foo_plugin.create_foo(None, foo={'foo': {'name': 'x'}})
+        api_cli.create_foo.assert_called_once_with({'name': 'x'})
+        foo_plugin.update_foo(None, 'a', foo={'foo': {'name': 'y'}})
+        api_cli.update_foo.assert_called_once_with({'id': 'a', 'name': 'y'})
+        foo_plugin.delete_foo(None, 'a')
+        api_cli.delete_foo.assert_called_once_with('a')
+
+    def test_generated_stubs_are_not_wrapped(self):
+
+        @util.generate_methods(LIST, SHOW)
+        class FooPlugin(object):
+            """Foo plugin description."""
+            CACHE_TTL = 10
+
+        foo_plugin = FooPlugin()
+        self.assertIsNone(foo_plugin.get_foos(None, filters={'id': ['a']}))
+        self.assertIsNone(foo_plugin.get_foo(None, 'a'))
 
-            @util.retry_on_error(retry_num, 1, ValueError)
-            def test(self):
-                self.attempt += 1
-                raise ValueError
 
-        test_obj = TestClass()
-        try:
-            test_obj.test()
-            # should never reach here
-            self.assertTrue(False)
-        except ValueError:
-            pass
+class RetryOnDbErrorTestCase(base.BaseTestCase):
+    """Test for midonet.neutron.common.util.retry_on_db_error."""
 
-        self.assertEqual(retry_num, test_obj.attempt)
+    def setUp(self):
+        super(RetryOnDbErrorTestCase, self).setUp()
+        cfg.CONF.set_override('db_retry_attempts', 3, 'MIDONET')
+        self.sleep = mock.patch('eventlet.sleep').start()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(util.DB_RETRY_COUNTS.clear)
+        self.attempts = 0
+
+    def _make_method(self, errors):
+        @util.retry_on_db_error
+        def method():
+            self.attempts += 1
+            if errors:
+                raise errors.pop(0)
+            return self.attempts
+        return method
+
+    def test_retries_deadlocks(self):
+        method = self._make_method([db_exc.DBDeadlock(),
+                                    db_exc.DBConnectionError()])
+
+        self.assertEqual(3, method())
+        self.assertEqual(2, self.sleep.call_count)
+        self.assertEqual({'method': {'retries': 2, 'failures': 0}},
+                         util.get_db_retry_counts())
+
+    def test_gives_up(self):
+        method = self._make_method([db_exc.DBDeadlock()] * 5)
+
+        self.assertRaises(db_exc.DBDeadlock, method)
+        self.assertEqual(3, self.attempts)
+        self.assertEqual({'retries': 2, 'failures': 1},
+                         util.get_db_retry_counts()['method'])
+
+    def test_other_errors_are_not_retried(self):
+        method = self._make_method([db_exc.DBDuplicateEntry()])
+
+        self.assertRaises(db_exc.DBDuplicateEntry, method)
+        self.assertEqual(1, self.attempts)
+        self.assertFalse(self.sleep.called)
+
+    def test_backoff_is_bounded(self):
+        cfg.CONF.set_override('db_retry_attempts', 10, 'MIDONET')
+        cfg.CONF.set_override('db_retry_max_delay', 0.3, 'MIDONET')
+        method = self._make_method([db_exc.DBDeadlock()] * 9)
+
+        method()
+        for (delay,), kwargs in self.sleep.call_args_list:
+            self.assertTrue(0 <= delay <= 0.3)
+
+    def test_nested_transaction_is_not_retried(self):
+        ctx = mock.Mock()
+        ctx.session.is_active = True
+
+        @util.retry_on_db_error
+        def method(plugin, context):
+            self.attempts += 1
+            raise db_exc.DBDeadlock()
+
+        self.assertRaises(db_exc.DBDeadlock, method, None, ctx)
+        self.assertEqual(1, self.attempts)
+        self.assertFalse(self.sleep.called)
+
+        ctx.session.is_active = False
+        self.assertRaises(db_exc.DBDeadlock, method, None, ctx)
+        self.assertEqual(4, self.attempts)
+
+
+class RetryOnDbErrorStressTestCase(testlib_api.SqlTestCase):
+    """Runs many deadlocking transactions concurrently on the test DB."""
+
+    def setUp(self):
+        super(RetryOnDbErrorStressTestCase, self).setUp()
+        cfg.CONF.set_override('db_retry_attempts', 50, 'MIDONET')
+        cfg.CONF.set_override('db_retry_base_delay', 0.001, 'MIDONET')
+        cfg.CONF.set_override('db_retry_max_delay', 0.01, 'MIDONET')
+        self.addCleanup(util.DB_RETRY_COUNTS.clear)
+
+    def test_concurrent_deadlocks(self):
+        # Transactions holding locks, oldest first.  Like the DB deadlock
+        # detector, every transaction that finds an older one holding locks
+        # is rolled back.
+        holders = []
+        deadlocks = []
+
+        @util.retry_on_db_error
+        def create_port_task(ctx, port_id):
+            with ctx.session.begin(subtransactions=True):
+                holders.append(port_id)
+                try:
+                    eventlet.sleep(0)
+                    if holders[0] != port_id:
+                        deadlocks.append(port_id)
+                        raise db_exc.DBDeadlock()
+                    task.create_task(ctx, task.CREATE, data_type=task.PORT,
+                                     resource_id=port_id,
+                                     data={'id': port_id})
+                finally:
+                    holders.remove(port_id)
+
+        port_ids = [_uuid() for i in range(20)]
+        pool = eventlet.GreenPool()
+        for port_id in port_ids:
+            pool.spawn(create_port_task, context.get_admin_context(),
+                       port_id)
+        pool.waitall()
+
+        tasks = context.get_admin_context().session.query(task.Task).all()
+        self.assertEqual(sorted(port_ids),
+                         sorted(t.resource_id for t in tasks))
+        self.assertTrue(deadlocks)
+        self.assertEqual({'retries': len(deadlocks), 'failures': 0},
+                         util.get_db_retry_counts()['create_port_task'])
@@ -0,0 +1,94 @@
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Helpers shared by the networking-midonet micro benchmarks.
+
+The benchmarks run against a local SQLite database and do not need a
+running Neutron server or MidoNet API.
+"""
+from __future__ import print_function
+
+import contextlib
+import time
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+
+class FakeContext(object):
+    """The subset of neutron.context.Context used by the task journal."""
+
+    def __init__(self, session, tenant=None):
+        self.session = session
+        self.tenant = tenant or str(uuid.uuid4())
+        self.tenant_id = self.tenant
+        self.request_id = 'req-%s' % uuid.uuid4()
+
+
+def make_engine(path=None):
+    url = 'sqlite://' if path is None else 'sqlite:///%s' % path
+    return sa.create_engine(url)
+
+
+def make_session(engine):
+    # Neutron sessions are in autocommit mode and open transactions
+    # explicitly with session.begin().
+    return orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+def make_port(index, network_id=None):
+    """Return a port dictionary similar to what Neutron hands the plugin."""
+    port_id = str(uuid.uuid4())
+    return {
+        'id': port_id,
+        'name': 'port-%d' % index,
+        'network_id': network_id or str(uuid.uuid4()),
+        'tenant_id': str(uuid.uuid4()),
+        'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+            (index >> 16) & 0xff, (index >> 8) & 0xff, index & 0xff),
+        'admin_state_up': True,
+        'status': 'ACTIVE',
+        'device_id': str(uuid.uuid4()),
+        'device_owner': 'compute:nova',
+        'fixed_ips': [{'subnet_id': str(uuid.uuid4()),
+                       'ip_address': '10.%d.%d.%d' % (
+                           (index >> 16) & 0xff, (index >> 8) & 0xff,
+                           index & 0xff)}],
+        'security_groups': [str(uuid.uuid4()), str(uuid.uuid4())],
+        'allowed_address_pairs': [],
+        'extra_dhcp_opts': [{'opt_name': 'bootfile-name',
+                             'opt_value': 'pxelinux.0'},
+                            {'opt_name': 'tftp-server',
+                             'opt_value': '10.0.0.1'}],
+        'binding:host_id': 'compute-%04d.example.com' % (index % 1000),
+        'binding:vif_type': 'midonet',
+        'binding:vnic_type': 'normal',
+        'binding:vif_details': {'port_filter': True},
+        'binding:profile': {},
+    }
+
+
+@contextlib.contextmanager
+def timed(label, count=None):
+    start = time.time()
+    yield
+    elapsed = time.time() - start
+    if count:
+        print('%-40s %10.3fs %12.0f/s' % (label, elapsed,
+                                          count / elapsed if elapsed else 0))
+    else:
+        print('%-40s %10.3fs' % (label, elapsed))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Run a full cluster rebuild (FLUSH followed by IMPORT) of a synthetic
+topology on SQLite and report wall time and peak memory.
+
+    python tools/benchmarks/cluster_rebuild.py [--resources N]
+        [--mode lock|snapshot] [--page-size N] [--workers N] [--db PATH]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from oslo_config import cfg
+
+import bench_utils
+from midonet.neutron.db import task
+
+# Share of each resource type in the synthetic topology.
+TOPOLOGY = {'networks': 0.05,
+            'subnets': 0.05,
+            'ports': 0.60,
+            'routers': 0.02,
+            'floatingips': 0.05,
+            'security_groups': 0.03,
+            'security_group_rules': 0.15,
+            'pools': 0.01,
+            'vips': 0.01,
+            'health_monitors': 0.01,
+            'members': 0.02}
+
+
+class SyntheticPlugin(task.MidoClusterMixin):
+    """Generates the resources on the fly, like paged DB reads would."""
+
+    def __init__(self, total):
+        self.counts = dict((collection, int(total * share))
+                           for collection, share in TOPOLOGY.items())
+
+    def _get_import_context(self, context):
+        return bench_utils.FakeContext(
+            bench_utils.make_session(context.session.get_bind()))
+
+    def _make_resource(self, collection, index):
+        if collection == 'ports':
+            port = bench_utils.make_port(index)
+            port['id'] = '%s-%012d' % (collection, index)
+            return port
+        return {'id': '%s-%012d' % (collection, index),
+                'name': '%s %d' % (collection, index),
+                'tenant_id': 'tenant-%d' % (index % 1000),
+                'admin_state_up': True,
+                'status': 'ACTIVE'}
+
+    def __getattr__(self, name):
+        collection = name[len('get_'):]
+        if not name.startswith('get_') or collection not in TOPOLOGY:
+            raise AttributeError(name)
+
+        def get_resources(context, filters=None, fields=None, sorts=None,
+                          limit=None, marker=None, page_reverse=False):
+            start = 0 if marker is None else int(marker.split('-')[-1]) + 1
+            end = self.counts[collection]
+            if limit:
+                end = min(end, start + limit)
+            return [self._make_resource(collection, i)
+                    for i in range(start, end)]
+        return get_resources
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--resources', type=int, default=100000)
+    parser.add_argument('--mode', default=task.IMPORT_MODE_LOCK,
+                        choices=[task.IMPORT_MODE_LOCK,
+                                 task.IMPORT_MODE_SNAPSHOT])
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--db', help='SQLite file (default: a temp file)')
+    args = parser.parse_args()
+
+    cfg.CONF.set_override('import_mode', args.mode, 'MIDONET')
+    cfg.CONF.set_override('import_page_size', args.page_size, 'MIDONET')
+    cfg.CONF.set_override('import_workers', args.workers, 'MIDONET')
+
+    path = args.db or tempfile.mktemp(suffix='.sqlite')
+    engine = bench_utils.make_engine(path)
+    try:
+        task.Task.__table__.create(engine, checkfirst=True)
+        context = bench_utils.FakeContext(bench_utils.make_session(engine))
+        plugin = SyntheticPlugin(args.resources)
+
+        start = time.time()
+        plugin.create_cluster(context, {'cluster': {'op': task.OP_FLUSH}})
+        plugin.create_cluster(context, {'cluster': {'op': task.OP_IMPORT}})
+        elapsed = time.time() - start
+
+        rows = context.session.query(task.Task).count()
+        # ru_maxrss is in kilobytes on Linux.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        print('mode=%s workers=%d resources=%d journal rows=%d' % (
+            args.mode, args.workers, args.resources, rows))
+        print('wall time: %.2fs (%.0f resources/s)' % (
+            elapsed, args.resources / elapsed))
+        print('peak RSS: %.1f MiB' % peak)
+    finally:
+        if not args.db:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure how the outbox dispatch throughput scales with the number of
+workers, against a fake MidoNet API answering after a fixed latency.  The
+order of the calls made for each resource is checked at the end of every
+run; the updates superseded within a batch may be skipped.
+
+    python tools/benchmarks/journal_dispatch.py [--tasks N]
+        [--resources N] [--workers 1,2,4,8] [--latency SECONDS]
+        [--batch-size N]
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import tempfile
+
+import eventlet
+from oslo_config import cfg
+
+import bench_utils
+from midonet.neutron.db import task
+from midonet.neutron import dispatcher
+
+
+class FakeMidonetApi(object):
+    """Records the calls made for each resource after a fixed latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = collections.defaultdict(list)
+
+    def __getattr__(self, name):
+        action = name.split('_', 1)[0]
+
+        def call(*args):
+            eventlet.sleep(self.latency)
+            resource_id = args[0] if action != 'create' else args[0]['id']
+            self.calls[resource_id].append(action)
+        return call
+
+
+def fill_journal(context, tasks, resources):
+    ids = ['port-%06d' % i for i in range(resources)]
+    expected = collections.defaultdict(list)
+    with task.batch(context):
+        for index in range(tasks):
+            res_id = ids[index % resources]
+            type = task.CREATE if index < resources else task.UPDATE
+            task.create_task(context, type, data_type=task.PORT,
+                             resource_id=res_id,
+                             data={'id': res_id, 'name': 'v%d' % index})
+            expected[res_id].append(type.lower())
+    return expected
+
+
+def run(engine, api, workers, total):
+    task_dispatcher = dispatcher.TaskDispatcher(api)
+    done = [0]
+
+    def worker(index):
+        context = bench_utils.FakeContext(bench_utils.make_session(engine))
+        owner = 'bench:%d' % index
+        while done[0] < total:
+            dispatched = task_dispatcher.dispatch_pending(context, owner)
+            done[0] += dispatched
+            if not dispatched:
+                eventlet.sleep(0.001)
+
+    pool = eventlet.GreenPool(workers)
+    for index in range(workers):
+        pool.spawn(worker, index)
+    pool.waitall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--resources', type=int, default=200)
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Seconds taken by each fake API call')
+    parser.add_argument('--batch-size', type=int, default=20)
+    args = parser.parse_args()
+
+    cfg.CONF.set_override('dispatch_mode', task.DISPATCH_OUTBOX, 'MIDONET')
+    cfg.CONF.set_override('dispatch_batch_size', args.batch_size, 'MIDONET')
+
+    for workers in [int(w) for w in args.workers.split(',')]:
+        path = tempfile.mktemp(suffix='.sqlite')
+        engine = bench_utils.make_engine(path)
+        try:
+            task.Task.__table__.create(engine)
+            task.ResourceRevision.__table__.create(engine)
+            context = bench_utils.FakeContext(
+                bench_utils.make_session(engine))
+            expected = fill_journal(context, args.tasks, args.resources)
+
+            api = FakeMidonetApi(args.latency)
+            with bench_utils.timed('dispatch, %d workers' % workers,
+                                   args.tasks):
+                run(engine, api, workers, args.tasks)
+            assert sorted(api.calls) == sorted(expected)
+            for res_id, calls in api.calls.items():
+                assert calls[0] == 'create', 'calls made out of order'
+                assert calls[-1] == expected[res_id][-1], 'last call missed'
+                assert calls[1:] == ['update'] * (len(calls) - 1)
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the stored size and the encode/decode cost of port payloads for
+every task data encoding registered in midonet.neutron.db.task.
+
+    python tools/benchmarks/task_data_codec.py [--rows N]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import bench_utils
+from midonet.neutron.db import task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    ports = [bench_utils.make_port(i) for i in range(args.rows)]
+    print('%-10s %14s %14s %14s' % ('encoding', 'bytes/row',
+                                    'encode us/row', 'decode us/row'))
+    for encoding in (task.ENCODING_JSON, task.ENCODING_ZLIB,
+                     task.ENCODING_MSGPACK):
+        start = time.time()
+        values = [task.encode_task_data(p, encoding)[1] for p in ports]
+        encode_time = time.time() - start
+
+        start = time.time()
+        for value in values:
+            task.decode_task_data(value, encoding)
+        decode_time = time.time() - start
+
+        size = sum(len(v) for v in values)
+        print('%-10s %14.1f %14.2f %14.2f' % (
+            encoding, float(size) / args.rows,
+            encode_time * 1e6 / args.rows, decode_time * 1e6 / args.rows))
+
+
+if __name__ == '__main__':
+    main()
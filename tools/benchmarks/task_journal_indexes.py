@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time the journal consumer queries against a synthetic midonet_tasks table
+in SQLite, first without and then with the secondary indexes.
+
+    python tools/benchmarks/task_journal_indexes.py [--rows N] [--db PATH]
+"""
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import uuid
+
+import sqlalchemy as sa
+
+import bench_utils
+from midonet.neutron.db import task
+
+DATA_TYPES = [task.NETWORK, task.SUBNET, task.PORT, task.ROUTER,
+              task.SECURITY_GROUP_RULE]
+
+
+def populate(engine, rows, resources):
+    resource_ids = [str(uuid.uuid4()) for _i in range(resources)]
+    created_at = datetime.datetime.utcnow() - datetime.timedelta(days=90)
+    tasks = task.Task.__table__
+    chunk = []
+    transaction_id = None
+    for i in range(rows):
+        if i % 3 == 0:
+            transaction_id = 'req-%s' % uuid.uuid4()
+        res_index = random.randrange(resources)
+        chunk.append({'type': task.UPDATE,
+                      'tenant_id': None,
+                      'data_type': DATA_TYPES[res_index % len(DATA_TYPES)],
+                      'data': '{}',
+                      'encoding': task.ENCODING_JSON,
+                      'resource_id': resource_ids[res_index],
+                      'transaction_id': transaction_id,
+                      'created_at': created_at + datetime.timedelta(
+                          seconds=i)})
+        if len(chunk) == 10000:
+            engine.execute(tasks.insert(), chunk)
+            chunk = []
+    if chunk:
+        engine.execute(tasks.insert(), chunk)
+    return resource_ids
+
+
+def run_queries(engine, rows, resource_ids, samples):
+    tasks = task.Task.__table__
+    tail_id = rows - 1000
+    with bench_utils.timed('  tail by id (x%d)' % samples):
+        for _i in range(samples):
+            engine.execute(sa.select([tasks]).where(
+                tasks.c.id > tail_id).order_by(tasks.c.id).limit(1000)
+            ).fetchall()
+
+    with bench_utils.timed('  history of one resource (x%d)' % samples):
+        for _i in range(samples):
+            res_id = random.choice(resource_ids)
+            engine.execute(sa.select([tasks]).where(
+                tasks.c.resource_id == res_id).order_by(tasks.c.id)
+            ).fetchall()
+
+    transaction_ids = [r[0] for r in engine.execute(
+        sa.select([tasks.c.transaction_id]).where(
+            tasks.c.id % 997 == 0).limit(samples))]
+    with bench_utils.timed('  tasks of one transaction (x%d)' %
+                           len(transaction_ids)):
+        for transaction_id in transaction_ids:
+            engine.execute(sa.select([tasks]).where(
+                tasks.c.transaction_id == transaction_id).order_by(
+                tasks.c.id)).fetchall()
+
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=30)
+    with bench_utils.timed('  oldest task since a date (x%d)' % samples):
+        for _i in range(samples):
+            engine.execute(sa.select([sa.func.min(tasks.c.created_at)]).where(
+                tasks.c.created_at > since)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--resources', type=int, default=200000)
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--db', help='SQLite file (default: a temp file)')
+    args = parser.parse_args()
+
+    path = args.db or tempfile.mktemp(suffix='.sqlite')
+    engine = bench_utils.make_engine(path)
+    try:
+        task.Task.__table__.create(engine)
+        indexes = list(task.Task.__table__.indexes)
+        for index in indexes:
+            index.drop(engine)
+
+        with bench_utils.timed('populate %d rows' % args.rows, args.rows):
+            resource_ids = populate(engine, args.rows, args.resources)
+
+        print('without secondary indexes:')
+        run_queries(engine, args.rows, resource_ids, args.samples)
+
+        with bench_utils.timed('create indexes'):
+            for index in indexes:
+                index.create(engine)
+
+        print('with secondary indexes:')
+        run_queries(engine, args.rows, resource_ids, args.samples)
+    finally:
+        if not args.db:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Copyright (C) 2015 Midokura SARL.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare task journal write throughput of one ORM object per task against
+the batched writer in midonet.neutron.db.task.
+
+    python tools/benchmarks/task_journal_insert.py [--rows N]
+"""
+from __future__ import print_function
+
+import argparse
+
+from oslo_serialization import jsonutils
+
+import bench_utils
+from midonet.neutron.db import task
+
+
+def orm_per_row(context, ports):
+    with context.session.begin():
+        for port in ports:
+            context.session.add(task.Task(
+                type=task.CREATE, tenant_id=context.tenant,
+                data_type=task.PORT, data=jsonutils.dumps(port),
+                resource_id=port['id'], transaction_id=context.request_id))
+
+
+def batched(context, ports):
+    with task.batch(context):
+        for port in ports:
+            task.create_task(context, task.CREATE, data_type=task.PORT,
+                             resource_id=port['id'], data=port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    ports = [bench_utils.make_port(i) for i in range(args.rows)]
+    for label, func in (('ORM add() per task', orm_per_row),
+                        ('batched executemany insert', batched)):
+        engine = bench_utils.make_engine()
+        task.Task.__table__.create(engine)
+        task.ResourceRevision.__table__.create(engine)
+        context = bench_utils.FakeContext(bench_utils.make_session(engine))
+        with bench_utils.timed(label, args.rows):
+            func(context, ports)
+
+
+if __name__ == '__main__':
+    main()